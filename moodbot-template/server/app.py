@@ -1,23 +1,53 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from openai import OpenAI
+from llm_client import get_client, pool_stats, response_started_at, start_upstream_timer
+from reply_cache import create_reply_cache
+from conversation import create_conversation_memory
+from ledger import Ledger, STARTING_COINS
+from game_log import LEADERBOARD_MAX, create_game_log
+from commands import dispatch, game_rng, run_batch
+from replies import compact, encode_reply
+from llm_guard import Rejected, UpstreamGuard, prompt_key
+from model_router import ModelRouter
+import metrics
 import os
-import random
-import datetime
-import re
+import json
+import threading
+import time
 
 # Set your OpenRouter API key - Replace with your actual API key
-OPENROUTER_API_KEY = "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"
+OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "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")
+# Base URL of the OpenAI-compatible upstream (point this at fake_upstream.py for offline benchmarks)
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 
 # Initialize the Flask application
 app = Flask(__name__)
 # Enable Cross-Origin Resource Sharing (CORS) for the Flask app
 CORS(app)
 
-# In-memory storage for user data (for demonstration purposes only - will be lost on server restart)
-users = {
-    "user1": {"coins": 100, "last_daily_reward": None, "blackjack": None}  # Initialize blackjack state to None
-}
+# Append-only log of game outcomes and the leaderboards built from it (both None if MOODBOT_GAME_LOG is empty)
+game_log, game_stats = create_game_log(STARTING_COINS)
+
+# Persistent storage for user balances, daily rewards and blackjack games (shared by all workers)
+ledger = Ledger(event_log=game_log)
+
+# User ID used when the client doesn't send one
+DEFAULT_USER_ID = "user1"
+
+# Most commands accepted in one /chat/batch request
+BATCH_MAX_INPUTS = 50
+
+# Opt-in cache of chatbot replies (None unless MOODBOT_REPLY_CACHE is set)
+reply_cache = create_reply_cache()
+
+# Recent chat turns per player and mode, sent back to the model (None if MOODBOT_MEMORY_TOKENS=0)
+memory = create_conversation_memory()
+
+# Single-flight, rate limit, bounded queue and circuit breaker for every LLM call (see llm_guard.py)
+llm_guard = UpstreamGuard()
+
+# Picks the model (and reply length) for each chat from the LLM_MODELS pool, with fallback and hedging (see model_router.py)
+llm_router = ModelRouter()
 
 # Dictionary mapping mode names to their corresponding instructions for the chatbot
 MODES = {
@@ -29,22 +59,107 @@ MODES = {
     "sarcastic": "Respond with dry, witty sarcasm. Keep it clever, and don't hold back on the playful jabs, but always in a fun way. ",
 }
 
+# System prompt shared by every LLM call
+SYSTEM_PROMPT = "You are a chatbot that responds with roasts, compliments, jokes, or other moods based on user settings. Use plenty of emojis and energetic language! 🌟✨"
+
+# System message for each mode, built once: the shared prompt followed by the mode's instructions
+MODE_SYSTEM_MESSAGES = {
+    name: {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{instructions.strip()}"}
+    for name, instructions in MODES.items()
+}
+
+# Custom headers for OpenRouter attribution
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "http://localhost:3000",  # Replace with your actual frontend URL
+    "X-Title": "MoodBot"  # Replace with the name of your application
+}
+
+
+def resolve_user_id(data, header=None):
+    # Take the player's ID from the request body or the X-User-Id header
+    user_id = data.get('user_id') or header or DEFAULT_USER_ID
+    return str(user_id)[:64]
+
+
+def resolve_mode(requested):
+    # Fall back to 'normal' when the mode is missing or unknown
+    return requested if requested in MODES else "normal"
+
+
+def build_messages(mode_name, input_text, history=()):
+    # Construct the prompt for the OpenAI model: the mode's system message, the remembered
+    # conversation (already trimmed to its token budget) and the new user input
+    return [MODE_SYSTEM_MESSAGES[mode_name], *history, {"role": "user", "content": input_text}]
+
+
+def conversation_history(user_id, mode_name):
+    return memory.context(user_id, mode_name) if memory is not None else ()
+
+
+def remember_turn(user_id, mode_name, input_text, reply):
+    if memory is not None and reply:
+        memory.record(user_id, mode_name, input_text, reply)
+
+
+def llm_error_message(error):
+    # Message shown to the user when the LLM call fails
+    return f"⚠️ Error: {str(error)} - Our magical bot is taking a quick nap! Try again soon! 💤"
+
+
+def napping_message():
+    # Message shown when the LLM call is refused up front (upstream struggling or too busy)
+    return "💤 MoodBot is napping - too many chats at once! Give it a few seconds and try again! 😴"
+
+
+def game_reply(payload, compact_reply=False):
+    # Game command replies go through the lean encoder in replies.py rather than jsonify;
+    # compact replies leave the text to the client
+    if compact_reply:
+        payload = compact(payload)
+    return Response(encode_reply(payload), mimetype="application/json")
+
+
+def napping_response(user_id):
+    # Fast-fail reply with 503 and Retry-After, same JSON shape as every other /chat reply
+    return jsonify({
+        "response": napping_message(),
+        "new_balance": ledger.balance(user_id)
+    }), 503, {"Retry-After": str(llm_guard.retry_after())}
+
+
+# ----------------- REQUEST METRICS -----------------
+
+@app.before_request
+def start_request_metrics():
+    # Views label the request (g.metric_command / g.metric_mode) and mark their stages on g.timer
+    g.timer = metrics.StageTimer()
+    g.metric_command = ""
+    g.metric_mode = ""
+    g.profiler = None
+    if metrics.PROFILING_ENABLED and request.headers.get('X-Profile') == '1':
+        g.profiler = metrics.SamplingProfiler(threading.get_ident()).start()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    timer, command, mode, profiler = g.timer, g.metric_command, g.metric_mode, g.profiler
+    # Whatever ran after the view's last stage (building the JSON response) counts as serialize
+    if timer.stages:
+        timer.mark("serialize")
+    profile_file = metrics.profile_path(route) if profiler else None
+    if profile_file:
+        response.headers['X-Profile-File'] = profile_file
+
+    # Recorded once the body has been sent, so streamed replies are timed to the last token
+    def finish():
+        metrics.record_request(route, response.status_code, timer.finish(route), command, mode)
+        if profiler:
+            metrics.write_profile(profile_file, profiler.stop())
+
+    response.call_on_close(finish)
+    return response
 
-def calculate_blackjack_value(cards):
-    value = 0
-    ace_count = 0
-    for card in cards:
-        if 1 < card < 11:
-            value += card
-        elif card > 10:
-            value += 10
-        elif card == 1:
-            ace_count += 1
-            value += 11
-    while value > 21 and ace_count > 0:
-        value -= 10
-        ace_count -= 1
-    return value
 
 # Define the chat endpoint that handles POST requests
 @app.route('/chat', methods=['POST'])
@@ -54,357 +169,329 @@ def chat():
     # Extract the user's input text, defaulting to an empty string if not provided
     input_text = data.get('input', '')
     # Get the selected mode for the chatbot's response, defaulting to 'normal' if not provided or invalid
-    mode = MODES.get(data.get('mode', 'normal'), MODES['normal'])
+    mode_name = resolve_mode(data.get('mode', 'normal'))
     
     # REPLACE WITH SOMETHING LIKE:
     task = ""  # Or remove references to task completely
     
-    # Hardcoded user ID for this simple example - in a real application, this would be dynamic
-    user_id = "user1"
-    # Get the current coin balance from the 'users' dictionary
-    current_coins = users[user_id]["coins"]
+    # Identify the player making the request
+    user_id = resolve_user_id(data, request.headers.get('X-User-Id'))
+    g.timer.mark("parse")
 
     # ----------------- COIN-ACTIVITY HANDLING -----------------
 
-    if input_text == "!daily":
-        current_date = datetime.datetime.now().date()
-        last_reward_date = users[user_id]["last_daily_reward"]
-        if last_reward_date == current_date:
-            return jsonify({
-                "response": "⏰ You've already collected your daily treasure chest today! Come back tomorrow for more riches! ⏰",
-                "new_balance": users[user_id]["coins"]
-            })
-        users[user_id]["coins"] += 50
-        users[user_id]["last_daily_reward"] = current_date
-        return jsonify({
-            "response": "🎁✨ WOOHOO! You've collected your daily reward of 50 shiny coins! Keep stacking that treasure! 💰✨",
-            "new_balance": users[user_id]["coins"]
-        })
+    # Game commands are looked up in the command registry (see commands.py)
+    result = dispatch(ledger, user_id, input_text)
+    if result is not None:
+        g.timer.mark("command")
+        g.metric_command = input_text.split(None, 1)[0]
+        return game_reply(result, bool(data.get('compact', False)))
 
-    elif input_text == "!hunt":
-        hunt_cost = 15
-        if users[user_id]["coins"] < hunt_cost:
-            return jsonify({"response": f"🏹 Oops! You need {hunt_cost} coins to equip yourself for a proper hunt! Come back when you're loaded! 💸", "new_balance": users[user_id]["coins"]})
-        users[user_id]["coins"] -= hunt_cost
-        hunting_events = [
-            {"description": "You tracked a majestic deer 🦌 through the enchanted forest. After a careful aim, you successfully bagged it!", "reward": 40},
-            {"description": "While traversing a dense thicket, a nimble rabbit 🐰 darted across your path. You managed to catch it with lightning reflexes!", "reward": 25},
-            {"description": "You stumbled upon a family of wild boars! 🐗 The chase was thrilling, and you managed to corner one with your expert skills.", "reward": 55},
-            {"description": "You spent hours in the wilderness 🌲, following trails and listening for movement. Finally, you spotted a rare and elusive bird! 🦅", "reward": 70},
-            {"description": "The forest was quiet today. 🤫 You found some interesting tracks but the animals remained hidden in the shadows.", "reward": 5},
-            {"description": "You carefully set up a snare near a crystal-clear watering hole 💦. Later, you returned to find a small but useful catch.", "reward": 30},
-            {"description": "A mischievous squirrel 🐿️ ran right into your net! It wasn't much, but it's something to show for your efforts!", "reward": 15},
-            {"description": "The wind carried the scent of prey 🍃, leading you to a successful hunt in the open fields of fortune.", "reward": 45},
-            {"description": "Despite your best efforts and cunning strategies, the forest seemed empty today. 😔 You return with nothing but stories of the chase.", "reward": 0},
-            {"description": "You discovered a hidden grove 🌿 and found a valuable wild herb along with a small animal. Nature has blessed you today!", "reward": 35},
-        ]
-        event = random.choice(hunting_events)
-        reward = event["reward"]
-        users[user_id]["coins"] += reward
-        return jsonify({
-            "response": f"🏹 You went on an epic hunt! {event['description']} You gained {reward} coins! 💰 (Cost: {hunt_cost} coins)",
-            "result": "success" if reward > 0 else "nothing",
-            "new_balance": users[user_id]["coins"]
-        })
+    # ----------------- DEFAULT CHATBOT RESPONSE -----------------
 
-    elif input_text == "!fish":
-        fishing_cost = 10
-        if users[user_id]["coins"] < fishing_cost:
-            return jsonify({"response": f"🎣 Oh no! You need {fishing_cost} coins to prepare your fishing gear! Go collect some more treasure first! 💰", "new_balance": users[user_id]["coins"]})
-        users[user_id]["coins"] -= fishing_cost
-        fishing_loot = [
-            {"tier": "S", "name": "Giant Squid 🦑", "description": "A colossal creature of the deep! Legendary find!", "reward": 200, "rarity": 0.005},
-            {"tier": "S", "name": "Megalodon Tooth 🦈", "description": "An ancient relic worth a fortune! Incredibly rare!", "reward": 150, "rarity": 0.01},
-            {"tier": "A", "name": "Golden Dorado ✨🐟", "description": "A shimmering fish of legend that gleams like pure gold!", "reward": 80, "rarity": 0.03},
-            {"tier": "A", "name": "Ancient Marlin 🔱", "description": "A wise old fish with battle scars and stories to tell.", "reward": 70, "rarity": 0.05},
-            {"tier": "B", "name": "Silver Salmon 🐠", "description": "A strong and healthy fish, perfect for a feast!", "reward": 45, "rarity": 0.10},
-            {"tier": "B", "name": "Striped Bass 🎵", "description": "A popular and tasty catch, dancing in your net!", "reward": 40, "rarity": 0.12},
-            {"tier": "B", "name": "Mysterious Bottle 📜", "description": "Contains a curious message from distant shores...", "reward": 30, "rarity": 0.08},
-            {"tier": "C", "name": "Common Carp 🐡", "description": "A typical river fish, but still worth something!", "reward": 20, "rarity": 0.20},
-            {"tier": "C", "name": "Bluegill 🔵", "description": "A small but colorful fish that brightens your day.", "reward": 15, "rarity": 0.25},
-            {"tier": "C", "name": "Waterlogged Boot 👢", "description": "Smells... interesting. Someone's missing this!", "reward": 5, "rarity": 0.15},
-            {"tier": "D", "name": "Empty Can 🥫", "description": "Looks like someone littered. At least you cleaned up!", "reward": 0, "rarity": 0.0},
-            {"tier": "D", "name": "Seaweed 🌿", "description": "Just some slimy greens. Maybe good for soup?", "reward": 0, "rarity": 0.0},
-            {"tier": "D", "name": "Old Tire 🛞", "description": "Heavy and useless. Why is this even in the water?", "reward": 0, "rarity": 0.0},
-            {"tier": "D", "name": "Nothing 💨", "description": "The fish were smarter than you today! Better luck next time!", "reward": 0, "rarity": 0.10}
-        ]
-        probabilities = [item["rarity"] for item in fishing_loot]
-        caught_item = random.choices(fishing_loot, weights=probabilities, k=1)[0]
-        reward = caught_item["reward"]
-        users[user_id]["coins"] += reward
-        return jsonify({
-            "response": f"🎣 You cast your line with expert precision and caught a **{caught_item['name']}**! {caught_item['description']} You gained {reward} coins! 💰 (Cost: {fishing_cost} coins)",
-            "result": "success" if reward > 0 else "nothing",
-            "tier": caught_item["tier"],
-            "item": caught_item["name"],
-            "new_balance": users[user_id]["coins"]
-        })
+    g.metric_mode = mode_name
+    history = conversation_history(user_id, mode_name)
+    # Replies that follow earlier turns depend on that player's history, so only the
+    # opening message of a conversation is served from (and stored in) the shared cache
+    use_cache = reply_cache is not None and not history
 
-    elif input_text.startswith("!coin"):
-        parts = input_text.split()
-        if len(parts) == 1:
+    # Serve repeated messages from the reply cache when it is enabled
+    if use_cache:
+        cached = reply_cache.get(mode_name, input_text)
+        g.timer.mark("cache")
+        if cached is not None:
+            remember_turn(user_id, mode_name, input_text, cached)
             return jsonify({
-                "response": "🪙 Ready to test your luck? Use `!coin <heads|tails> <wager>` (e.g., `!coin heads 20`) to flip the magical coin of fortune! ✨",
-                "new_balance": users[user_id]["coins"]
-            })
-        elif len(parts) == 3:
-            prediction = parts[1].lower()
-            try:
-                wager = int(parts[2])
-                if prediction not in ["heads", "tails"]:
-                    return jsonify({
-                        "response": "❌ Invalid prediction! Choose either 'heads' or 'tails' to tempt fate! 🪙",
-                        "new_balance": users[user_id]["coins"]
-                    })
-                if users[user_id]["coins"] < wager or wager <= 0:
-                    return jsonify({
-                        "response": "💸 Invalid wager or insufficient coins! Check your treasure chest and try again! 💰",
-                        "new_balance": users[user_id]["coins"]
-                    })
-
-                users[user_id]["coins"] -= wager
-                result = random.choice(["heads", "tails"])
-                if prediction == result:
-                    reward = wager * 2  # Winning doubles the wager
-                    users[user_id]["coins"] += reward
-                    return jsonify({
-                        "response": f"🎉 The coin landed on **{result.capitalize()}**! You predicted **{prediction.capitalize()}** and WON {reward} coins! Fortune favors you today! 🍀",
-                        "result": "win",
-                        "wager": wager,
-                        "prediction": prediction.capitalize(),
-                        "landed_on": result.capitalize(),
-                        "new_balance": users[user_id]["coins"]
-                    })
-                else:
-                    return jsonify({
-                        "response": f"😔 The coin landed on **{result.capitalize()}**. You predicted **{prediction.capitalize()}** and lost {wager} coins. Better luck next time! 🪙",
-                        "result": "lose",
-                        "wager": wager,
-                        "prediction": prediction.capitalize(),
-                        "landed_on": result.capitalize(),
-                        "new_balance": users[user_id]["coins"]
-                    })
-            except ValueError:
-                return jsonify({
-                    "response": "❓ Invalid wager. Please enter a number for the amount of coins you wish to risk! 🔢",
-                    "new_balance": users[user_id]["coins"] + (wager if 'wager' in locals() else 0)
-                })
-        else:
-            return jsonify({
-                "response": "❌ Invalid coin command. Use `!coin <heads|tails> <wager>` (e.g., `!coin heads 20`) to test your luck! 🪙",
-                "new_balance": users[user_id]["coins"]
+                "response": cached,
+                "new_balance": ledger.balance(user_id)
             })
 
-    elif input_text.startswith("!dice"):
-        parts = input_text.split()
-        if len(parts) == 1:
-            return jsonify({
-                "response":
-                            "🎲 **Roll the Dice of Destiny!** 🎲\n\n"
-                            "**Basic Command:** `!dice <prediction> <wager>`\n\n"
-                            "**Example:** `!dice 3> 200` (bets 200 coins that the roll will be 4, 5, or 6).\n\n"
-                            "Ready to challenge fate? Give it a roll! 🍀✨",
-                "new_balance": users[user_id]["coins"]
-            })
-        elif len(parts) == 3:
-            try:
-                prediction_str = parts[1]
-                wager = int(parts[2])
-                if users[user_id]["coins"] < wager or wager <= 0:
-                    return jsonify({"response": "💸 Invalid wager or insufficient coins! Check your treasure chest and try again! 💰", "new_balance": users[user_id]["coins"]})
-                users[user_id]["coins"] -= wager
-                roll = random.randint(1, 6)
-                reward = 0
-                result_text = "lose"
-                match = re.match(r"(\d+)([><=]?)", prediction_str)
-                if match:
-                    target = int(match.group(1))
-                    operator = match.group(2) or "="
-                    if 1 <= target <= 6:
-                        won = False
-                        if operator == ">":
-                            if roll > target:
-                                won = True
-                        elif operator == "<":
-                            if roll < target:
-                                won = True
-                        elif operator == "=":
-                            if roll == target:
-                                won = True
-                        elif operator == ">=":
-                            if roll >= target:
-                                won = True
-                        elif operator == "<=":
-                            if roll <= target:
-                                won = True
-                        if won:
-                            if operator == "=":
-                                reward = wager * 5
-                            else:
-                                reward = wager * 2
-                            users[user_id]["coins"] += reward
-                            result_text = "win"
-                            return jsonify({
-                                "response": f"🎲✨ AMAZING! You rolled a {roll}! Your bet '{prediction_str}' was correct. You won {reward} coins! Lady Luck smiles upon you! 🍀",
-                                "result": result_text,
-                                "rolled": roll,
-                                "bet": prediction_str,
-                                "wager": wager,
-                                "new_balance": users[user_id]["coins"]
-                            })
-                        else:
-                            return jsonify({
-                                "response": f"🎲 You rolled a {roll}. Your bet '{prediction_str}' was incorrect. You lost {wager} coins. The dice gods are fickle today! 😔",
-                                "result": result_text,
-                                "rolled": roll,
-                                "bet": prediction_str,
-                                "wager": wager,
-                                "new_balance": users[user_id]["coins"]
-                            })
-                    else:
-                        raise ValueError
-                else:
-                    raise ValueError
-            except ValueError:
-                return jsonify({"response": "❓ Invalid dice command format. Use `!dice <number>[><=] <wager>` (no space between number and operator) ❓", "new_balance": users[user_id]["coins"] + (wager if 'wager' in locals() else 0)})
-        else:
-            return jsonify({"response": "❌ Invalid dice command format. Use `!dice <number>[><=] <wager>` (no space between number and operator) ❌", "new_balance": users[user_id]["coins"]})
-
-    elif input_text.startswith("!blackjack"):
-        if users[user_id]["coins"] < 15:
-            return jsonify({"response": "💸 Not enough coins to play Blackjack! You need at least 15 coins to join the table! 🃏", "new_balance": users[user_id]["coins"]})
-        user_data = users[user_id]
-        command = input_text.split()[1] if len(input_text.split()) > 1 else "start"
-        if command == "start":
-            user_data["blackjack"] = {
-                "player_cards": [random.randint(1, 11), random.randint(1, 11)],
-                "dealer_cards": [random.randint(1, 11)],
-                "coins_wagered": 15,
-                "game_over": False
-            }
-            user_data["coins"] -= 15
-            response_msg = (
-                f"🃏 Blackjack game started! You confidently wagered 15 coins. 💰\n"
-                f"Your cards: {user_data['blackjack']['player_cards']} (Total: {calculate_blackjack_value(user_data['blackjack']['player_cards'])}) 🎴\n"
-                f"Dealer's card: {user_data['blackjack']['dealer_cards'][0]} 🎭\n"
-                f"Type `!blackjack hit` to draw another card or `!blackjack stand` to end your turn. Good luck! 🍀"
-            )
-            return jsonify({
-                "response": response_msg,
-                "new_balance": user_data["coins"],
-                "game_state": "active"
-            })
-        elif command in ["hit", "stand"] and "blackjack" in user_data and user_data["blackjack"]:
-            game = user_data["blackjack"]
-            if game["game_over"]:
-                return jsonify({"response": "⚠️ This game is already over. Start a new exciting round with `!blackjack`! 🃏", "new_balance": user_data["coins"]})
-            if command == "hit":
-                new_card = random.randint(1, 11)
-                game["player_cards"].append(new_card)
-                player_total = calculate_blackjack_value(game["player_cards"])
-                if player_total > 21:
-                    game["game_over"] = True
-                    response_msg = (
-                        f"💥 BUST! You went over with {player_total}! Dealer wins this round. 😔\n"
-                        f"Your cards: {game['player_cards']} 🎴\n"
-                        f"Dealer's cards: {game['dealer_cards']} (Total: {calculate_blackjack_value(game['dealer_cards'])}) 🎭\n"
-                        f"Final balance: {user_data['coins']} coins 💰"
-                    )
-                    del user_data["blackjack"]
-                    return jsonify({
-                        "response": response_msg,
-                        "new_balance": user_data["coins"],
-                        "game_state": "lose"
-                    })
-                else:
-                    response_msg = (
-                        f"🎴 You drew a card ({new_card}). Your total: {player_total} 🔢\n"
-                        f"Your cards: {game['player_cards']} 🎴\n"
-                        f"Dealer's card: {game['dealer_cards'][0]} 🎭\n"
-                        f"What's your next move? Type `!blackjack hit` or `!blackjack stand` 🤔"
-                    )
-                    return jsonify({
-                        "response": response_msg,
-                        "new_balance": user_data["coins"],
-                        "game_state": "active"
-                    })
-            elif command == "stand":
-                game["game_over"] = True
-                while calculate_blackjack_value(game["dealer_cards"]) < 17:
-                    game["dealer_cards"].append(random.randint(1, 11))
-                player_total = calculate_blackjack_value(game["player_cards"])
-                dealer_total = calculate_blackjack_value(game["dealer_cards"])
-                if dealer_total > 21 or player_total > dealer_total:
-                    reward = game["coins_wagered"] * 2
-                    user_data["coins"] += reward
-                    result = "win"
-                    response_msg = f"🎉 VICTORY! You win with {player_total} vs dealer's {dealer_total}! 🏆"
-                elif dealer_total == player_total:
-                    reward = game["coins_wagered"]
-                    user_data["coins"] += reward
-                    result = "tie"
-                    response_msg = f"🤝 It's a tie! {player_total} vs {dealer_total} - Your wager has been returned."
-                else:
-                    reward = 0
-                    result = "lose"
-                    response_msg = f"😔 Dealer wins with {dealer_total} vs your {player_total}. Better luck next time!"
-                del user_data["blackjack"]
-                return jsonify({
-                    "response": f"{response_msg}\nYour cards: {game['player_cards']} (Total: {player_total}) 🎴\nDealer's cards: {game['dealer_cards']} (Total: {dealer_total}) 🎭\nYou {'win' if result == 'win' else 'tie' if result == 'tie' else 'lose'}! Final balance: {user_data['coins']} coins 💰",
-                    "new_balance": user_data["coins"],
-                    "game_state": result
-                })
-        else:
-            return jsonify({"response": "❓ Invalid blackjack command. Use `!blackjack`, `!blackjack hit`, or `!blackjack stand`. 🃏", "new_balance": users[user_id]["coins"]})
-
-    # ----------------- DEFAULT CHATBOT RESPONSE -----------------
+    messages = build_messages(mode_name, input_text, history)
+    g.timer.mark("prompt")
 
-    # Construct the prompt for the OpenAI model using the selected mode, task, and user input
-    prompt = f"""
-    {mode}
-
-    User: {input_text}
-
-    Bot:
-    """
-
-    try:
-        # Initialize the OpenAI client with the OpenRouter API base URL and API key
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=OPENROUTER_API_KEY
-        )
+    def call_model(model, max_tokens):
+        # One upstream call; the router decides which model and may make a second call
+        # Reuse the process-wide OpenAI client so pooled connections are kept alive between calls;
+        # when the router can fall back to another model, that replaces the client's retries
+        client = get_client(OPENROUTER_BASE_URL, OPENROUTER_API_KEY, retry=not llm_router.falls_back(mode_name))
 
         # Create a chat completion using the OpenAI API
+        started = start_upstream_timer()
         response = client.chat.completions.create(
-            model="mistralai/mistral-7b-instruct:free",  # Specify the model to use
-            messages=[
-                {"role": "system", "content": "You are a chatbot that responds with roasts, compliments, jokes, or other moods based on user settings. Use plenty of emojis and energetic language! 🌟✨"},
-                {"role": "user", "content": prompt}
-            ],
-            # Add custom headers for OpenRouter attribution
-            extra_headers={
-                "HTTP-Referer": "http://localhost:3000",  # Replace with your actual frontend URL
-                "X-Title": "MoodBot"  # Replace with the name of your application
-            },
-            max_tokens=100  # Limit the response length
+            model=model,  # Model picked by the router
+            messages=messages,
+            extra_headers=OPENROUTER_HEADERS,
+            max_tokens=max_tokens  # Limit the response length
         )
+        metrics.record_upstream('/chat', mode_name, started, response_started_at.get(), response.usage)
 
         # Extract the generated reply from the OpenAI response
-        reply = response.choices[0].message.content.strip()
-        # Return the reply and the current coin balance from the 'users' dictionary
+        return response.choices[0].message.content.strip()
+
+    def complete():
+        # Only runs for the first of several identical in-flight prompts; the others share its reply
+        reply = llm_router.complete(mode_name, call_model)
+        if use_cache and reply:
+            reply_cache.put(mode_name, input_text, reply)
+        return reply
+
+    try:
+        reply = llm_guard.call(prompt_key(messages), complete)
+        g.timer.mark("upstream")
+        remember_turn(user_id, mode_name, input_text, reply)
+        # Return the reply and the player's current coin balance
         return jsonify({
             "response": reply,
-            "new_balance": users[user_id]["coins"]  # Always return the current balance
+            "new_balance": ledger.balance(user_id)  # Always return the current balance
         })
 
+    # Refused without calling the upstream: answer right away instead of queueing
+    except Rejected as e:
+        g.timer.mark("upstream")
+        metrics.record_rejection('/chat', e.reason)
+        return napping_response(user_id)
+
     # Handle any exceptions that occur during the API call
     except Exception as e:
+        g.timer.mark("upstream")
+        metrics.record_error('/chat', e)
         return jsonify({
-            "response": f"⚠️ Error: {str(e)} - Our magical bot is taking a quick nap! Try again soon! 💤",
-            "new_balance": users[user_id]["coins"]
+            "response": llm_error_message(e),
+            "new_balance": ledger.balance(user_id)
         })
 
+
+# Run several game commands for one player in a single request
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    data = request.json
+    user_id = resolve_user_id(data, request.headers.get('X-User-Id'))
+    inputs = data.get('inputs', [])
+    if not isinstance(inputs, list) or not 1 <= len(inputs) <= BATCH_MAX_INPUTS:
+        return jsonify({
+            "response": f"📦 Send between 1 and {BATCH_MAX_INPUTS} game commands in `inputs`! 🎮",
+            "new_balance": ledger.balance(user_id)
+        }), 400
+
+    g.timer.mark("parse")
+
+    # atomic: all commands succeed together or none are applied
+    results, rolled_back = run_batch(ledger, user_id, [str(item) for item in inputs], atomic=bool(data.get('atomic', False)))
+    g.timer.mark("command")
+    if data.get('compact', False):
+        results = [compact(result) for result in results]
+    return game_reply({
+        "results": results,
+        "rolled_back": rolled_back,
+        "new_balance": ledger.balance(user_id)
+    })
+
+
+def sse_event(payload):
+    # Format a single Server-Sent Events message carrying a JSON payload
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+# Streaming variant of the chatbot: forwards tokens to the client as soon as the upstream produces them
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json
+    input_text = data.get('input', '')
+    mode_name = resolve_mode(data.get('mode', 'normal'))
+    user_id = resolve_user_id(data, request.headers.get('X-User-Id'))
+    g.timer.mark("parse")
+
+    # Game commands are cheap and return structured data, so they stay on the regular endpoint
+    if input_text.startswith("!"):
+        return jsonify({
+            "response": "🎮 Game commands can't be streamed - send them to /chat instead! 🎲",
+            "new_balance": ledger.balance(user_id)
+        }), 400
+
+    g.metric_mode = mode_name
+    history = conversation_history(user_id, mode_name)
+    # Same rule as /chat: only opening messages use the reply cache
+    use_cache = reply_cache is not None and not history
+    messages = build_messages(mode_name, input_text, history)
+    timer = g.timer
+    timer.mark("prompt")
+
+    def generate():
+        # A cached reply is sent as a single delta
+        if use_cache:
+            cached = reply_cache.get(mode_name, input_text)
+            if cached is not None:
+                remember_turn(user_id, mode_name, input_text, cached)
+                yield sse_event({"delta": cached})
+                yield sse_event({"done": True, "new_balance": ledger.balance(user_id)})
+                return
+        parts = []
+        first_token_at = None
+        usage = None
+        try:
+            # Streams aren't coalesced, but they take a slot and count for the breaker like any call
+            with llm_guard.admit():
+                # No fallback or hedging once tokens are flowing: the stream uses the best model
+                model = llm_router.stream_model(mode_name)
+                client = get_client(OPENROUTER_BASE_URL, OPENROUTER_API_KEY)
+                started = start_upstream_timer()
+                failed = None
+                try:
+                    stream = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        extra_headers=OPENROUTER_HEADERS,
+                        max_tokens=llm_router.max_tokens(mode_name),
+                        stream=True,
+                        stream_options={"include_usage": True}  # Token counts arrive in a final chunk
+                    )
+                    for chunk in stream:
+                        if chunk.usage is not None:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if first_token_at is None:
+                                first_token_at = timer.mark("first_token")
+                            parts.append(delta)
+                            yield sse_event({"delta": delta})
+                    failed = False
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    llm_router.finish_stream(model, time.perf_counter() - started, failed)
+            timer.mark("upstream")
+            metrics.record_upstream('/chat/stream', mode_name, started, first_token_at, usage)
+            reply = "".join(parts).strip()
+            if use_cache and reply:
+                reply_cache.put(mode_name, input_text, reply)
+            remember_turn(user_id, mode_name, input_text, reply)
+        except Rejected as e:
+            timer.mark("upstream")
+            metrics.record_rejection('/chat/stream', e.reason)
+            yield sse_event({"error": napping_message()})
+        except Exception as e:
+            timer.mark("upstream")
+            metrics.record_error('/chat/stream', e)
+            yield sse_event({"error": llm_error_message(e)})
+        # Final event always carries the balance, like the JSON endpoint
+        yield sse_event({"done": True, "new_balance": ledger.balance(user_id)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Stop reverse proxies from buffering the stream
+        }
+    )
+
+
+# Connection pool metrics for the shared LLM client (connections reused vs opened, time spent waiting)
+@app.route('/stats/llm-pool', methods=['GET'])
+def llm_pool_stats():
+    return jsonify(pool_stats())
+
+# Single-flight, queue, rate limit and circuit breaker counters for LLM calls
+@app.route('/stats/llm-guard', methods=['GET'])
+def llm_guard_stats():
+    return jsonify(llm_guard.stats())
+
+# Latency and error averages per model, and how often the router fell back or hedged
+@app.route('/stats/llm-router', methods=['GET'])
+def llm_router_stats():
+    return jsonify(llm_router.stats())
+
+# ----------------- LEADERBOARDS -----------------
+
+def leaderboard_limit():
+    # ?limit=N, clamped to 1..LEADERBOARD_MAX
+    limit = request.args.get('limit', 10, type=int)
+    return max(1, min(limit, LEADERBOARD_MAX))
+
+
+def game_stats_disabled():
+    return jsonify({"enabled": False, "response": "📜 The game log is turned off on this server, so there are no leaderboards! 🏆"}), 404
+
+
+# Richest players by current balance
+@app.route('/leaderboard/richest', methods=['GET'])
+def leaderboard_richest():
+    if game_stats is None:
+        return game_stats_disabled()
+    game_stats.ensure_running()
+    limit = leaderboard_limit()
+    return jsonify({"leaders": game_stats.read(lambda aggregates: aggregates.top_richest(limit))})
+
+
+# Biggest single wins (net of the wager) across all games
+@app.route('/leaderboard/biggest-wins', methods=['GET'])
+def leaderboard_biggest_wins():
+    if game_stats is None:
+        return game_stats_disabled()
+    game_stats.ensure_running()
+    limit = leaderboard_limit()
+    return jsonify({"wins": game_stats.read(lambda aggregates: aggregates.biggest_wins(limit))})
+
+
+# Rounds, wins and coins spent/won per game for one player, plus their rank by balance
+@app.route('/players/<user_id>/stats', methods=['GET'])
+def player_stats(user_id):
+    if game_stats is None:
+        return game_stats_disabled()
+    game_stats.ensure_running()
+    user_id = resolve_user_id({"user_id": user_id})
+    stats = game_stats.read(lambda aggregates: aggregates.player_stats(user_id))
+    if stats is None:
+        return jsonify({"user_id": user_id, "response": "🎮 No games played yet - try `!fish` or `!hunt`! 🎣"}), 404
+    return jsonify(stats)
+
+
+# Event log writer and leaderboard follower counters for this worker
+@app.route('/stats/game-log', methods=['GET'])
+def game_log_stats():
+    if game_log is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, "writer": game_log.stats(), "follower": game_stats.stats()})
+
+# Pre-generated random streams in this worker and how many buffers they have made
+@app.route('/stats/rng', methods=['GET'])
+def rng_stats():
+    return jsonify(game_rng.stats())
+
+# Hit/miss counters for the reply cache
+@app.route('/stats/reply-cache', methods=['GET'])
+def reply_cache_stats():
+    if reply_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **reply_cache.stats()})
+
+# Size of the conversation memory in this worker
+@app.route('/stats/memory', methods=['GET'])
+def memory_stats():
+    if memory is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **memory.stats()})
+
+# Prometheus scrape endpoint: request and upstream histograms, token and error counters,
+# plus the pool and reply cache stats as gauges (per worker process)
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    cache_stats = reply_cache.stats() if reply_cache is not None else {}
+    body = metrics.render(
+        metrics.render_gauges("moodbot_llm_pool", pool_stats()),
+        metrics.render_gauges("moodbot_llm_guard", llm_guard.stats()),
+        metrics.render_gauges("moodbot_llm_router", llm_router.stats()),
+        metrics.render_gauges("moodbot_reply_cache", cache_stats),
+        metrics.render_gauges("moodbot_memory", memory.stats() if memory is not None else {}),
+        metrics.render_gauges("moodbot_game_log", game_log.stats() if game_log is not None else {}),
+        metrics.render_gauges("moodbot_game_stats", game_stats.stats() if game_stats is not None else {}),
+        metrics.render_gauges("moodbot_rng", game_rng.stats()),
+    )
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
 # Run the Flask development server if the script is executed directly
 if __name__ == '__main__':
     app.run(debug=True)
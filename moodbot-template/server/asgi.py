@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import (
+    app,
+    ledger,
+    OPENROUTER_API_KEY,
+    OPENROUTER_BASE_URL,
+    OPENROUTER_HEADERS,
+    build_messages,
+    conversation_history,
+    llm_error_message,
+    llm_guard,
+    llm_router,
+    napping_message,
+    remember_turn,
+    reply_cache,
+    resolve_mode,
+    resolve_user_id,
+)
+from llm_client import get_async_client, response_started_at, start_upstream_timer
+from llm_guard import Rejected, prompt_key
+import metrics
+
+# Async serving mode for MoodBot. Serve it with an ASGI worker, for example:
+#   gunicorn -w 2 -k uvicorn.workers.UvicornWorker asgi:application
+#
+# Chat messages that need the LLM are awaited on the event loop with the AsyncOpenAI client,
+# so a slow completion only costs a coroutine instead of a whole worker. Everything else
+# (game commands, /chat/stream, CORS preflights, stats) runs on the regular Flask app
+# in a thread pool, so cheap commands never queue behind in-flight completions.
+
+# Threads available to the Flask app for game commands and other routes
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", "16"))
+
+wsgi_app = WSGIMiddleware(app, workers=WSGI_THREADS)
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+def replay_body(body):
+    # Hand an already consumed request body to the WSGI app
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            # Same CORS policy as CORS(app) on the Flask side
+            (b"access-control-allow-origin", b"*"),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def header_value(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def chat_llm(scope, data, send, timer):
+    # Records the same request, stage and upstream metrics as the Flask view
+    input_text = data.get('input', '')
+    mode_name = resolve_mode(data.get('mode', 'normal'))
+    user_id = resolve_user_id(data, header_value(scope, b"x-user-id"))
+    timer.mark("parse")
+
+    # Conversation memory is an in-process dict, so reading and updating it inline is fine
+    history = conversation_history(user_id, mode_name)
+    # Replies to a conversation depend on its history; only opening messages use the cache
+    use_cache = reply_cache is not None and not history
+
+    # The SQLite backend writes on every lookup (last_used) and may wait on another worker's
+    # write lock, so cache calls run in a thread like the ledger reads
+    if use_cache:
+        cached = await asyncio.to_thread(reply_cache.get, mode_name, input_text)
+        timer.mark("cache")
+        if cached is not None:
+            remember_turn(user_id, mode_name, input_text, cached)
+            await send_json(send, {"response": cached, "new_balance": await asyncio.to_thread(ledger.balance, user_id)})
+            metrics.record_request("/chat", 200, timer.finish("/chat"), mode=mode_name)
+            return
+
+    messages = build_messages(mode_name, input_text, history)
+    timer.mark("prompt")
+
+    async def call_model(model, max_tokens):
+        # Falling back to another model replaces the client's retries (see model_router.py)
+        client = get_async_client(OPENROUTER_BASE_URL, OPENROUTER_API_KEY, retry=not llm_router.falls_back(mode_name))
+        started = start_upstream_timer()
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            extra_headers=OPENROUTER_HEADERS,
+            max_tokens=max_tokens
+        )
+        metrics.record_upstream("/chat", mode_name, started, response_started_at.get(), response.usage)
+        return response.choices[0].message.content.strip()
+
+    async def complete():
+        # Runs once per group of identical in-flight prompts, after a slot in the bounded
+        # queue is free; waiting for the slot doesn't hold a thread
+        timer.mark("queue")
+        # A hedged call's loser is cancelled, which closes its upstream request
+        reply = await llm_router.complete_async(mode_name, call_model)
+        if use_cache and reply:
+            await asyncio.to_thread(reply_cache.put, mode_name, input_text, reply)
+        return reply
+
+    status = 200
+    headers = ()
+    try:
+        reply = await llm_guard.call_async(prompt_key(messages), complete)
+        timer.mark("upstream")
+        remember_turn(user_id, mode_name, input_text, reply)
+    except Rejected as e:
+        timer.mark("upstream")
+        metrics.record_rejection("/chat", e.reason)
+        reply = napping_message()
+        status = 503
+        headers = ((b"retry-after", str(llm_guard.retry_after()).encode("ascii")),)
+    except Exception as e:
+        timer.mark("upstream")
+        metrics.record_error("/chat", e)
+        reply = llm_error_message(e)
+    # Ledger reads go to SQLite, so keep them off the event loop
+    new_balance = await asyncio.to_thread(ledger.balance, user_id)
+    await send_json(send, {"response": reply, "new_balance": new_balance}, status, headers)
+    timer.mark("serialize")
+    metrics.record_request("/chat", status, timer.finish("/chat"), mode=mode_name)
+
+
+async def lifespan(receive, send):
+    # Nothing to set up; just acknowledge startup and shutdown
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http" or scope["path"] != "/chat" or scope["method"] != "POST":
+        await wsgi_app(scope, receive, send)
+        return
+
+    timer = metrics.StageTimer()
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        data = None
+
+    # Game commands (and anything malformed, like a non-string input) keep using the Flask view.
+    # Like commands.dispatch, look at the first word, so " !fish" is a game command here too
+    if not isinstance(data, dict) or not isinstance(data.get('input', ''), str) or \
+            any(word.startswith("!") for word in data.get('input', '').split()[:1]):
+        await wsgi_app(scope, replay_body(body), send)
+        return
+
+    await chat_llm(scope, data, send, timer)
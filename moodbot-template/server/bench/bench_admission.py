@@ -0,0 +1,104 @@
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+# Admission control scenarios against the fake upstream's latency and failure injection:
+#   popular prompt  - many users send the same message at once, with and without single-flight
+#   slow upstream   - more chats than the bounded queue holds; the extra ones fail fast
+#   failing upstream - the circuit breaker opens, refuses calls, then closes after a good trial
+#   rate limit      - a burst beyond the token bucket
+# The Flask app runs on a threaded werkzeug server in this process; each scenario installs
+# its own UpstreamGuard. Run from the server directory: python bench/bench_admission.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_upstream import start_fake_upstream  # noqa: E402
+
+upstream = start_fake_upstream(ttft=0.3, token_delay=0.0)
+os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{upstream.server_port}/v1"
+os.environ["MOODBOT_LEDGER_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+# Identical inputs must give identical prompts, and failures must reach the breaker without retries
+os.environ["MOODBOT_MEMORY_TOKENS"] = "0"
+os.environ["LLM_MAX_RETRIES"] = "0"
+
+import app  # noqa: E402
+from llm_guard import CircuitBreaker, UpstreamGuard  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+
+def start_app():
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def send_chats(base_url, inputs, concurrency):
+    # Returns [(status, seconds)] in input order
+    with httpx.Client(base_url=base_url, timeout=30, limits=httpx.Limits(max_connections=concurrency)) as client:
+        def send(text):
+            start = time.perf_counter()
+            response = client.post("/chat", json={"input": text})
+            return response.status_code, time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(send, inputs))
+
+
+def summary(results):
+    ok = [seconds for status, seconds in results if status == 200]
+    napping = [seconds for status, seconds in results if status == 503]
+    line = f"ok {len(ok):>3}"
+    if ok:
+        line += f" (max {max(ok) * 1000:6.0f} ms)"
+    line += f"  napping {len(napping):>3}"
+    if napping:
+        line += f" (max {max(napping) * 1000:6.0f} ms)"
+    return line
+
+
+def upstream_calls(run):
+    before = upstream.requests
+    result = run()
+    return result, upstream.requests - before
+
+
+if __name__ == '__main__':
+    base_url = start_app()
+    send_chats(base_url, ["warm up"], 1)
+
+    print("popular prompt: 50 users send 'roast me' at once (upstream 300 ms)")
+    for single_flight in (False, True):
+        app.llm_guard = UpstreamGuard(max_in_flight=64, queue_size=64, single_flight=single_flight)
+        results, calls = upstream_calls(lambda: send_chats(base_url, ["roast me"] * 50, 50))
+        print(f"  single-flight {'on ' if single_flight else 'off'}: {calls:>3} upstream calls, {summary(results)}")
+
+    print("\nslow upstream: 40 different chats at once, upstream 2 s, 4 in flight + 8 queued (0.5 s wait)")
+    upstream.config["ttft"] = 2.0
+    app.llm_guard = UpstreamGuard(max_in_flight=4, queue_size=8, queue_timeout=0.5)
+    results = send_chats(base_url, [f"chat {i}" for i in range(40)], 40)
+    print(f"  {summary(results)}  {app.llm_guard.stats()}")
+    upstream.config["ttft"] = 0.05
+
+    print("\nfailing upstream: every call fails; breaker opens after 3 failures, 1 s cooldown")
+    app.llm_guard = UpstreamGuard()
+    app.llm_guard.breaker = CircuitBreaker(failures=3, cooldown=1.0)
+    upstream.config["failure_rate"] = 1.0
+    results, calls = upstream_calls(lambda: send_chats(base_url, [f"fail {i}" for i in range(10)], 1))
+    print(f"  10 chats while failing: {calls} reached the upstream, statuses {[status for status, _ in results]}")
+    upstream.config["failure_rate"] = 0.0
+    time.sleep(1.1)
+    results, calls = upstream_calls(lambda: send_chats(base_url, [f"recovered {i}" for i in range(5)], 1))
+    print(f"  5 chats after cooldown with a healthy upstream: {calls} upstream calls, "
+          f"statuses {[status for status, _ in results]}, breaker {app.llm_guard.breaker.state}")
+
+    print("\nrate limit: 20 chats in a burst, 5 calls/s with a burst of 5")
+    app.llm_guard = UpstreamGuard(rate=5, burst=5)
+    results = send_chats(base_url, [f"burst {i}" for i in range(20)], 20)
+    print(f"  {summary(results)}")
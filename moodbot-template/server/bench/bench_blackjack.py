@@ -0,0 +1,133 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+# Blackjack engine benchmark.
+#   per-request: one "!blackjack hit" and one "!blackjack stand" worth of game logic,
+#     including the JSON round trip through the ledger column. "before" is the old
+#     nested dict that rescored the whole card list on every read, "after" is
+#     BlackjackGame with incremental totals. A full round through dispatch() and the
+#     SQLite ledger is timed too, for scale.
+#   bulk: scoring and dealer play-out for many hands at once, pure Python loop vs
+#     the NumPy batch helpers used by the simulator and the dealer table.
+# Run from the server directory: python bench/bench_blackjack.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import dispatch  # noqa: E402
+from ledger import Ledger  # noqa: E402
+from blackjack import (  # noqa: E402
+    BlackjackGame,
+    calculate_blackjack_value,
+    dealer_final_totals,
+    dealer_outcome_table,
+    score_hands,
+)
+
+
+def draw_card():
+    return random.randint(1, 11)
+
+
+def saved_game():
+    return json.dumps({
+        "player_cards": [draw_card(), draw_card()],
+        "dealer_cards": [draw_card()],
+        "coins_wagered": 15,
+        "game_over": False
+    })
+
+
+def legacy_hit_and_stand(saved):
+    game = json.loads(saved)
+    game["player_cards"].append(draw_card())
+    player_total = calculate_blackjack_value(game["player_cards"])
+    if player_total <= 21:
+        saved = json.dumps(game)
+        game = json.loads(saved)
+        while calculate_blackjack_value(game["dealer_cards"]) < 17:
+            game["dealer_cards"].append(draw_card())
+        player_total = calculate_blackjack_value(game["player_cards"])
+        dealer_total = calculate_blackjack_value(game["dealer_cards"])
+        return player_total, dealer_total
+    return player_total, calculate_blackjack_value(game["dealer_cards"])
+
+
+def engine_hit_and_stand(saved):
+    game = BlackjackGame.from_dict(json.loads(saved))
+    game.player.add(draw_card())
+    if not game.player.busted:
+        saved = json.dumps(game.to_dict())
+        game = BlackjackGame.from_dict(json.loads(saved))
+        game.play_dealer(draw_card)
+    return game.player.total, game.dealer.total
+
+
+def python_dealer_totals(upcards):
+    totals = []
+    for upcard in upcards:
+        cards = [upcard]
+        while calculate_blackjack_value(cards) < 17:
+            cards.append(random.randint(1, 11))
+        totals.append(calculate_blackjack_value(cards))
+    return totals
+
+
+def dispatch_round(ledger, user_id):
+    # Start a game, hit once and stand if still in play; top the player up when broke
+    if ledger.balance(user_id) < 30:
+        ledger.credit(user_id, 1000)
+    dispatch(ledger, user_id, "!blackjack")
+    if dispatch(ledger, user_id, "!blackjack hit").get("game_state") == "active":
+        dispatch(ledger, user_id, "!blackjack stand")
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def best_of(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    saved = [saved_game() for _ in range(1000)]
+    number = 20000
+    before = per_call_us(lambda: legacy_hit_and_stand(random.choice(saved)), number)
+    after = per_call_us(lambda: engine_hit_and_stand(random.choice(saved)), number)
+    print("Per request (hit + stand)")
+    print(f"{'':<22}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    print(f"{'hit + stand':<22}{before:>14.2f}{after:>14.2f}{before / after:>9.1f}x")
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = Ledger(os.path.join(directory, "bench.sqlite3"))
+        full = per_call_us(lambda: dispatch_round(ledger, "bench"), 500)
+    print(f"{'full round (SQLite)':<22}{'':>14}{full:>14.2f}")
+
+    rng = np.random.default_rng(0)
+    hands = 200_000
+    cards = rng.integers(1, 12, (hands, 5))
+    card_lists = cards.tolist()
+    upcards = rng.integers(1, 12, hands)
+    upcard_list = upcards.tolist()
+    print(f"\nBulk, {hands:,} hands")
+    print(f"{'':<22}{'python (ms)':>14}{'numpy (ms)':>14}{'speedup':>10}")
+    python_ms = best_of(lambda: [calculate_blackjack_value(hand) for hand in card_lists]) * 1e3
+    numpy_ms = best_of(lambda: score_hands(cards)) * 1e3
+    print(f"{'score 5-card hands':<22}{python_ms:>14.1f}{numpy_ms:>14.1f}{python_ms / numpy_ms:>9.1f}x")
+    python_ms = best_of(lambda: python_dealer_totals(upcard_list)) * 1e3
+    numpy_ms = best_of(lambda: dealer_final_totals(rng, upcards)) * 1e3
+    print(f"{'dealer play-out':<22}{python_ms:>14.1f}{numpy_ms:>14.1f}{python_ms / numpy_ms:>9.1f}x")
+
+    elapsed = best_of(lambda: dealer_outcome_table(rng), repeat=1)
+    print(f"\ndealer outcome table (11 upcards x 200,000 hands): {elapsed * 1e3:.0f} ms")
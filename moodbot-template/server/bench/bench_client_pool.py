@@ -0,0 +1,57 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from openai import OpenAI
+
+# Compares per-call latency of building a fresh OpenAI client for every request (the old behaviour)
+# against the shared pooled client from llm_client.py, using the local fake upstream.
+# Run from the server directory: python bench/bench_client_pool.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_upstream import start_fake_upstream  # noqa: E402
+import llm_client  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "tell me a joke"}]
+
+
+def call(client):
+    start = time.perf_counter()
+    client.chat.completions.create(model="fake-model", messages=MESSAGES, max_tokens=100)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark a per-request client vs the shared pooled client")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    upstream = start_fake_upstream(ttft=0.0, token_delay=0.0)
+    base_url = f"http://127.0.0.1:{upstream.server_port}"
+
+    fresh = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        client = OpenAI(base_url=base_url, api_key="bench")
+        call(client)
+        fresh.append(time.perf_counter() - start)
+        client.close()
+
+    pooled = []
+    llm_client.metrics.reset()
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        client = llm_client.get_client(base_url, "bench")
+        call(client)
+        pooled.append(time.perf_counter() - start)
+
+    fresh_ms = statistics.median(fresh) * 1000
+    pooled_ms = statistics.median(pooled) * 1000
+    print(f"fresh client per call  median {fresh_ms:7.2f} ms")
+    print(f"shared pooled client   median {pooled_ms:7.2f} ms")
+    print(f"saved per call                {fresh_ms - pooled_ms:7.2f} ms")
+    print(f"pool metrics: {llm_client.pool_stats()}")
+    upstream.shutdown()
@@ -0,0 +1,114 @@
+import os
+import random
+import re
+import sys
+import timeit
+
+# Micro-benchmark of per-command dispatch and handling cost: the old if/elif chain that
+# rebuilt the loot tables, weights and dice regex on every call, versus the command
+# registry with import-time tables and the bisect sampler. Both sides use the same
+# in-memory ledger and build the same game log events (game_log.py, which came later), so
+# only the command handling itself is measured.
+# Run from the server directory: python bench/bench_dispatch.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import commands  # noqa: E402
+from game_log import game_event  # noqa: E402
+
+
+class MemoryLedger:
+    # Minimal in-memory stand-in for ledger.Ledger, so SQLite time doesn't drown the comparison
+    def __init__(self):
+        self.coins = 10 ** 12
+
+    def balance(self, user_id):
+        return self.coins
+
+    def settle(self, user_id, cost, payout=0, event=None):
+        if self.coins < cost:
+            return None
+        self.coins += payout - cost
+        return self.coins
+
+
+def legacy_dispatch(ledger, user_id, input_text):
+    # The pre-registry shape of chat(): a chain of comparisons, with the tables rebuilt per call
+    if input_text == "!daily":
+        return None
+    elif input_text == "!hunt":
+        hunting_events = [dict(event) for event in commands.HUNTING_EVENTS]
+        event = random.choice(hunting_events)
+        reward = event["reward"]
+        new_balance = ledger.settle(user_id, 15, reward, game_event("hunt"))
+        return {
+            "response": f"🏹 You went on an epic hunt! {event['description']} You gained {reward} coins! 💰 (Cost: 15 coins)",
+            "result": "success" if reward > 0 else "nothing",
+            "new_balance": new_balance
+        }
+    elif input_text == "!fish":
+        fishing_loot = [dict(item) for item in commands.FISHING_LOOT]
+        probabilities = [item["rarity"] for item in fishing_loot]
+        caught_item = random.choices(fishing_loot, weights=probabilities, k=1)[0]
+        reward = caught_item["reward"]
+        new_balance = ledger.settle(user_id, 10, reward, game_event("fish", item=caught_item["name"], tier=caught_item["tier"]))
+        return {
+            "response": f"🎣 You cast your line with expert precision and caught a **{caught_item['name']}**! {caught_item['description']} You gained {reward} coins! 💰 (Cost: 10 coins)",
+            "result": "success" if reward > 0 else "nothing",
+            "tier": caught_item["tier"],
+            "item": caught_item["name"],
+            "new_balance": new_balance
+        }
+    elif input_text.startswith("!coin"):
+        return None
+    elif input_text.startswith("!dice"):
+        parts = input_text.split()
+        prediction_str = parts[1]
+        wager = int(parts[2])
+        roll = random.randint(1, 6)
+        match = re.match(r"(\d+)([><=]?)", prediction_str)
+        target = int(match.group(1))
+        operator = match.group(2) or "="
+        won = False
+        if operator == ">":
+            if roll > target:
+                won = True
+        elif operator == "<":
+            if roll < target:
+                won = True
+        elif operator == "=":
+            if roll == target:
+                won = True
+        reward = (wager * 5 if operator == "=" else wager * 2) if won else 0
+        new_balance = ledger.settle(user_id, wager, reward, game_event("dice", bet=prediction_str, rolled=roll))
+        if won:
+            return {
+                "response": f"🎲✨ AMAZING! You rolled a {roll}! Your bet '{prediction_str}' was correct. You won {reward} coins! Lady Luck smiles upon you! 🍀",
+                "result": "win", "rolled": roll, "bet": prediction_str, "wager": wager, "new_balance": new_balance
+            }
+        return {
+            "response": f"🎲 You rolled a {roll}. Your bet '{prediction_str}' was incorrect. You lost {wager} coins. The dice gods are fickle today! 😔",
+            "result": "lose", "rolled": roll, "bet": prediction_str, "wager": wager, "new_balance": new_balance
+        }
+    return None
+
+
+def bench(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    return seconds / number * 1e6
+
+
+if __name__ == '__main__':
+    ledger = MemoryLedger()
+    number = 20000
+    print(f"{'command':<14}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for text in ["!hunt", "!fish", "!dice 3> 10", "hello there"]:
+        before = bench(text, lambda: legacy_dispatch(ledger, "bench", text), number)
+        after = bench(text, lambda: commands.dispatch(ledger, "bench", text), number)
+        print(f"{text:<14}{before:>14.2f}{after:>14.2f}{before / after:>9.1f}x")
+
+    # Raw sampling cost of the fishing table
+    weights = [item["rarity"] for item in commands.FISHING_LOOT]
+    choices = bench("choices", lambda: random.choices(commands.FISHING_LOOT, weights=weights, k=1)[0], number)
+    sampler = bench("sampler", commands.FISHING_SAMPLER.sample, number)
+    print(f"{'fish sampling':<14}{choices:>14.2f}{sampler:>14.2f}{choices / sampler:>9.1f}x")
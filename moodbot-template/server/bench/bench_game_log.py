@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+# Costs of the game event log and the leaderboards built on it:
+#   request path  - Ledger.settle() with and without an event log attached (SQLite commit included)
+#   writer        - events/s the background writer encodes and appends, which it does off the
+#                   request threads (but under the same GIL)
+#   leaderboards  - keeping the richest-players board current as balances change, with
+#                   RankedSet vs sorting every balance per query, at 100k players
+#   replay        - rebuilding balances from a 1M-event log, one json.loads per line vs
+#                   game_log.replay, which only parses the leading user and coin fields
+# Run from the server directory: python bench/bench_game_log.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_log import EventLog, RankedSet, encode_event, game_event, replay  # noqa: E402
+from ledger import Ledger  # noqa: E402
+
+PLAYERS = 100_000
+REPLAY_EVENTS = 1_000_000
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def request_path(directory):
+    # Runs alternate between the two ledgers so drift on the machine hits both alike
+    plain = Ledger(os.path.join(directory, "plain.sqlite3"))
+    logged = Ledger(os.path.join(directory, "logged.sqlite3"), event_log=EventLog(os.path.join(directory, "request.ndjson")))
+    event = game_event("coin", pick="heads", landed="tails")
+    best = {"log off": float("inf"), "log on": float("inf")}
+    for _ in range(5):
+        for label, ledger in (("log off", plain), ("log on", logged)):
+            best[label] = min(best[label], per_call_us(lambda: ledger.settle("bench", 1, 2, event), 2000))
+    return best
+
+
+def random_event(rng, user_id):
+    game = rng.choice(("hunt", "fish", "coin", "dice"))
+    cost = rng.choice((10, 15, 20, 50))
+    payout = rng.choice((0, 0, cost * 2, 40))
+    # Same key order as Ledger._record
+    return {"ts": time.time(), "u": user_id, "c": cost, "p": payout, "b": 100, **game_event(game, item="Bluegill 🔵")}
+
+
+def writer_throughput(directory, count=200_000):
+    rng = random.Random(1)
+    events = [random_event(rng, f"player{rng.randrange(PLAYERS)}") for _ in range(count)]
+    log = EventLog(os.path.join(directory, "writer.ndjson"), flush_interval=3600)
+    started = time.perf_counter()
+    for start in range(0, count, 1000):
+        log.extend(events[start:start + 1000])
+    queued = time.perf_counter() - started
+    log.flush()
+    return count / queued, count / (time.perf_counter() - started)
+
+
+def leaderboard_costs():
+    rng = random.Random(2)
+    balances = {f"player{i}": rng.randrange(0, 10_000) for i in range(PLAYERS)}
+    ranked = RankedSet()
+    for user_id, balance in balances.items():
+        ranked.update(user_id, balance)
+    users = list(balances)
+
+    def ranked_update():
+        user_id = rng.choice(users)
+        balances[user_id] += rng.randrange(-50, 60)
+        ranked.update(user_id, balances[user_id])
+
+    update_us = per_call_us(ranked_update, 20000)
+    top_us = per_call_us(lambda: ranked.top(10), 20000)
+    rank_us = per_call_us(lambda: ranked.rank(rng.choice(users)), 20000)
+    sort_us = per_call_us(lambda: sorted(balances.items(), key=lambda item: item[1], reverse=True)[:10], 20)
+    # Sanity check: both give the same board
+    expected = sorted(balances.items(), key=lambda item: (-item[1], item[0]))[:10]
+    assert ranked.top(10) == expected
+    return update_us, top_us, rank_us, sort_us
+
+
+def write_replay_log(path):
+    rng = random.Random(3)
+    with open(path, "w", encoding="utf-8") as log:
+        batch = []
+        for _ in range(REPLAY_EVENTS):
+            batch.append(encode_event(random_event(rng, f"player{rng.randrange(PLAYERS)}")))
+            if len(batch) == 10000:
+                log.write("\n".join(batch) + "\n")
+                batch = []
+
+
+def replay_per_line(path, starting_coins):
+    balances = {}
+    with open(path, "rb") as log:
+        for line in log:
+            event = json.loads(line)
+            balances[event["u"]] = balances.get(event["u"], starting_coins) + event["p"] - event["c"]
+    return balances
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        results = request_path(directory)
+        print(f"ledger.settle, log off:   {results['log off']:8.1f} us")
+        print(f"ledger.settle, log on:    {results['log on']:8.1f} us "
+              f"({results['log on'] - results['log off']:+.1f} us on the request thread)")
+
+        queued, written = writer_throughput(directory)
+        print(f"writer: {queued:,.0f} events/s queued by requests, {written:,.0f} events/s encoded and written "
+              f"({1e6 / written:.1f} us of writer thread per event)")
+
+        update_us, top_us, rank_us, sort_us = leaderboard_costs()
+        print(f"richest board at {PLAYERS:,} players:")
+        print(f"  RankedSet update {update_us:6.2f} us, top 10 {top_us:6.2f} us, rank of a player {rank_us:6.2f} us")
+        print(f"  sorting every balance for a top 10: {sort_us:,.0f} us")
+
+        path = os.path.join(directory, "replay.ndjson")
+        write_replay_log(path)
+        size_mb = os.path.getsize(path) / 1e6
+        started = time.perf_counter()
+        naive = replay_per_line(path, 100)
+        naive_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        balances, count = replay(path, 100)
+        block_seconds = time.perf_counter() - started
+        assert balances == naive and count == REPLAY_EVENTS
+        print(f"replay of {REPLAY_EVENTS:,} events ({size_mb:.0f} MB):")
+        print(f"  json.loads per line: {naive_seconds:5.2f} s ({REPLAY_EVENTS / naive_seconds:,.0f} events/s)")
+        print(f"  game_log.replay:     {block_seconds:5.2f} s ({REPLAY_EVENTS / block_seconds:,.0f} events/s)")
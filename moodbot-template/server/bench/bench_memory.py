@@ -0,0 +1,84 @@
+import json
+import os
+import random
+import sys
+import time
+
+# Prompt build time and prompt size as one conversation grows to thousands of turns.
+#   full history: every earlier turn is resent (the naive way to give the bot memory)
+#   memory:       conversation.py, recent turns within MOODBOT_MEMORY_TOKENS plus a
+#                 rolling summary of older ones
+# "build" covers assembling the messages and serializing them to the JSON body the
+# OpenAI client sends, since that is what every request pays for.
+# Run from the server directory: python bench/bench_memory.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import build_messages  # noqa: E402
+from conversation import MEMORY_SUMMARY_TOKENS, MEMORY_TOKEN_BUDGET, ConversationMemory, estimate_tokens  # noqa: E402
+
+WORDS = "roast me bro lol my cat ignored me again today and my code has bugs help".split()
+REPLY = "Haha, you really walked in here thinking you'd win today? 😂 Bold move, champ! Keep that energy 👀✨"
+CHECKPOINTS = (10, 100, 1000, 5000)
+
+
+def user_message(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 20))) + rng.choice(".!?")
+
+
+def prompt_size(messages):
+    return sum(estimate_tokens(message["content"]) for message in messages), len(json.dumps(messages))
+
+
+def run(strategy):
+    # Returns (turn, average build seconds since the previous checkpoint, prompt size) per checkpoint.
+    # Each strategy runs on its own so the other's growing heap doesn't slow it down.
+    rng = random.Random(0)
+    rows = []
+    seconds = 0.0
+    window = 0
+    for turn in range(1, CHECKPOINTS[-1] + 1):
+        text = user_message(rng)
+        start = time.perf_counter()
+        messages = strategy(text)
+        seconds += time.perf_counter() - start
+        window += 1
+        if turn in CHECKPOINTS:
+            rows.append((turn, seconds / window, prompt_size(messages)))
+            seconds = 0.0
+            window = 0
+    return rows
+
+
+def full_history_strategy():
+    history = []
+
+    def build(text):
+        messages = build_messages("sarcastic", text, history)
+        json.dumps(messages)
+        history.append({"role": "user", "content": text})
+        history.append({"role": "assistant", "content": REPLY})
+        return messages
+    return build
+
+
+def memory_strategy():
+    memory = ConversationMemory()
+
+    def build(text):
+        messages = build_messages("sarcastic", text, memory.context("bench", "sarcastic"))
+        json.dumps(messages)
+        memory.record("bench", "sarcastic", text, REPLY)
+        return messages
+    return build
+
+
+if __name__ == '__main__':
+    naive_rows = run(full_history_strategy())
+    memory_rows = run(memory_strategy())
+    print(f"budget: {MEMORY_TOKEN_BUDGET} tokens of recent turns + {MEMORY_SUMMARY_TOKENS} of summary")
+    print(f"{'turn':>6} | {'full history: us':>16}{'tokens':>9}{'bytes':>10} | {'memory: us':>11}{'tokens':>9}{'bytes':>10}")
+    for (turn, naive_time, (naive_tokens, naive_bytes)), (_, memory_time, (memory_tokens, memory_bytes)) in zip(naive_rows, memory_rows):
+        print(f"{turn:>6} | {naive_time * 1e6:>16.1f}{naive_tokens:>9}{naive_bytes:>10} | "
+              f"{memory_time * 1e6:>11.1f}{memory_tokens:>9}{memory_bytes:>10}")
+    print("(us: average per turn since the previous row; tokens and bytes: the prompt at that turn)")
@@ -0,0 +1,45 @@
+import os
+import sys
+import timeit
+
+# Cost of the request instrumentation: the metrics work one game command does
+# (stage timer, three marks, request histogram and counter), next to the whole
+# request through the Flask test client, and the time to render /metrics.
+# Run from the server directory: python bench/bench_metrics.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+
+
+def instrument_one_request():
+    timer = metrics.StageTimer()
+    timer.mark("parse")
+    timer.mark("command")
+    timer.mark("serialize")
+    metrics.record_request("/bench", 200, timer.finish("/bench"), "!coin", "")
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault("MOODBOT_LEDGER_PATH", os.path.join(directory, "bench.sqlite3"))
+        import app
+
+        client = app.app.test_client()
+
+        def coin_request():
+            client.post("/chat", json={"input": "!coin heads 1", "user_id": "bench"}).close()
+
+        app.ledger.credit("bench", 10 ** 9)
+        overhead = per_call_us(instrument_one_request, 50000)
+        request = per_call_us(coin_request, 500)
+        print(f"metrics per request:      {overhead:8.2f} us")
+        print(f"whole !coin request:      {request:8.2f} us ({overhead / request:.1%} instrumentation)")
+        render = per_call_us(lambda: metrics.render(), 200)
+        print(f"render /metrics:          {render:8.2f} us")
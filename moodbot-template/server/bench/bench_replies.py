@@ -0,0 +1,150 @@
+import contextlib
+import os
+import sys
+import tempfile
+import timeit
+
+# Cost of building and serializing game replies, before and after replies.py:
+#   before  - f-string replies rendered per round and sent through jsonify (sorted keys, \u escapes)
+#   after   - reply text rendered once per outcome or filled into a prebuilt template, sent
+#             through the lean encoder
+#   compact - the same, without the text ({"compact": true})
+# The "before" handlers are today's !fish and !dice (same parsing, draws and ledger calls)
+# with only the reply built the old way, and they run through the same /chat view, so the
+# numbers differ by the reply alone. First the reply alone (render + serialize), then whole
+# requests through Flask in this process (requests/s, no sockets), once with the SQLite
+# ledger the app uses and once with an in-memory ledger so the reply is a bigger share.
+# Run from the server directory: python bench/bench_replies.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ["MOODBOT_LEDGER_PATH"] = os.path.join(directory, "bench.sqlite3")
+os.environ["MOODBOT_GAME_LOG"] = os.path.join(directory, "bench_events.ndjson")
+
+import app  # noqa: E402
+import commands  # noqa: E402
+from bench_dispatch import MemoryLedger  # noqa: E402
+from flask import jsonify  # noqa: E402
+from game_log import game_event  # noqa: E402
+from replies import compact, encode_reply  # noqa: E402
+
+USER_ID = "bench"
+COMMANDS = ["!fish", "!dice 3> 1"]
+
+
+def legacy_fish(ledger, user_id, args):
+    # commands.fish() before replies.py, single casts only
+    number, caught_item = commands.FISHING_DRAWS.draw()
+    reward = caught_item["reward"]
+    new_balance = ledger.settle(user_id, commands.FISHING_COST, reward, game_event("fish", draws=[commands.FISHING_DRAWS.seed, number], item=caught_item["name"], tier=caught_item["tier"]))
+    return {
+        "response": f"🎣 You cast your line with expert precision and caught a **{caught_item['name']}**! {caught_item['description']} You gained {reward} coins! 💰 (Cost: {commands.FISHING_COST} coins)",
+        "result": "success" if reward > 0 else "nothing",
+        "tier": caught_item["tier"],
+        "item": caught_item["name"],
+        "new_balance": new_balance
+    }
+
+
+def legacy_dice(ledger, user_id, args):
+    # commands.dice() before replies.py, valid bets only
+    prediction_str = args[0]
+    wager = int(args[1])
+    match = commands.DICE_PREDICTION.match(prediction_str)
+    target = int(match.group(1))
+    bet_operator = match.group(2) or "="
+    number, roll = commands.DICE_DRAWS.draw()
+    reward = commands.dice_reward(bet_operator, target, roll, wager)
+    new_balance = ledger.settle(user_id, wager, reward, game_event("dice", draws=[commands.DICE_DRAWS.seed, number], bet=prediction_str, rolled=roll))
+    if reward:
+        return {
+            "response": f"🎲✨ AMAZING! You rolled a {roll}! Your bet '{prediction_str}' was correct. You won {reward} coins! Lady Luck smiles upon you! 🍀",
+            "result": "win", "rolled": roll, "bet": prediction_str, "wager": wager, "new_balance": new_balance
+        }
+    return {
+        "response": f"🎲 You rolled a {roll}. Your bet '{prediction_str}' was incorrect. You lost {wager} coins. The dice gods are fickle today! 😔",
+        "result": "lose", "rolled": roll, "bet": prediction_str, "wager": wager, "new_balance": new_balance
+    }
+
+
+@contextlib.contextmanager
+def legacy_replies():
+    # Swap in the old handlers and jsonify for the duration of a "before" run
+    handlers = {"!fish": commands.COMMANDS["!fish"], "!dice": commands.COMMANDS["!dice"]}
+    game_reply = app.game_reply
+    commands.COMMANDS["!fish"] = (legacy_fish, True)
+    commands.COMMANDS["!dice"] = (legacy_dice, True)
+    app.game_reply = lambda payload, compact_reply=False: jsonify(payload)
+    try:
+        yield
+    finally:
+        commands.COMMANDS.update(handlers)
+        app.game_reply = game_reply
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def reply_costs(text):
+    # Dispatch + render + serialize one reply, with the ledger out of the way
+    ledger = MemoryLedger()
+    with app.app.app_context():
+        with legacy_replies():
+            before = per_call_us(lambda: app.game_reply(commands.dispatch(ledger, USER_ID, text)), 5000)
+        return {
+            "before": before,
+            "after": per_call_us(lambda: app.game_reply(commands.dispatch(ledger, USER_ID, text)), 5000),
+            "compact": per_call_us(lambda: app.game_reply(commands.dispatch(ledger, USER_ID, text), True), 5000),
+        }
+
+
+def request_rates(client, text, rounds=40, number=50):
+    # Runs alternate between the three paths so drift on the machine hits all of them alike,
+    # and each keeps its best short run: a whole request is a few hundred us, so one pause of
+    # the machine in a long run would outweigh the difference being measured
+    bodies = {
+        "before": {"input": text, "user_id": USER_ID},
+        "after": {"input": text, "user_id": USER_ID},
+        "compact": {"input": text, "user_id": USER_ID, "compact": True},
+    }
+    best = dict.fromkeys(bodies, float("inf"))
+    sizes = {}
+    for _ in range(rounds):
+        for label, body in bodies.items():
+            with legacy_replies() if label == "before" else contextlib.nullcontext():
+                response = client.post("/chat", json=body)
+                sizes[label] = len(response.data)
+                response.close()
+                seconds = min(timeit.repeat(lambda: client.post("/chat", json=body).close(), number=number, repeat=1))
+            best[label] = min(best[label], seconds / number)
+    return {label: 1 / seconds for label, seconds in best.items()}, sizes
+
+
+def print_rates(title, client):
+    print(title)
+    for text in COMMANDS:
+        rates, sizes = request_rates(client, text)
+        print(f"  {text:<12} before {rates['before']:7,.0f} req/s ({sizes['before']} B)"
+              f"   after {rates['after']:7,.0f} req/s ({rates['after'] / rates['before'] - 1:+.1%}, {sizes['after']} B)"
+              f"   compact {rates['compact']:7,.0f} req/s ({rates['compact'] / rates['before'] - 1:+.1%}, {sizes['compact']} B)")
+
+
+if __name__ == '__main__':
+    # Same payloads both ways, minus the text in compact mode
+    sample = commands.dispatch(MemoryLedger(), USER_ID, "!fish")
+    assert compact(sample).keys() == sample.keys() - {"response"}
+    assert encode_reply(sample).count("🎣") == 1
+
+    print("dispatch + render + serialize one reply (in-memory ledger)")
+    for text in COMMANDS:
+        costs = reply_costs(text)
+        print(f"  {text:<12} before {costs['before']:6.2f} us   after {costs['after']:6.2f} us"
+              f"   compact {costs['compact']:6.2f} us")
+
+    client = app.app.test_client()
+    app.ledger.credit(USER_ID, 10 ** 9)
+    print_rates("whole requests, SQLite ledger", client)
+    app.ledger = MemoryLedger()
+    print_rates("whole requests, in-memory ledger", client)
@@ -0,0 +1,80 @@
+import os
+import random
+import sys
+import timeit
+
+import numpy as np
+
+# Draw cost of the pre-generated outcome streams (game_rng.py) against the global random
+# module the games used before:
+#   per round - what one round of each game pays for its randomness: random.* vs taking the
+#               next pre-generated outcome from the game's stream and building the [seed, draw]
+#               origin its event records. Both are timed alternately, many times over, and the
+#               best run of each is kept, which keeps a noisy machine from favouring either
+#   buffers   - draws/s for buffer sizes from 64 to 4096, with the next buffer made by the
+#               background thread and with every buffer made inline
+#   bulk      - 1000 draws for "!fish x1000": the shared NumPy generator vs the fish stream
+# Run from the server directory: python bench/bench_rng.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import (FISHING_SAMPLER, HUNTING_EVENTS, cards_from, catches_from, die_rolls_from,  # noqa: E402
+                      hunting_events_from)
+from game_rng import GameRng  # noqa: E402
+
+DRAWS = 50_000
+RUNS = 30
+
+
+def per_call_ns(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+
+def per_round(rng):
+    def stream_round(stream):
+        def round_():
+            number, outcome = stream.draw()
+            return outcome, [stream.seed, number]
+        return round_
+
+    rounds = [
+        ("!dice roll", lambda: random.randint(1, 6), rng.stream("dice", die_rolls_from)),
+        ("!hunt event", lambda: random.choice(HUNTING_EVENTS), rng.stream("hunt", hunting_events_from)),
+        ("!fish catch", FISHING_SAMPLER.sample, rng.stream("fish", catches_from)),
+        ("blackjack card", lambda: random.randint(1, 11), rng.stream("blackjack", cards_from)),
+    ]
+    rows = []
+    for label, before, stream in rounds:
+        after = stream_round(stream)
+        best_before = best_after = float("inf")
+        for _ in range(RUNS):
+            best_before = min(best_before, timeit.timeit(before, number=DRAWS))
+            best_after = min(best_after, timeit.timeit(after, number=DRAWS))
+        rows.append((label, best_before / DRAWS * 1e9, best_after / DRAWS * 1e9))
+    return rows
+
+
+def buffer_rate(buffer_size, background):
+    draw = GameRng(seed=1, buffer_size=buffer_size, background=background).stream("dice", die_rolls_from).draw
+    return 1e9 / per_call_ns(draw, 4 * DRAWS)
+
+
+def bulk_draws(rng):
+    np_rng = np.random.default_rng()
+    stream = rng.stream("bulk", catches_from)
+    return (per_call_ns(lambda: FISHING_SAMPLER.sample_indices(1000, np_rng), 2000) / 1000,
+            per_call_ns(lambda: FISHING_SAMPLER.pick_indices(stream.draw_many(1000)[0]), 2000) / 1000)
+
+
+if __name__ == '__main__':
+    rng = GameRng(seed=1)
+    print(f"one round{'':<19}{'random (ns)':>12}{'stream (ns)':>13}{'speedup':>9}")
+    for label, before, after in per_round(rng):
+        print(f"  {label:<26}{before:>12.0f}{after:>13.0f}{before / after:>8.1f}x")
+
+    print("draws/s by buffer size: next buffer made in the background / inline")
+    for buffer_size in (64, 256, 1024, 4096):
+        print(f"  {buffer_size:>5}  {buffer_rate(buffer_size, True) / 1e6:5.2f} / {buffer_rate(buffer_size, False) / 1e6:5.2f} M draws/s")
+
+    fresh, buffered = bulk_draws(rng)
+    print(f"1000 weighted catches: shared NumPy generator {fresh:5.1f} ns each, fish stream {buffered:5.1f} ns each")
@@ -0,0 +1,100 @@
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+# Tail latency of /chat with one model vs the model router, against simulated backends.
+# The fake upstream stands in for several models at once (per-model latency and faults):
+#   flaky  - fast, but 5% of calls stall for 1.5 s (a busy free model); still the best on average
+#   steady - slower, no stalls
+#   down   - fails every call
+# Scenarios:
+#   slow tail  - flaky alone (what the app did before), flaky+steady routed, and routed with hedging
+#   outage     - down alone vs down+steady routed (fallback, then routing around it)
+# The Flask app runs on a threaded werkzeug server in this process; each run installs its own
+# ModelRouter and UpstreamGuard. Runs last seconds rather than minutes, so the router probes
+# passed-over models every second instead of every LLM_ROUTER_PROBE_INTERVAL.
+# Run from the server directory: python bench/bench_router.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_upstream import start_fake_upstream  # noqa: E402
+
+MODELS = {
+    "flaky": {"ttft": 0.06, "slow_rate": 0.05, "slow_delay": 1.5},
+    "steady": {"ttft": 0.25},
+    "down": {"ttft": 0.02, "failure_rate": 1.0},
+}
+REQUESTS = 400
+# The first requests fill the router's latency windows and aren't counted
+WARMUP = 50
+CONCURRENCY = 8
+
+upstream = start_fake_upstream(token_delay=0.0, models=MODELS)
+os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{upstream.server_port}/v1"
+os.environ["MOODBOT_LEDGER_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+# Every chat is its own upstream call, and failures reach the router without client retries
+os.environ["MOODBOT_MEMORY_TOKENS"] = "0"
+os.environ["LLM_MAX_RETRIES"] = "0"
+
+import app  # noqa: E402
+from llm_guard import UpstreamGuard  # noqa: E402
+from model_router import ModelRouter  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+
+def start_app():
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def send_chats(base_url, count):
+    # Returns [(seconds, failed)] in send order: an error reply, or a 503 once the circuit breaker opens
+    with httpx.Client(base_url=base_url, timeout=30, limits=httpx.Limits(max_connections=CONCURRENCY)) as client:
+        def send(index):
+            start = time.perf_counter()
+            response = client.post("/chat", json={"input": f"roast number {index}", "user_id": f"bench{index % 50}"})
+            failed = response.status_code != 200 or response.json()["response"].startswith("⚠️")
+            return time.perf_counter() - start, failed
+
+        with ThreadPoolExecutor(CONCURRENCY) as pool:
+            return list(pool.map(send, range(count)))
+
+
+def percentile(ordered, share):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def run(base_url, label, models, hedge=False):
+    app.llm_guard = UpstreamGuard()
+    app.llm_router = ModelRouter(models=models, hedge=hedge, mode_models={}, mode_max_tokens={}, probe_interval=1.0)
+    before = dict(upstream.model_requests)
+    results = send_chats(base_url, REQUESTS)[WARMUP:]
+    # Let losing hedged calls finish before counting upstream calls
+    time.sleep(1.6)
+    ordered = sorted(seconds for seconds, _ in results)
+    errors = sum(error for _, error in results)
+    calls = {model: upstream.model_requests.get(model, 0) - before.get(model, 0) for model in models}
+    stats = app.llm_router.stats()
+    print(f"  {label:<22} p50 {percentile(ordered, 0.5) * 1000:5.0f}  p95 {percentile(ordered, 0.95) * 1000:5.0f}"
+          f"  p99 {percentile(ordered, 0.99) * 1000:5.0f}  max {ordered[-1] * 1000:5.0f} ms"
+          f"  failed {errors:>3}  calls {calls}  hedges {stats['hedges']} fallbacks {stats['fallbacks']}")
+
+
+if __name__ == '__main__':
+    base_url = start_app()
+    print(f"{REQUESTS - WARMUP} chats per run after {WARMUP} warm-up chats, {CONCURRENCY} at a time")
+    print("slow tail (flaky: 60 ms, 5% stall 1.5 s; steady: 250 ms)")
+    run(base_url, "flaky only", ["flaky"])
+    run(base_url, "router", ["flaky", "steady"])
+    run(base_url, "router + hedging", ["flaky", "steady"], hedge=True)
+    print("outage (down: every call fails)")
+    run(base_url, "down only", ["down"])
+    run(base_url, "router", ["down", "steady"])
@@ -0,0 +1,62 @@
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+from werkzeug.serving import make_server
+
+# Benchmarks time-to-first-byte and total latency of /chat vs /chat/stream against the local fake upstream.
+# Run from the server directory: python bench/bench_stream.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_upstream import start_fake_upstream  # noqa: E402
+
+
+def timed_request(client, url, payload):
+    # Returns (ttfb, total) in seconds; ttfb is measured up to the first body byte
+    start = time.perf_counter()
+    ttfb = None
+    with client.stream("POST", url, json=payload) as response:
+        for chunk in response.iter_bytes():
+            if ttfb is None and chunk:
+                ttfb = time.perf_counter() - start
+    return ttfb, time.perf_counter() - start
+
+
+def summarize(name, samples):
+    ttfbs = [s[0] for s in samples]
+    totals = [s[1] for s in samples]
+    print(f"{name:<14} ttfb median {statistics.median(ttfbs) * 1000:8.1f} ms | total median {statistics.median(totals) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark streaming vs blocking chat replies")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    upstream = start_fake_upstream(ttft=args.ttft, token_delay=args.token_delay)
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{upstream.server_port}"
+
+    from app import app  # noqa: E402
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    payload = {"input": "roast me", "mode": "sarcastic"}
+    with httpx.Client(timeout=30) as client:
+        blocking = [timed_request(client, f"{base}/chat", payload) for _ in range(args.requests)]
+        streaming = [timed_request(client, f"{base}/chat/stream", payload) for _ in range(args.requests)]
+
+    summarize("/chat", blocking)
+    summarize("/chat/stream", streaming)
+    server.shutdown()
+    upstream.shutdown()
@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Load test comparing the sync Flask path (gunicorn sync workers) with the async ASGI mode
+# (asgi.py on uvicorn workers) against a deliberately slow fake upstream.
+# A mix of chat messages and cheap game commands is fired concurrently; the report shows
+# requests/sec and p50/p99 latency for each kind of request.
+# Run from the server directory: python bench/load_test.py
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(process, port, name):
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{name} did not start")
+
+
+def start_upstream(port, latency):
+    # The stub runs in its own process so it doesn't compete with the load generator for the GIL
+    command = [sys.executable, "fake_upstream.py", "--port", str(port), "--ttft", str(latency), "--token-delay", "0"]
+    process = subprocess.Popen(command, cwd=SERVER_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return wait_for_port(process, port, "fake upstream")
+
+
+def start_server(mode, port, workers, upstream_url):
+    # Every virtual user sends the same prompt; turn off coalescing so each chat really waits on the upstream
+    env = {**os.environ, "OPENROUTER_BASE_URL": upstream_url, "LLM_SINGLE_FLIGHT": "0"}
+    if mode == "sync":
+        command = ["gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"]
+    else:
+        command = ["gunicorn", "-w", str(workers), "-k", "uvicorn.workers.UvicornWorker",
+                   "-b", f"127.0.0.1:{port}", "asgi:application"]
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(process, port, f"{mode} server")
+    # Gunicorn binds before its workers finish importing the app, so wait until they answer too
+    deadline = time.time() + 30
+    answered = 0
+    while answered < workers * 4 and time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats/llm-pool", timeout=1)
+            answered += 1
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    return process
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_load(base_url, duration, concurrency, chat_share):
+    latencies = {"chat": [], "command": []}
+    stop_at = time.perf_counter() + duration
+
+    async def user(index, client):
+        count = 0
+        while time.perf_counter() < stop_at:
+            # Every `chat_share`-th request of a virtual user is an LLM chat, the rest are game commands
+            kind = "chat" if (index + count) % chat_share == 0 else "command"
+            payload = {"input": "roast me", "mode": "sarcastic"} if kind == "chat" else {"input": "!daily"}
+            start = time.perf_counter()
+            try:
+                await client.post(f"{base_url}/chat", json=payload)
+                latencies[kind].append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                pass
+            count += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i, client) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def report(mode, latencies, elapsed):
+    total = sum(len(v) for v in latencies.values())
+    print(f"[{mode}] {total / elapsed:7.1f} req/s overall")
+    for kind, values in latencies.items():
+        print(f"    {kind:<8} n={len(values):<6} p50 {percentile(values, 0.5) * 1000:8.1f} ms"
+              f"   p99 {percentile(values, 0.99) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sync vs async serving load test with a slow stubbed upstream")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--upstream-latency", type=float, default=1.0)
+    parser.add_argument("--chat-share", type=int, default=4, help="one in N requests is an LLM chat")
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = start_upstream(upstream_port, args.upstream_latency)
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+
+    for mode in args.modes.split(","):
+        port = free_port()
+        process = start_server(mode, port, args.workers, upstream_url)
+        try:
+            latencies, elapsed = asyncio.run(
+                run_load(f"http://127.0.0.1:{port}", args.duration, args.concurrency, args.chat_share))
+            report(mode, latencies, elapsed)
+        finally:
+            process.terminate()
+            process.wait()
+    upstream.terminate()
+    upstream.wait()
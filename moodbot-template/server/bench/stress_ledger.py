@@ -0,0 +1,125 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Concurrency stress test for the SQLite ledger: many threads in several processes hammer
+# a small set of players with wagers, payouts, daily claims and blackjack games.
+# Every successful operation records its net coin change; at the end the sum of all
+# balances must equal the starting supply plus that net change - no coins created or lost.
+# Every process also appends to one shared game event log, and replaying that log must
+# give back every player's balance. Finally, wagers too large for SQLite's integers must be
+# turned down like any other wager the player can't afford.
+# Run from the server directory: python bench/stress_ledger.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import commands  # noqa: E402
+from game_log import EventLog, compare_with_ledger, replay  # noqa: E402
+from ledger import Ledger, STARTING_COINS  # noqa: E402
+
+
+def worker(path, event_log, users, operations, seed, results):
+    ledger = Ledger(path, event_log=event_log)
+    rng = random.Random(seed)
+    net = 0
+    applied = 0
+    for _ in range(operations):
+        user_id = rng.choice(users)
+        roll = rng.random()
+        if roll < 0.7:
+            cost = rng.randint(1, 40)
+            payout = rng.choice([0, 0, cost, cost * 2, cost * 5])
+            if ledger.settle(user_id, cost, payout) is not None:
+                net += payout - cost
+                applied += 1
+        elif roll < 0.8:
+            if ledger.claim_daily(user_id, f"day-{rng.randint(0, 3)}", 50) is not None:
+                net += 50
+                applied += 1
+        elif roll < 0.9:
+            if ledger.start_blackjack(user_id, 15, {"player_cards": [10, 5], "dealer_cards": [7],
+                                                    "coins_wagered": 15, "game_over": False}) is not None:
+                net -= 15
+                applied += 1
+        else:
+            payout = rng.choice([0, 15, 30])
+            if ledger.finish_blackjack(user_id, payout) is not None:
+                net += payout
+                applied += 1
+    results.append((net, applied))
+
+
+def run_process(path, log_path, users, threads, operations, seed, queue):
+    results = []
+    event_log = EventLog(log_path)
+    pool = [threading.Thread(target=worker, args=(path, event_log, users, operations, seed * 1000 + i, results))
+            for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    # Child processes exit without running atexit handlers, so flush explicitly
+    event_log.flush()
+    queue.put((sum(r[0] for r in results), sum(r[1] for r in results)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ledger concurrency stress test")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=500, help="operations per thread")
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress_ledger.sqlite3")
+        log_path = os.path.join(tmp, "stress_events.ndjson")
+        users = [f"player{i}" for i in range(args.users)]
+        ledger = Ledger(path)
+        for user_id in users:
+            ledger.credit(user_id, 0)
+        initial = ledger.total_coins()
+        assert initial == STARTING_COINS * len(users)
+
+        queue = multiprocessing.Queue()
+        start = time.perf_counter()
+        processes = [multiprocessing.Process(target=run_process,
+                                             args=(path, log_path, users, args.threads, args.operations, p, queue))
+                     for p in range(args.processes)]
+        for process in processes:
+            process.start()
+        outcomes = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        net = sum(o[0] for o in outcomes)
+        applied = sum(o[1] for o in outcomes)
+        attempted = args.processes * args.threads * args.operations
+        final = ledger.total_coins()
+        lowest = ledger._connect().execute("SELECT MIN(coins) FROM users").fetchone()[0]
+
+        print(f"{attempted} operations ({applied} applied) in {elapsed:.2f}s -> {attempted / elapsed:,.0f} ops/s")
+        print(f"coin supply: initial {initial} + net {net} = expected {initial + net}, actual {final}")
+        print(f"lowest balance: {lowest}")
+        assert final == initial + net, "coins were created or lost"
+        assert lowest >= 0, "a balance went negative"
+        print("OK: no coins created or lost")
+
+        balances, events = replay(log_path, STARTING_COINS)
+        mismatches = compare_with_ledger(balances, path, STARTING_COINS)
+        print(f"event log: {events} events, {len(mismatches)} players whose replayed balance differs")
+        assert events == applied, "the event log is missing events"
+        assert not mismatches, "replaying the event log doesn't give the ledger balances"
+        print("OK: event log replays to the ledger")
+
+        before = ledger.balance(users[0])
+        for text in ("!coin heads 99999999999999999999999", "!dice 3> 99999999999999999999999"):
+            reply = commands.dispatch(ledger, users[0], text)
+            assert reply["rejected"] and reply["new_balance"] == before, f"{text!r} wasn't turned down"
+        print("OK: oversized wagers are rejected")
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+
+# Replay checks for the pre-generated random streams (game_rng.py):
+#   streams  - threads make single and bulk draws from three streams with tiny buffers (so
+#              buffers run out, and the background thread refills them, all the time). Every
+#              draw must come back identical from replay_draws(*origin, count), and per stream
+#              the draws plus the unused rest of the current and spare buffers must cover the
+#              output of its buffer generator, and its bulk draws that of its bulk generator,
+#              exactly once.
+#   games    - the real game commands, from many threads, against a SQLite ledger and a game
+#              log. Every logged hunt, fish, coin, dice and blackjack round must come back with
+#              the same payout and details from commands.replay_outcome().
+#   sessions - the same commands in the same order with the same MOODBOT_RNG_SEED must give
+#              the same replies.
+# Run from the server directory: python bench/stress_rng_replay.py
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import commands  # noqa: E402
+from game_log import EventLog  # noqa: E402
+from game_rng import GameRng, replay_draws  # noqa: E402
+from ledger import Ledger  # noqa: E402
+
+GAME_INPUTS = ["!fish", "!hunt", "!coin heads 5", "!coin tails 3", "!dice 3> 4", "!dice 5 2", "!dice 2< 6",
+               "!fish x25", "!hunt x40", "!blackjack", "!blackjack hit", "!blackjack stand"]
+
+
+def floats(values):
+    return values.tolist()
+
+
+def check_streams(threads, draws):
+    game_rng = GameRng(seed=7, buffer_size=16)
+    streams = [game_rng.stream(name, floats) for name in ("a", "b", "c")]
+    recorded = []
+
+    def worker(index):
+        rng = random.Random(index)
+        for _ in range(draws):
+            stream = rng.choice(streams)
+            if rng.random() < 0.2:
+                values, (seed, first) = stream.draw_many(rng.randint(1, 50))
+                recorded.append((stream, seed, first, values.tolist()))
+            else:
+                number, value = stream.draw()
+                recorded.append((stream, stream.seed, number, [value]))
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    mismatches = sum(replay_draws(seed, first, len(values)).tolist() != values for _, seed, first, values in recorded)
+    # Per generator, the draws' [first, end) ranges (and for the buffered one, the buffers'
+    # unused rest) must tile 0..position without gaps or overlaps
+    overlaps = 0
+    for stream in streams:
+        for seed, end, buffers in ((stream.seed, stream._position, (stream._draws, stream._spare or ())),
+                                   (stream.bulk_seed, stream._bulk_position, ())):
+            ranges = [(first, first + len(values)) for _, used, first, values in recorded if used == seed]
+            for buffer in buffers:
+                ranges.extend((number, number + 1) for number, _ in buffer)
+            ranges.sort()
+            overlaps += ranges[0][0] != 0 or ranges[-1][1] != end
+            overlaps += sum(previous[1] != current[0] for previous, current in zip(ranges, ranges[1:]))
+    return len(recorded), mismatches, overlaps, game_rng.stats()
+
+
+def reset_rng(seed=None, buffer_size=None):
+    # The game streams live in commands.py, so reseed them in place
+    commands.game_rng.seed = seed
+    commands.game_rng.buffer_size = buffer_size or commands.game_rng.buffer_size
+    commands.game_rng.reset()
+
+
+def check_games(directory, threads, rounds, users):
+    ledger_path = os.path.join(directory, "games.sqlite3")
+    log_path = os.path.join(directory, "games.ndjson")
+    event_log = EventLog(log_path)
+    reset_rng(buffer_size=32)
+    setup = Ledger(ledger_path)
+    for i in range(users):
+        setup.credit(f"player{i}", 100_000)
+
+    def worker(index):
+        ledger = Ledger(ledger_path, event_log=event_log)
+        rng = random.Random(index)
+        for _ in range(rounds):
+            commands.dispatch(ledger, f"player{rng.randrange(users)}", rng.choice(GAME_INPUTS))
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    event_log.flush()
+
+    with open(log_path, encoding="utf-8") as log:
+        events = [json.loads(line) for line in log]
+    replayed = mismatches = blackjack = 0
+    for event in events:
+        if event["g"] not in ("hunt", "fish", "coin", "dice", "blackjack"):
+            continue
+        replayed += 1
+        blackjack += event["g"] == "blackjack"
+        outcome = commands.replay_outcome(event) if "d" in event else None
+        logged = {"p": event["p"], **({"x": event["x"]} if "x" in event else {})}
+        mismatches += outcome != logged
+    return len(events), replayed, mismatches, blackjack
+
+
+def run_session(directory, name, seed, inputs):
+    reset_rng(seed)
+    ledger = Ledger(os.path.join(directory, f"{name}.sqlite3"))
+    for i in range(5):
+        ledger.credit(f"player{i}", 100_000)
+    return [commands.dispatch(ledger, user_id, text) for user_id, text in inputs]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay checks for the pre-generated random streams")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=2000, help="draws (and a quarter as many game rounds) per thread")
+    parser.add_argument("--users", type=int, default=12)
+    args = parser.parse_args()
+
+    count, mismatches, overlaps, stats = check_streams(args.threads, args.rounds)
+    print(f"streams: {count} draws replayed, {mismatches} differ, {overlaps} gaps or overlaps "
+          f"({stats['buffers']} buffers, {stats['inline_refills']} made inline, {stats['bulk_draws']} bulk draws)")
+    assert not mismatches, "a replayed draw came out different"
+    assert not overlaps, "draws on one stream skipped or repeated values"
+
+    with tempfile.TemporaryDirectory() as directory:
+        events, replayed, mismatches, blackjack = check_games(directory, args.threads, args.rounds // 4, args.users)
+        print(f"games: {events} events, {replayed} rounds replayed, {mismatches} differ "
+              f"({blackjack} of them blackjack deals and finished hands)")
+        assert replayed and not mismatches, "a replayed game round came out differently"
+
+        rng = random.Random(3)
+        inputs = [(f"player{rng.randrange(5)}", rng.choice(GAME_INPUTS)) for _ in range(500)]
+        first = run_session(directory, "first", 42, inputs)
+        second = run_session(directory, "second", 42, inputs)
+        other = run_session(directory, "other", 43, inputs)
+        print(f"sessions: seed 42 twice -> {'identical' if first == second else 'DIFFERENT'} replies, "
+              f"seed 43 -> {sum(a != b for a, b in zip(first, other))} of {len(inputs)} replies differ")
+        assert first == second, "the same seed gave different outcomes"
+    print("OK: every round replays from (seed, draw)")
@@ -0,0 +1,181 @@
+import numpy as np
+
+# Blackjack engine for MoodBot. Cards are drawn with randint(1, 11): 1 is an ace
+# (worth 11, or 1 if the hand would bust), 11 is a face card worth 10.
+#
+# Hands keep their running total and the number of aces still counted as 11
+# ("soft aces"), so adding a card and reading the total are O(1) instead of
+# re-walking the card list. The NumPy helpers score thousands of hands at once
+# for the simulator and for the dealer precomputation table.
+
+DEALER_STANDS_ON = 17
+
+
+def calculate_blackjack_value(cards):
+    # Reference scorer for a plain list of cards
+    value = 0
+    ace_count = 0
+    for card in cards:
+        if 1 < card < 11:
+            value += card
+        elif card > 10:
+            value += 10
+        elif card == 1:
+            ace_count += 1
+            value += 11
+    while value > 21 and ace_count > 0:
+        value -= 10
+        ace_count -= 1
+    return value
+
+
+class BlackjackHand:
+    __slots__ = ("cards", "total", "soft_aces")
+
+    def __init__(self, cards=None):
+        # Score the starting cards in one pass (a saved game is rebuilt on every request).
+        # The list is adopted, not copied: it comes straight from the decoded ledger JSON.
+        self.cards = cards = [] if cards is None else cards
+        total = 0
+        soft_aces = 0
+        for card in cards:
+            if card == 1:
+                total += 11
+                soft_aces += 1
+            else:
+                total += 10 if card > 10 else card
+        while total > 21 and soft_aces:
+            total -= 10
+            soft_aces -= 1
+        self.total = total
+        self.soft_aces = soft_aces
+
+    def add(self, card):
+        self.cards.append(card)
+        if card == 1:
+            self.total += 11
+            self.soft_aces += 1
+        else:
+            self.total += 10 if card > 10 else card
+        # Demote soft aces from 11 to 1 until the hand fits
+        while self.total > 21 and self.soft_aces:
+            self.total -= 10
+            self.soft_aces -= 1
+        return card
+
+    @property
+    def busted(self):
+        return self.total > 21
+
+
+class BlackjackGame:
+    # In-progress game state. to_dict()/from_dict() keep the same JSON shape the
+    # ledger has always stored, so games saved before this engine still load.
+    # `draws` holds where each card came from, [player card origins, dealer card origins],
+    # for replaying the game (see commands.py); games saved before it have none.
+    __slots__ = ("player", "dealer", "coins_wagered", "game_over", "draws")
+
+    def __init__(self, player, dealer, coins_wagered, game_over=False, draws=None):
+        self.player = player
+        self.dealer = dealer
+        self.coins_wagered = coins_wagered
+        self.game_over = game_over
+        self.draws = [[], []] if draws is None else draws
+
+    @classmethod
+    def deal(cls, draw, wager):
+        # `draw` returns one random card (e.g. lambda: random.randint(1, 11))
+        return cls(BlackjackHand([draw(), draw()]), BlackjackHand([draw()]), wager)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            BlackjackHand(data["player_cards"]),
+            BlackjackHand(data["dealer_cards"]),
+            data["coins_wagered"],
+            data.get("game_over", False),
+            data.get("draws"),
+        )
+
+    def to_dict(self):
+        return {
+            "player_cards": self.player.cards,
+            "dealer_cards": self.dealer.cards,
+            "coins_wagered": self.coins_wagered,
+            "game_over": self.game_over,
+            "draws": self.draws,
+        }
+
+    def play_dealer(self, draw):
+        while self.dealer.total < DEALER_STANDS_ON:
+            self.dealer.add(draw())
+
+
+# ----------------- NUMPY BATCH SCORING -----------------
+
+def card_values(cards):
+    # Value of each card with aces counted as 11; 0 means "no card" and scores 0
+    return np.where(cards == 1, 11, np.minimum(cards, 10))
+
+
+def add_cards(totals, soft_aces, cards):
+    # Add one card to every hand at once (vectorized BlackjackHand.add).
+    # One card adds at most one ace, so two demotion passes always suffice.
+    totals = totals + card_values(cards)
+    soft_aces = soft_aces + (cards == 1)
+    for _ in range(2):
+        demote = (totals > 21) & (soft_aces > 0)
+        totals = totals - 10 * demote
+        soft_aces = soft_aces - demote
+    return totals, soft_aces
+
+
+def score_hands(cards):
+    # Score a (hands, max_cards) array of cards padded with zeros.
+    # Aces are counted as 11 and then demoted in bulk, like calculate_blackjack_value.
+    cards = np.asarray(cards)
+    totals = card_values(cards).sum(axis=1)
+    aces = (cards == 1).sum(axis=1)
+    demotions = np.clip(-(-(totals - 21) // 10), 0, aces)
+    return totals - 10 * demotions
+
+
+def dealer_final_totals(rng, upcards):
+    # Play out the dealer's hand for every upcard in the array; returns the final totals
+    zeros = np.zeros(len(upcards), dtype=np.int64)
+    totals, soft_aces = add_cards(zeros, zeros, np.asarray(upcards))
+    drawing = totals < DEALER_STANDS_ON
+    while drawing.any():
+        totals, soft_aces = add_cards(totals, soft_aces, np.where(drawing, rng.integers(1, 12, len(upcards)), 0))
+        drawing &= totals < DEALER_STANDS_ON
+    return totals
+
+
+def dealer_outcome_table(rng=None, hands_per_upcard=200_000):
+    # Probability of each dealer result (17..21 or bust) for each upcard 1..11,
+    # estimated from one batched simulation. Returns {upcard: {result: probability}}.
+    rng = rng or np.random.default_rng()
+    upcards = np.repeat(np.arange(1, 12), hands_per_upcard)
+    finals = dealer_final_totals(rng, upcards).reshape(11, hands_per_upcard)
+    table = {}
+    for index, upcard in enumerate(range(1, 12)):
+        # Every bust total is folded into bucket 22
+        counts = np.bincount(np.minimum(finals[index], 22), minlength=23) / hands_per_upcard
+        outcomes = {total: float(counts[total]) for total in range(DEALER_STANDS_ON, 22)}
+        outcomes["bust"] = float(counts[22])
+        table[upcard] = outcomes
+    return table
+
+
+def stand_ev_table(dealer_table):
+    # Expected net result (in wagers) of standing on each player total 4..21 against each upcard,
+    # with the game's payouts: win pays 2x the wager, a tie returns it, a loss keeps it
+    table = {}
+    for upcard, outcomes in dealer_table.items():
+        row = {}
+        for player_total in range(4, 22):
+            win = outcomes["bust"] + sum(p for total, p in outcomes.items() if total != "bust" and total < player_total)
+            tie = outcomes.get(player_total, 0.0)
+            row[player_total] = win * 2 + tie - 1
+        table[upcard] = row
+    return table
@@ -0,0 +1,669 @@
+import bisect
+import datetime
+import operator
+import random
+import re
+from itertools import accumulate
+
+import numpy as np
+
+from blackjack import BlackjackGame, BlackjackHand
+from game_log import game_event
+from game_rng import GameRng, replay_draws
+from replies import (FISH_REPLY, HUNT_REPLY, blackjack_bust_reply, blackjack_hit_reply, blackjack_stand_reply,
+                     blackjack_start_reply, coin_reply, dice_lose_reply, dice_win_reply)
+
+# Game commands for MoodBot. Each command is a handler registered under its "!name";
+# chat() hands every "!..." message to dispatch(), which looks the name up once and
+# calls the handler with the already split arguments. Adding a game means writing a
+# handler and decorating it with @command("!name").
+#
+# Handlers take (ledger, user_id, args) and return the JSON payload for the reply.
+# Replies for commands that were refused without touching the balance (not enough
+# coins, bad arguments, daily already claimed) carry "rejected": True, which lets
+# atomic batches roll back.
+#
+# Every ledger call that moves coins passes a game_event() describing the outcome,
+# which ends up in the game event log and the leaderboards (see game_log.py).
+#
+# Outcomes come pre-generated from one random stream per kind of outcome (see RANDOM DRAWS
+# and game_rng.py). Each round's event records where its draw came from, [seed, draw
+# number], so replay_outcome() can redo the round later with the same *_from(values)
+# functions the streams use.
+#
+# Reply text comes from the templates in replies.py; winning replies carry the
+# structured fields (result, reward, tier, rolled, cards...) that compact clients
+# render from.
+
+COMMANDS = {}
+
+HUNT_COST = 15
+FISHING_COST = 10
+DAILY_REWARD = 50
+BLACKJACK_WAGER = 15
+# Upper bound for repeat counts like "!fish x100"
+MAX_REPEAT = 1000
+
+# Pre-generated, replayable random draws for every game outcome
+game_rng = GameRng()
+
+# Default generator for WeightedSampler.sample_indices (the simulator passes its own)
+_np_rng = np.random.default_rng()
+
+
+def command(name, takes_args=True):
+    # Register a handler. Commands that take no arguments only match the bare
+    # command, so "!daily please" still goes to the chatbot like it always did.
+    def register(handler):
+        COMMANDS[name] = (handler, takes_args)
+        return handler
+    return register
+
+
+def dispatch(ledger, user_id, input_text):
+    # Returns the reply payload, or None when the input isn't a game command
+    parts = input_text.split()
+    if not parts:
+        return None
+    entry = COMMANDS.get(parts[0])
+    if entry is None:
+        return None
+    handler, takes_args = entry
+    if not takes_args and (len(parts) > 1 or parts[0] != input_text):
+        return None
+    return handler(ledger, user_id, parts[1:])
+
+
+def parse_repeat(args):
+    # "x100" -> 100, no argument -> 1, anything else -> None
+    if not args:
+        return 1
+    if len(args) == 1 and args[0][:1] in ("x", "X") and args[0][1:].isdigit():
+        count = int(args[0][1:])
+        if 1 <= count <= MAX_REPEAT:
+            return count
+    return None
+
+
+class BatchRollback(Exception):
+    pass
+
+
+def run_batch(ledger, user_id, inputs, atomic=False):
+    # Run several commands for one player in order. Returns (results, rolled_back).
+    # Atomic batches run in a single ledger transaction and are undone as a whole
+    # as soon as one command is rejected; otherwise each command stands on its own.
+    results = []
+
+    def run_all():
+        for input_text in inputs:
+            result = dispatch(ledger, user_id, input_text)
+            if result is None:
+                result = {"response": "🎮 Only game commands can be batched - send chat messages to /chat! 💬", "new_balance": ledger.balance(user_id), "rejected": True}
+            results.append(result)
+            if atomic and result.get("rejected"):
+                raise BatchRollback
+
+    if not atomic:
+        run_all()
+        return results, False
+    try:
+        with ledger.transaction():
+            run_all()
+    except BatchRollback:
+        return results, True
+    return results, False
+
+
+class WeightedSampler:
+    # Draws items with fixed weights in O(log n): the cumulative weights are built once,
+    # and each draw is one random number plus a bisect, instead of random.choices
+    # re-accumulating the weights on every call
+    def __init__(self, items, weights):
+        self.items = list(items)
+        self.cumulative = list(accumulate(weights))
+        self.total = self.cumulative[-1]
+        self.last = len(self.items) - 1
+
+    def sample(self, rng=random):
+        return self.pick(rng.random())
+
+    def pick(self, value):
+        # The item a float in [0, 1) lands on; bisect_right skips zero-weight items, which
+        # share a boundary with their neighbour
+        index = bisect.bisect_right(self.cumulative, value * self.total)
+        return self.items[min(index, self.last)]
+
+    def sample_indices(self, count, rng=None):
+        # Draw `count` item indices in one NumPy call
+        return self.pick_indices((rng or _np_rng).random(count))
+
+    def pick_indices(self, values):
+        # Item indices for an array of floats in [0, 1)
+        if not hasattr(self, "_cumulative_array"):
+            self._cumulative_array = np.array(self.cumulative)
+        indices = np.searchsorted(self._cumulative_array, values * self.total, side="right")
+        return np.minimum(indices, self.last)
+
+
+# ----------------- LOOT TABLES (built once at import) -----------------
+
+HUNTING_EVENTS = [
+    {"description": "You tracked a majestic deer 🦌 through the enchanted forest. After a careful aim, you successfully bagged it!", "reward": 40},
+    {"description": "While traversing a dense thicket, a nimble rabbit 🐰 darted across your path. You managed to catch it with lightning reflexes!", "reward": 25},
+    {"description": "You stumbled upon a family of wild boars! 🐗 The chase was thrilling, and you managed to corner one with your expert skills.", "reward": 55},
+    {"description": "You spent hours in the wilderness 🌲, following trails and listening for movement. Finally, you spotted a rare and elusive bird! 🦅", "reward": 70},
+    {"description": "The forest was quiet today. 🤫 You found some interesting tracks but the animals remained hidden in the shadows.", "reward": 5},
+    {"description": "You carefully set up a snare near a crystal-clear watering hole 💦. Later, you returned to find a small but useful catch.", "reward": 30},
+    {"description": "A mischievous squirrel 🐿️ ran right into your net! It wasn't much, but it's something to show for your efforts!", "reward": 15},
+    {"description": "The wind carried the scent of prey 🍃, leading you to a successful hunt in the open fields of fortune.", "reward": 45},
+    {"description": "Despite your best efforts and cunning strategies, the forest seemed empty today. 😔 You return with nothing but stories of the chase.", "reward": 0},
+    {"description": "You discovered a hidden grove 🌿 and found a valuable wild herb along with a small animal. Nature has blessed you today!", "reward": 35},
+]
+
+FISHING_LOOT = [
+    {"tier": "S", "name": "Giant Squid 🦑", "description": "A colossal creature of the deep! Legendary find!", "reward": 200, "rarity": 0.005},
+    {"tier": "S", "name": "Megalodon Tooth 🦈", "description": "An ancient relic worth a fortune! Incredibly rare!", "reward": 150, "rarity": 0.01},
+    {"tier": "A", "name": "Golden Dorado ✨🐟", "description": "A shimmering fish of legend that gleams like pure gold!", "reward": 80, "rarity": 0.03},
+    {"tier": "A", "name": "Ancient Marlin 🔱", "description": "A wise old fish with battle scars and stories to tell.", "reward": 70, "rarity": 0.05},
+    {"tier": "B", "name": "Silver Salmon 🐠", "description": "A strong and healthy fish, perfect for a feast!", "reward": 45, "rarity": 0.10},
+    {"tier": "B", "name": "Striped Bass 🎵", "description": "A popular and tasty catch, dancing in your net!", "reward": 40, "rarity": 0.12},
+    {"tier": "B", "name": "Mysterious Bottle 📜", "description": "Contains a curious message from distant shores...", "reward": 30, "rarity": 0.08},
+    {"tier": "C", "name": "Common Carp 🐡", "description": "A typical river fish, but still worth something!", "reward": 20, "rarity": 0.20},
+    {"tier": "C", "name": "Bluegill 🔵", "description": "A small but colorful fish that brightens your day.", "reward": 15, "rarity": 0.25},
+    {"tier": "C", "name": "Waterlogged Boot 👢", "description": "Smells... interesting. Someone's missing this!", "reward": 5, "rarity": 0.15},
+    {"tier": "D", "name": "Empty Can 🥫", "description": "Looks like someone littered. At least you cleaned up!", "reward": 0, "rarity": 0.0},
+    {"tier": "D", "name": "Seaweed 🌿", "description": "Just some slimy greens. Maybe good for soup?", "reward": 0, "rarity": 0.0},
+    {"tier": "D", "name": "Old Tire 🛞", "description": "Heavy and useless. Why is this even in the water?", "reward": 0, "rarity": 0.0},
+    {"tier": "D", "name": "Nothing 💨", "description": "The fish were smarter than you today! Better luck next time!", "reward": 0, "rarity": 0.10},
+]
+
+# Single-round reply text for each hunt event and catch, rendered once
+for _event in HUNTING_EVENTS:
+    _event["reply"] = HUNT_REPLY(description=_event["description"], reward=_event["reward"], cost=HUNT_COST)
+for _item in FISHING_LOOT:
+    _item["reply"] = FISH_REPLY(name=_item["name"], description=_item["description"], reward=_item["reward"], cost=FISHING_COST)
+
+FISHING_SAMPLER = WeightedSampler(FISHING_LOOT, [item["rarity"] for item in FISHING_LOOT])
+
+# Reward columns of the loot tables, for vectorized repeat runs
+HUNT_REWARDS = np.array([event["reward"] for event in HUNTING_EVENTS])
+FISHING_REWARDS = np.array([item["reward"] for item in FISHING_LOOT])
+
+COIN_SIDES = ("heads", "tails")
+
+# Parses dice predictions such as "3", "3>" or "3<"
+DICE_PREDICTION = re.compile(r"(\d+)([><=]?)")
+
+DICE_OPERATORS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    "=": operator.eq,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+# ----------------- RANDOM DRAWS -----------------
+
+# Each function turns an array of floats in [0, 1) into outcomes, vectorized, so a stream
+# makes a whole buffer of outcomes at once. Replays use the same functions.
+
+def object_table(items):
+    # A NumPy array of the items, so picking many of them is one indexing step
+    table = np.empty(len(items), dtype=object)
+    table[:] = items
+    return table
+
+
+_HUNTING_TABLE = object_table(HUNTING_EVENTS)
+_FISHING_TABLE = object_table(FISHING_LOOT)
+_COIN_TABLE = object_table(COIN_SIDES)
+
+
+def hunt_indices_from(values):
+    return (values * len(HUNTING_EVENTS)).astype(np.intp)
+
+
+def hunt_counts_from(values):
+    # How many times each hunting event came up in one hunt per value
+    return np.bincount(hunt_indices_from(values), minlength=len(HUNTING_EVENTS))
+
+
+def hunting_events_from(values):
+    return _HUNTING_TABLE[hunt_indices_from(values)].tolist()
+
+
+def catches_from(values):
+    return _FISHING_TABLE[FISHING_SAMPLER.pick_indices(values)].tolist()
+
+
+def coin_sides_from(values):
+    return _COIN_TABLE[(values * 2).astype(np.intp)].tolist()
+
+
+def die_rolls_from(values):
+    return (1 + (values * 6).astype(np.intp)).tolist()
+
+
+def cards_from(values):
+    return (1 + (values * 11).astype(np.intp)).tolist()
+
+
+# One stream per kind of outcome. stream.draw() gives (draw number, outcome) and the
+# round's event records [stream.seed, draw number]; draw_many() for bulk rounds gives the
+# doubles and their origin
+HUNT_DRAWS = game_rng.stream("hunt", hunting_events_from)
+FISHING_DRAWS = game_rng.stream("fish", catches_from)
+COIN_DRAWS = game_rng.stream("coin", coin_sides_from)
+DICE_DRAWS = game_rng.stream("dice", die_rolls_from)
+CARD_DRAWS = game_rng.stream("blackjack", cards_from)
+
+
+# ----------------- COMMAND HANDLERS -----------------
+
+@command("!daily", takes_args=False)
+def daily(ledger, user_id, args):
+    current_date = datetime.datetime.now().date()
+    new_balance = ledger.claim_daily(user_id, current_date.isoformat(), DAILY_REWARD, game_event("daily", rounds=0))
+    if new_balance is None:
+        return {
+            "response": "⏰ You've already collected your daily treasure chest today! Come back tomorrow for more riches! ⏰",
+            "new_balance": ledger.balance(user_id),
+            "rejected": True
+        }
+    return {
+        "response": "🎁✨ WOOHOO! You've collected your daily reward of 50 shiny coins! Keep stacking that treasure! 💰✨",
+        "new_balance": new_balance
+    }
+
+
+def repeat_usage(ledger, user_id, name):
+    return {"response": f"🔁 Use `{name}` for one round or `{name} x<count>` (up to {MAX_REPEAT}) to go again and again! ⚡", "new_balance": ledger.balance(user_id), "rejected": True}
+
+
+@command("!hunt")
+def hunt(ledger, user_id, args):
+    rounds = parse_repeat(args)
+    if rounds is None:
+        return repeat_usage(ledger, user_id, "!hunt")
+    if rounds > 1:
+        return hunt_many(ledger, user_id, rounds)
+    number, event = HUNT_DRAWS.draw()
+    reward = event["reward"]
+    # Charge the cost and pay the reward in one atomic ledger update
+    new_balance = ledger.settle(user_id, HUNT_COST, reward, game_event("hunt", draws=[HUNT_DRAWS.seed, number]))
+    if new_balance is None:
+        return {"response": f"🏹 Oops! You need {HUNT_COST} coins to equip yourself for a proper hunt! Come back when you're loaded! 💸", "new_balance": ledger.balance(user_id), "rejected": True}
+    return {
+        "response": event["reply"],
+        "result": "success" if reward > 0 else "nothing",
+        "reward": reward,
+        "new_balance": new_balance
+    }
+
+
+def hunt_many(ledger, user_id, rounds):
+    # All rounds are drawn at once and settled in a single ledger update
+    values, origin = HUNT_DRAWS.draw_many(rounds)
+    counts = hunt_counts_from(values)
+    total_reward = int(counts @ HUNT_REWARDS)
+    cost = HUNT_COST * rounds
+    successes = int(counts[HUNT_REWARDS > 0].sum())
+    new_balance = ledger.settle(user_id, cost, total_reward, game_event("hunt", rounds, draws=origin, successes=successes))
+    if new_balance is None:
+        return {"response": f"🏹 Oops! You need {cost} coins to equip yourself for {rounds} hunts! Come back when you're loaded! 💸", "new_balance": ledger.balance(user_id), "rejected": True}
+    return {
+        "response": f"🏹 You went on {rounds} epic hunts and came home with a prize {successes} times! You gained {total_reward} coins! 💰 (Cost: {cost} coins)",
+        "result": "success" if total_reward > 0 else "nothing",
+        "rounds": rounds,
+        "total_reward": total_reward,
+        "new_balance": new_balance
+    }
+
+
+@command("!fish")
+def fish(ledger, user_id, args):
+    rounds = parse_repeat(args)
+    if rounds is None:
+        return repeat_usage(ledger, user_id, "!fish")
+    if rounds > 1:
+        return fish_many(ledger, user_id, rounds)
+    number, caught_item = FISHING_DRAWS.draw()
+    reward = caught_item["reward"]
+    new_balance = ledger.settle(user_id, FISHING_COST, reward, game_event("fish", draws=[FISHING_DRAWS.seed, number], item=caught_item["name"], tier=caught_item["tier"]))
+    if new_balance is None:
+        return {"response": f"🎣 Oh no! You need {FISHING_COST} coins to prepare your fishing gear! Go collect some more treasure first! 💰", "new_balance": ledger.balance(user_id), "rejected": True}
+    return {
+        "response": caught_item["reply"],
+        "result": "success" if reward > 0 else "nothing",
+        "tier": caught_item["tier"],
+        "item": caught_item["name"],
+        "reward": reward,
+        "new_balance": new_balance
+    }
+
+
+def fish_many(ledger, user_id, rounds):
+    # All casts are drawn at once and settled in a single ledger update
+    values, origin = FISHING_DRAWS.draw_many(rounds)
+    counts = np.bincount(FISHING_SAMPLER.pick_indices(values), minlength=len(FISHING_LOOT))
+    total_reward, caught, best_item, tiers = fishing_haul(counts)
+    cost = FISHING_COST * rounds
+    new_balance = ledger.settle(user_id, cost, total_reward, game_event("fish", rounds, draws=origin, item=best_item["name"], tiers=tiers))
+    if new_balance is None:
+        return {"response": f"🎣 Oh no! You need {cost} coins to prepare your fishing gear for {rounds} casts! Go collect some more treasure first! 💰", "new_balance": ledger.balance(user_id), "rejected": True}
+    haul = ", ".join(f"{tiers[tier]}× {tier}" for tier in "SABCD" if tier in tiers)
+    return {
+        "response": f"🎣 You cast your line {rounds} times! Best catch: **{best_item['name']}**. Haul by tier: {haul}. You gained {total_reward} coins! 💰 (Cost: {cost} coins)",
+        "result": "success" if total_reward > 0 else "nothing",
+        "rounds": rounds,
+        "total_reward": total_reward,
+        "tiers": tiers,
+        "catches": {item["name"]: n for item, n in caught},
+        "new_balance": new_balance
+    }
+
+
+def fishing_haul(counts):
+    # (total reward, [(item, count)], best item, {tier: count}) for the catch counts of many casts
+    caught = [(FISHING_LOOT[i], int(n)) for i, n in enumerate(counts) if n]
+    best_item = max(caught, key=lambda entry: entry[0]["reward"])[0]
+    tiers = {}
+    for item, n in caught:
+        tiers[item["tier"]] = tiers.get(item["tier"], 0) + n
+    return int(counts @ FISHING_REWARDS), caught, best_item, tiers
+
+
+@command("!coin")
+def coin(ledger, user_id, args):
+    if not args:
+        return {
+            "response": "🪙 Ready to test your luck? Use `!coin <heads|tails> <wager>` (e.g., `!coin heads 20`) to flip the magical coin of fortune! ✨",
+            "new_balance": ledger.balance(user_id)
+        }
+    if len(args) != 2:
+        return {
+            "response": "❌ Invalid coin command. Use `!coin <heads|tails> <wager>` (e.g., `!coin heads 20`) to test your luck! 🪙",
+            "new_balance": ledger.balance(user_id),
+            "rejected": True
+        }
+    prediction = args[0].lower()
+    try:
+        wager = int(args[1])
+    except ValueError:
+        return {
+            "response": "❓ Invalid wager. Please enter a number for the amount of coins you wish to risk! 🔢",
+            "new_balance": ledger.balance(user_id),
+            "rejected": True
+        }
+    if prediction not in COIN_SIDES:
+        return {
+            "response": "❌ Invalid prediction! Choose either 'heads' or 'tails' to tempt fate! 🪙",
+            "new_balance": ledger.balance(user_id),
+            "rejected": True
+        }
+
+    number, result = COIN_DRAWS.draw()
+    reward = wager * 2 if prediction == result else 0  # Winning doubles the wager
+    new_balance = ledger.settle(user_id, wager, reward, game_event("coin", draws=[COIN_DRAWS.seed, number], pick=prediction, landed=result)) if wager > 0 else None
+    if new_balance is None:
+        return {
+            "response": "💸 Invalid wager or insufficient coins! Check your treasure chest and try again! 💰",
+            "new_balance": ledger.balance(user_id),
+            "rejected": True
+        }
+
+    if prediction == result:
+        return {
+            "response": coin_reply(prediction, result, reward),
+            "result": "win",
+            "wager": wager,
+            "reward": reward,
+            "prediction": prediction.capitalize(),
+            "landed_on": result.capitalize(),
+            "new_balance": new_balance
+        }
+    return {
+        "response": coin_reply(prediction, result, wager),
+        "result": "lose",
+        "wager": wager,
+        "prediction": prediction.capitalize(),
+        "landed_on": result.capitalize(),
+        "new_balance": new_balance
+    }
+
+
+@command("!dice")
+def dice(ledger, user_id, args):
+    if not args:
+        return {
+            "response":
+                        "🎲 **Roll the Dice of Destiny!** 🎲\n\n"
+                        "**Basic Command:** `!dice <prediction> <wager>`\n\n"
+                        "**Example:** `!dice 3> 200` (bets 200 coins that the roll will be 4, 5, or 6).\n\n"
+                        "Ready to challenge fate? Give it a roll! 🍀✨",
+            "new_balance": ledger.balance(user_id)
+        }
+    if len(args) != 2:
+        return {"response": "❌ Invalid dice command format. Use `!dice <number>[><=] <wager>` (no space between number and operator) ❌", "new_balance": ledger.balance(user_id), "rejected": True}
+
+    prediction_str = args[0]
+    try:
+        wager = int(args[1])
+    except ValueError:
+        return dice_invalid(ledger, user_id)
+    if wager <= 0:
+        return {"response": "💸 Invalid wager or insufficient coins! Check your treasure chest and try again! 💰", "new_balance": ledger.balance(user_id), "rejected": True}
+    match = DICE_PREDICTION.match(prediction_str)
+    if not match:
+        return dice_invalid(ledger, user_id)
+    target = int(match.group(1))
+    bet_operator = match.group(2) or "="
+    if not 1 <= target <= 6:
+        return dice_invalid(ledger, user_id)
+
+    number, roll = DICE_DRAWS.draw()
+    reward = dice_reward(bet_operator, target, roll, wager)
+    # Take the wager and pay any winnings in one atomic ledger update
+    new_balance = ledger.settle(user_id, wager, reward, game_event("dice", draws=[DICE_DRAWS.seed, number], bet=prediction_str, rolled=roll))
+    if new_balance is None:
+        return {"response": "💸 Invalid wager or insufficient coins! Check your treasure chest and try again! 💰", "new_balance": ledger.balance(user_id), "rejected": True}
+    if reward:
+        return {
+            "response": dice_win_reply(roll, prediction_str, reward),
+            "result": "win",
+            "rolled": roll,
+            "bet": prediction_str,
+            "wager": wager,
+            "reward": reward,
+            "new_balance": new_balance
+        }
+    return {
+        "response": dice_lose_reply(roll, prediction_str, wager),
+        "result": "lose",
+        "rolled": roll,
+        "bet": prediction_str,
+        "wager": wager,
+        "new_balance": new_balance
+    }
+
+
+def dice_reward(bet_operator, target, roll, wager):
+    if not DICE_OPERATORS[bet_operator](roll, target):
+        return 0
+    # Exact guesses pay 5x, range bets pay 2x
+    return wager * 5 if bet_operator == "=" else wager * 2
+
+
+def dice_invalid(ledger, user_id):
+    return {"response": "❓ Invalid dice command format. Use `!dice <number>[><=] <wager>` (no space between number and operator) ❓", "new_balance": ledger.balance(user_id), "rejected": True}
+
+
+@command("!blackjack")
+def blackjack(ledger, user_id, args):
+    not_enough = {"response": "💸 Not enough coins to play Blackjack! You need at least 15 coins to join the table! 🃏", "new_balance": ledger.balance(user_id), "rejected": True}
+    if not_enough["new_balance"] < BLACKJACK_WAGER:
+        return not_enough
+    action = args[0] if args else "start"
+    if action == "start":
+        return blackjack_start(ledger, user_id, not_enough)
+    if action in ("hit", "stand"):
+        # Hold the ledger's write lock while the game is read, played and saved,
+        # so two quick clicks can't both act on the same game
+        with ledger.transaction():
+            saved = ledger.get_blackjack(user_id)
+            if not saved:
+                return blackjack_invalid(ledger, user_id)
+            game = BlackjackGame.from_dict(saved)
+            if game.game_over:
+                return {"response": "⚠️ This game is already over. Start a new exciting round with `!blackjack`! 🃏", "new_balance": ledger.balance(user_id), "rejected": True}
+            if action == "hit":
+                return blackjack_hit(ledger, user_id, game)
+            return blackjack_stand(ledger, user_id, game)
+    return blackjack_invalid(ledger, user_id)
+
+
+def blackjack_invalid(ledger, user_id):
+    return {"response": "❓ Invalid blackjack command. Use `!blackjack`, `!blackjack hit`, or `!blackjack stand`. 🃏", "new_balance": ledger.balance(user_id), "rejected": True}
+
+
+def card_drawer(origins):
+    # draw() for the blackjack engine: one card, its origin appended to `origins`
+    def draw():
+        number, card = CARD_DRAWS.draw()
+        origins.append([CARD_DRAWS.seed, number])
+        return card
+    return draw
+
+
+def blackjack_hand(game, finished=False):
+    # The cards as the player may see them: only the dealer's first card until the hand is over
+    if not finished:
+        return {"player_cards": game.player.cards, "player_total": game.player.total, "dealer_card": game.dealer.cards[0]}
+    return {"player_cards": game.player.cards, "player_total": game.player.total,
+            "dealer_cards": game.dealer.cards, "dealer_total": game.dealer.total}
+
+
+def blackjack_draws(game):
+    # The origins of every card so far, or None for a game saved before they were kept
+    player_draws, dealer_draws = game.draws
+    if len(player_draws) == len(game.player.cards) and len(dealer_draws) == len(game.dealer.cards):
+        return game.draws
+    return None
+
+
+def blackjack_result(player_total, dealer_total, stake):
+    # Result and payout of a hand the player stood on
+    if dealer_total > 21 or player_total > dealer_total:
+        return "win", stake * 2
+    if dealer_total == player_total:
+        return "tie", stake
+    return "lose", 0
+
+
+def blackjack_start(ledger, user_id, not_enough):
+    origins = []
+    game = BlackjackGame.deal(card_drawer(origins), BLACKJACK_WAGER)
+    # deal() draws the player's two cards, then the dealer's
+    game.draws = [origins[:2], origins[2:]]
+    # Take the wager and store the new game together
+    new_balance = ledger.start_blackjack(user_id, BLACKJACK_WAGER, game.to_dict(), game_event("blackjack", rounds=0, draws=game.draws))
+    if new_balance is None:
+        return not_enough
+    hand = blackjack_hand(game)
+    return {
+        "response": blackjack_start_reply(wager=BLACKJACK_WAGER, **hand),
+        "new_balance": new_balance,
+        "game_state": "active",
+        **hand
+    }
+
+
+def blackjack_hit(ledger, user_id, game):
+    number, new_card = CARD_DRAWS.draw()
+    game.player.add(new_card)
+    game.draws[0].append([CARD_DRAWS.seed, number])
+    player_total = game.player.total
+    if game.player.busted:
+        event = game_event("blackjack", stake=game.coins_wagered, draws=blackjack_draws(game), result="lose", player=player_total, dealer=game.dealer.total)
+        new_balance = ledger.finish_blackjack(user_id, 0, event)
+        hand = blackjack_hand(game, finished=True)
+        return {
+            "response": blackjack_bust_reply(balance=new_balance, **hand),
+            "new_balance": new_balance,
+            "game_state": "lose",
+            **hand
+        }
+    ledger.save_blackjack(user_id, game.to_dict())
+    hand = blackjack_hand(game)
+    return {
+        "response": blackjack_hit_reply(card=new_card, **hand),
+        "new_balance": ledger.balance(user_id),
+        "game_state": "active",
+        "card": new_card,
+        **hand
+    }
+
+
+def blackjack_stand(ledger, user_id, game):
+    game.play_dealer(card_drawer(game.draws[1]))
+    player_total = game.player.total
+    dealer_total = game.dealer.total
+    result, reward = blackjack_result(player_total, dealer_total, game.coins_wagered)
+    # Pay out and clear the game in one step
+    event = game_event("blackjack", stake=game.coins_wagered, draws=blackjack_draws(game), result=result, player=player_total, dealer=dealer_total)
+    new_balance = ledger.finish_blackjack(user_id, reward, event)
+    hand = blackjack_hand(game, finished=True)
+    return {
+        "response": blackjack_stand_reply(result, balance=new_balance, **hand),
+        "new_balance": new_balance,
+        "game_state": result,
+        **hand
+    }
+
+
+# ----------------- REPLAY -----------------
+
+def replay_outcome(event):
+    # Redraw a logged round from the stream position its event recorded (event["d"]) and
+    # return the payout and details it comes out with: {"p": ..., "x": ...} as in the event
+    game, rounds, details = event["g"], event["r"], event.get("x")
+    if game == "blackjack":
+        return replay_blackjack(event)
+    values = replay_draws(*event["d"], rounds)
+    if game == "hunt" and rounds == 1:
+        return {"p": hunting_events_from(values)[0]["reward"]}
+    if game == "hunt":
+        counts = hunt_counts_from(values)
+        return {"p": int(counts @ HUNT_REWARDS), "x": {"successes": int(counts[HUNT_REWARDS > 0].sum())}}
+    if game == "fish" and rounds == 1:
+        item = catches_from(values)[0]
+        return {"p": item["reward"], "x": {"item": item["name"], "tier": item["tier"]}}
+    if game == "fish":
+        total_reward, _, best_item, tiers = fishing_haul(np.bincount(FISHING_SAMPLER.pick_indices(values), minlength=len(FISHING_LOOT)))
+        return {"p": total_reward, "x": {"item": best_item["name"], "tiers": tiers}}
+    if game == "coin":
+        landed = coin_sides_from(values)[0]
+        return {"p": event["c"] * 2 if details["pick"] == landed else 0, "x": {"pick": details["pick"], "landed": landed}}
+    if game == "dice":
+        match = DICE_PREDICTION.match(details["bet"])
+        roll = die_rolls_from(values)[0]
+        reward = dice_reward(match.group(2) or "=", int(match.group(1)), roll, event["c"])
+        return {"p": reward, "x": {"bet": details["bet"], "rolled": roll}}
+    return None
+
+
+def replay_blackjack(event):
+    # A blackjack event records the origin of every card, [[player's], [dealer's]]; each is
+    # redrawn on its own, since a hand's cards can come from different requests
+    if event["r"] == 0:
+        # The deal only takes the wager
+        return {"p": 0}
+    player, dealer = (BlackjackHand([cards_from(replay_draws(*origin))[0] for origin in origins])
+                      for origins in event["d"])
+    if player.busted:
+        result, reward = "lose", 0
+    else:
+        result, reward = blackjack_result(player.total, dealer.total, event["s"])
+    return {"p": reward, "x": {"result": result, "player": player.total, "dealer": dealer.total}}
@@ -0,0 +1,137 @@
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+# Per-user conversation memory for the chatbot, kept separately for each mode.
+# Recent turns are sent back to the model verbatim as long as they fit in a token
+# budget; older turns are folded into a short rolling summary of what the user said,
+# which has its own budget. Token counts are computed once per turn and kept as
+# running totals, so recording a turn only touches the new turn and whatever it
+# pushes out. The context handed to build_messages() is bounded by the budgets,
+# however long the conversation gets.
+#
+# Conversations live in the worker process (like the "memory" reply cache), in an
+# LRU bounded by MOODBOT_MEMORY_CONVERSATIONS.
+
+# Tokens of recent turns kept verbatim; 0 disables conversation memory
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MOODBOT_MEMORY_TOKENS", "600"))
+# Tokens of the rolling summary of older turns
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("MOODBOT_MEMORY_SUMMARY_TOKENS", "150"))
+# Conversations kept per worker before the least recently used one is dropped
+MEMORY_MAX_CONVERSATIONS = int(os.environ.get("MOODBOT_MEMORY_CONVERSATIONS", "10000"))
+# Longest snippet of an old message that goes into the summary
+SUMMARY_SNIPPET_CHARS = 80
+
+_sentence_end = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English chat text; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def summary_snippet(text):
+    # First sentence of a message, clipped to SUMMARY_SNIPPET_CHARS
+    snippet = _sentence_end.split(text.strip(), 1)[0]
+    if len(snippet) > SUMMARY_SNIPPET_CHARS:
+        snippet = snippet[:SUMMARY_SNIPPET_CHARS - 1].rstrip() + "…"
+    return snippet
+
+
+class Conversation:
+    __slots__ = ("turns", "tokens", "summary", "summary_tokens", "summary_message")
+
+    def __init__(self):
+        # (user message, assistant message, tokens) per turn, oldest first
+        self.turns = deque()
+        self.tokens = 0
+        # (snippet, tokens) of turns that no longer fit, oldest first
+        self.summary = deque()
+        self.summary_tokens = 0
+        # System message carrying the summary, rebuilt only when the summary changes
+        self.summary_message = None
+
+    def add_turn(self, user_text, reply, token_budget, summary_budget):
+        tokens = estimate_tokens(user_text) + estimate_tokens(reply)
+        self.turns.append(({"role": "user", "content": user_text}, {"role": "assistant", "content": reply}, tokens))
+        self.tokens += tokens
+        while self.tokens > token_budget and self.turns:
+            user_message, _, old_tokens = self.turns.popleft()
+            self.tokens -= old_tokens
+            self._summarize(user_message["content"], summary_budget)
+
+    def _summarize(self, user_text, summary_budget):
+        snippet = summary_snippet(user_text)
+        tokens = estimate_tokens(snippet)
+        self.summary.append((snippet, tokens))
+        self.summary_tokens += tokens
+        while self.summary_tokens > summary_budget and self.summary:
+            self.summary_tokens -= self.summary.popleft()[1]
+        self.summary_message = None
+
+    def context(self):
+        # Messages to place between the system prompt and the new user message
+        messages = []
+        if self.summary:
+            if self.summary_message is None:
+                said = "; ".join(snippet for snippet, _ in self.summary)
+                self.summary_message = {"role": "system", "content": f"Earlier in this conversation the user said: {said}"}
+            messages.append(self.summary_message)
+        for user_message, assistant_message, _ in self.turns:
+            messages.append(user_message)
+            messages.append(assistant_message)
+        return messages
+
+    def context_tokens(self):
+        return self.tokens + self.summary_tokens
+
+
+class ConversationMemory:
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET, summary_budget=MEMORY_SUMMARY_TOKENS,
+                 max_conversations=MEMORY_MAX_CONVERSATIONS):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self.turns_recorded = 0
+        self.evictions = 0
+
+    def context(self, user_id, mode):
+        with self._lock:
+            conversation = self._conversations.get((user_id, mode))
+            if conversation is None:
+                return []
+            self._conversations.move_to_end((user_id, mode))
+            return conversation.context()
+
+    def record(self, user_id, mode, user_text, reply):
+        with self._lock:
+            conversation = self._conversations.get((user_id, mode))
+            if conversation is None:
+                conversation = self._conversations[(user_id, mode)] = Conversation()
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._conversations.move_to_end((user_id, mode))
+            conversation.add_turn(user_text, reply, self.token_budget, self.summary_budget)
+            self.turns_recorded += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "turns_recorded": self.turns_recorded,
+                "evictions": self.evictions,
+                "token_budget": self.token_budget,
+                "summary_budget": self.summary_budget,
+            }
+
+
+def create_conversation_memory(token_budget=MEMORY_TOKEN_BUDGET):
+    # Build the memory configured through the environment, or None when it is turned off
+    if token_budget <= 0:
+        return None
+    return ConversationMemory(token_budget)
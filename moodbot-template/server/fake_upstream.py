@@ -0,0 +1,191 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A tiny OpenAI-compatible chat completions server used to benchmark MoodBot offline.
+# It never talks to a real model: it just replies with a canned meme-flavoured answer,
+# sleeping `ttft` seconds before the first token and `token_delay` between tokens.
+# To exercise timeouts and admission control it can also inject faults: a `failure_rate`
+# share of calls fail with `failure_status`, and a `slow_rate` share wait `slow_delay`
+# extra seconds first. `models` maps a model name to settings that replace these for calls to
+# that model, so one stub can stand in for several backends of different speed and health.
+# server.config can be changed while it runs; server.requests counts calls
+# (server.model_requests per model).
+
+DEFAULT_REPLY = (
+    "Haha, you really walked in here thinking you'd win today? 😂 "
+    "Bold move, champ! Keep that energy, the meme gods are watching 👀✨"
+)
+
+
+def tokenize(text):
+    # Split on spaces but keep them attached, so joining the tokens gives back the text
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + [words[-1]]
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between calls
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY, Nagle + delayed ACKs add ~40ms per reused connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def _write_chunk(self, payload):
+        data = payload.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model = body.get("model", "fake-model")
+        config = self.server.config
+        if model in config["models"]:
+            config = {**config, **config["models"][model]}
+        tokens = tokenize(config["reply"])
+        created = int(time.time())
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.model_requests[model] = self.server.model_requests.get(model, 0) + 1
+
+        if config["slow_rate"] and random.random() < config["slow_rate"]:
+            time.sleep(config["slow_delay"])
+        time.sleep(config["ttft"])
+
+        if config["failure_rate"] and random.random() < config["failure_rate"]:
+            payload = json.dumps({"error": {"message": "Injected upstream failure", "code": config["failure_status"]}}).encode("utf-8")
+            self.send_response(config["failure_status"])
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index, token in enumerate(tokens):
+                if index:
+                    time.sleep(config["token_delay"])
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            # Like OpenAI/OpenRouter, report usage in a final chunk with no choices when asked to
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": {"prompt_tokens": 42, "completion_tokens": len(tokens), "total_tokens": 42 + len(tokens)},
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            # Zero-length chunk terminates the chunked body
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+            return
+
+        # Non-streaming clients still wait for the whole "generation"
+        time.sleep(config["token_delay"] * max(len(tokens) - 1, 0))
+        payload = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": config["reply"]},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 42, "completion_tokens": len(tokens), "total_tokens": 42 + len(tokens)},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops bursts of new connections under load tests
+    request_queue_size = 256
+
+    def __init__(self, address, config):
+        super().__init__(address, FakeUpstreamHandler)
+        self.config = config
+        self.requests = 0
+        self.model_requests = {}
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients that give up mid-reply (timeouts, cancelled hedged calls) aren't errors here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_config(ttft=0.2, token_delay=0.02, reply=DEFAULT_REPLY, failure_rate=0.0, failure_status=500,
+                slow_rate=0.0, slow_delay=0.0, models=None):
+    return {
+        "ttft": ttft,
+        "token_delay": token_delay,
+        "reply": reply,
+        "failure_rate": failure_rate,
+        "failure_status": failure_status,
+        "slow_rate": slow_rate,
+        "slow_delay": slow_delay,
+        "models": models or {},
+    }
+
+
+def start_fake_upstream(host="127.0.0.1", port=0, **config):
+    # Start the stub in a background thread and return the server (use server.server_port for the port).
+    # Keyword arguments are the make_config() settings.
+    server = FakeUpstreamServer((host, port), make_config(**config))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible upstream for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of calls that fail")
+    parser.add_argument("--failure-status", type=int, default=500, help="HTTP status of failed calls (e.g. 429, 500, 503)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of calls delayed by --slow-delay")
+    parser.add_argument("--slow-delay", type=float, default=0.0, help="extra seconds before a slow call answers")
+    parser.add_argument("--models", type=json.loads, default=None,
+                        help='per-model overrides as JSON, e.g. \'{"model-b": {"ttft": 0.5, "failure_rate": 0.2}}\'')
+    args = parser.parse_args()
+
+    server = FakeUpstreamServer((args.host, args.port), make_config(
+        ttft=args.ttft,
+        token_delay=args.token_delay,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        slow_rate=args.slow_rate,
+        slow_delay=args.slow_delay,
+        models=args.models,
+    ))
+    print(f"Fake upstream listening on http://{args.host}:{args.port} (set OPENROUTER_BASE_URL to this URL)")
+    server.serve_forever()
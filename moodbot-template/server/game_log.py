@@ -0,0 +1,562 @@
+import argparse
+import atexit
+import bisect
+import collections
+import heapq
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Append-only log of every coin-changing game outcome, plus the leaderboards built from it.
+#
+# The ledger hands an event to the log when the transaction that made the change commits
+# (a rolled-back atomic batch logs nothing). The request thread only appends the event to
+# an in-memory queue. A background writer thread encodes queued events as newline-delimited
+# JSON and appends them to MOODBOT_GAME_LOG with one write() every GAME_LOG_FLUSH_INTERVAL
+# seconds, so requests never wait for the disk. All workers append to the same file
+# (O_APPEND keeps each write whole).
+#
+# A background follower in each worker tails that file and folds new events into
+# in-memory aggregates: per-player stats, the richest players, and the biggest single wins.
+# Every worker reads every worker's events, so all of them serve the same leaderboards,
+# a fraction of a second behind the ledger.
+#
+# One JSON object per line, keys in this order (replay relies on the first five):
+#   ts  unix time
+#   u   user id
+#   c   coins taken
+#   p   coins paid out
+#   b   balance after
+#   g   game: hunt, fish, coin, dice, blackjack, daily, or adjust for direct credits/debits
+#   r   rounds played (0 for a blackjack deal, daily rewards and adjustments)
+#   s   stake taken by an earlier event (the wager of a finished blackjack game), if any
+#   x   game details (item caught, dice roll, ...), if any
+#   d   [seed, first draw] of the random stream the round drew from, if any (see game_rng.py);
+#       for blackjack, [[seed, draw] of each player card, [seed, draw] of each dealer card].
+#       Kept out of x so leaderboards never show a stream's seed
+# A player's balance is their starting coins plus the sum of p - c over their events, which
+# is what `python game_log.py replay` rebuilds.
+
+# Path of the event log shared by all workers; empty disables the log and the leaderboards
+GAME_LOG_PATH = os.environ.get("MOODBOT_GAME_LOG", "moodbot_events.ndjson")
+# Longest an event waits in memory before the writer appends it
+GAME_LOG_FLUSH_INTERVAL = float(os.environ.get("MOODBOT_GAME_LOG_FLUSH_INTERVAL", "0.05"))
+# How often each worker reads new events into its leaderboards
+GAME_LOG_FOLLOW_INTERVAL = float(os.environ.get("MOODBOT_GAME_LOG_FOLLOW_INTERVAL", "0.25"))
+# Longest the first leaderboard request in a worker waits for the follower to read the
+# existing log; past that it gets the leaderboards read so far
+GAME_LOG_CATCH_UP_WAIT = float(os.environ.get("MOODBOT_GAME_LOG_CATCH_UP_WAIT", "1"))
+# Bytes of log read and decoded at a time, by the follower and by replay
+GAME_LOG_READ_BLOCK = 1 << 22
+# Encoded events the writer keeps for retrying while appends fail (e.g. a full disk);
+# past this they are dropped rather than piling up in memory
+GAME_LOG_MAX_UNWRITTEN = int(os.environ.get("MOODBOT_GAME_LOG_MAX_UNWRITTEN", str(64 << 20)))
+# Largest leaderboard a client can ask for, and how many single wins are kept for it
+LEADERBOARD_MAX = 100
+# Players per bucket of the ranked balances (see RankedSet)
+RANKED_BUCKET_SIZE = 512
+
+GAMES = ("hunt", "fish", "coin", "dice", "blackjack")
+
+logger = logging.getLogger(__name__)
+
+
+# Leading fields of an encoded event: user id (still JSON-escaped), coins taken, coins paid
+_event_prefix = re.compile(rb'^\{"ts":[^,]*,"u":"((?:[^"\\]|\\.)*)","c":(-?\d+),"p":(-?\d+),', re.MULTILINE)
+# Reused so each event doesn't build a new encoder for the non-default options
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def game_event(game, rounds=1, stake=0, draws=None, **details):
+    # The game-specific part of an event; the ledger adds ts, u, c, p and b
+    event = {"g": game, "r": rounds}
+    if stake:
+        event["s"] = stake
+    if details:
+        event["x"] = details
+    if draws is not None:
+        event["d"] = draws
+    return event
+
+
+ADJUSTMENT = game_event("adjust", rounds=0)
+
+
+def encode_event(event):
+    return _encoder.encode(event)
+
+
+def net_win(event):
+    return event["p"] - event["c"] - event.get("s", 0)
+
+
+# ----------------- WRITER -----------------
+
+class EventLog:
+    def __init__(self, path=GAME_LOG_PATH, flush_interval=GAME_LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = collections.deque()
+        self._write_lock = threading.Lock()
+        self._fd = None
+        self._thread = None
+        self._pid = None
+        # Encoded events a failed append left behind, written ahead of the next batch
+        self._unwritten = b""
+        self.events_written = 0
+        self.bytes_written = 0
+        self.writes = 0
+        self.write_errors = 0
+        self.events_dropped = 0
+        atexit.register(self.flush)
+
+    def extend(self, events):
+        # Called by the ledger after a commit: appending to a deque is all the request pays
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.extend(events)
+
+    def _start(self):
+        # The writer thread (and file descriptor) belong to one process; gunicorn workers
+        # fork after import, so each starts its own on first use
+        with self._write_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = collections.deque()
+            self._unwritten = b""
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._thread = threading.Thread(target=self._run, name="game-log-writer", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        # A failed flush must not end the thread: the queue would then grow for good.
+        # Only the first failure in a row is logged, not one per interval
+        failing = False
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                failing = False
+            except Exception:
+                self.write_errors += 1
+                if not failing:
+                    logger.exception("game log: appending to %s failed", self.path)
+                failing = True
+
+    def flush(self):
+        # Append everything queued so far in a single write. If the append fails, what wasn't
+        # written is kept and retried first next time, up to GAME_LOG_MAX_UNWRITTEN bytes.
+        with self._write_lock:
+            if self._fd is None or self._pid != os.getpid():
+                return
+            queue = self._queue
+            lines = []
+            while queue:
+                lines.append(encode_event(queue.popleft()))
+            data = self._unwritten
+            if lines:
+                data += ("\n".join(lines) + "\n").encode("utf-8")
+            if not data:
+                return
+            view = memoryview(data)
+            try:
+                while view:
+                    view = view[os.write(self._fd, view):]
+            finally:
+                written = len(data) - len(view)
+                self._unwritten = bytes(view)
+                if written:
+                    self.events_written += data.count(b"\n", 0, written)
+                    self.bytes_written += written
+                    self.writes += 1
+                if len(self._unwritten) > GAME_LOG_MAX_UNWRITTEN:
+                    self.events_dropped += self._unwritten.count(b"\n")
+                    self._unwritten = b""
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "queued": len(self._queue),
+            "unwritten_bytes": len(self._unwritten),
+            "events_written": self.events_written,
+            "bytes_written": self.bytes_written,
+            "writes": self.writes,
+            "write_errors": self.write_errors,
+            "events_dropped": self.events_dropped,
+        }
+
+
+# ----------------- AGGREGATES -----------------
+
+class RankedSet:
+    # Keys ordered by a numeric score, highest first, kept as a list of sorted buckets of at
+    # most 2 * bucket_size (-score, key) pairs. Finding an item is a bisect over the bucket
+    # maxima and one inside a bucket, and inserting or removing only shifts one bucket, so
+    # an update costs O(log n) comparisons plus a short memmove rather than an O(n) shift.
+    def __init__(self, bucket_size=RANKED_BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self._buckets = []
+        self._maxes = []
+        self._scores = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    def update(self, key, score):
+        old = self._scores.get(key)
+        if old == score:
+            return
+        if old is not None:
+            self._remove((-old, key))
+        self._scores[key] = score
+        self._insert((-score, key))
+
+    def _insert(self, item):
+        if not self._buckets:
+            self._buckets.append([item])
+            self._maxes.append(item)
+            return
+        index = min(bisect.bisect_left(self._maxes, item), len(self._buckets) - 1)
+        bucket = self._buckets[index]
+        bisect.insort(bucket, item)
+        self._maxes[index] = bucket[-1]
+        if len(bucket) > 2 * self.bucket_size:
+            self._buckets.insert(index + 1, bucket[self.bucket_size:])
+            del bucket[self.bucket_size:]
+            self._maxes.insert(index, bucket[-1])
+
+    def _remove(self, item):
+        index = bisect.bisect_left(self._maxes, item)
+        bucket = self._buckets[index]
+        del bucket[bisect.bisect_left(bucket, item)]
+        if bucket:
+            self._maxes[index] = bucket[-1]
+        else:
+            del self._buckets[index]
+            del self._maxes[index]
+
+    def top(self, count):
+        # [(key, score)] for the `count` highest scores
+        result = []
+        for bucket in self._buckets:
+            for negative_score, key in bucket:
+                if len(result) == count:
+                    return result
+                result.append((key, -negative_score))
+        return result
+
+    def rank(self, key):
+        # 1 for the highest score; None for unknown keys
+        score = self._scores.get(key)
+        if score is None:
+            return None
+        item = (-score, key)
+        index = bisect.bisect_left(self._maxes, item)
+        return sum(len(bucket) for bucket in self._buckets[:index]) + bisect.bisect_left(self._buckets[index], item) + 1
+
+
+class GameAggregates:
+    # Leaderboards and per-player stats, updated one event at a time
+    def __init__(self, starting_coins, wins_kept=LEADERBOARD_MAX):
+        self.starting_coins = starting_coins
+        self.wins_kept = wins_kept
+        self.balances = {}
+        self.richest = RankedSet()
+        self.players = {}
+        # Min-heap of the biggest single wins: (net win, sequence, event)
+        self._wins = []
+        self._sequence = 0
+        self.events = 0
+
+    def apply(self, event):
+        user_id = event["u"]
+        balance = self.balances.get(user_id, self.starting_coins) + event["p"] - event["c"]
+        self.balances[user_id] = balance
+        self.richest.update(user_id, balance)
+        self.events += 1
+
+        player = self.players.get(user_id)
+        if player is None:
+            player = self.players[user_id] = {"games": {}, "biggest_win": 0, "last_played": None}
+        game = event["g"]
+        if game not in GAMES:
+            return
+        net = net_win(event)
+        stats = player["games"].get(game)
+        if stats is None:
+            stats = player["games"][game] = {"rounds": 0, "wins": 0, "spent": 0, "won": 0}
+        stats["rounds"] += event["r"]
+        # A blackjack stake was already counted as spent when the game was dealt
+        stats["spent"] += event["c"]
+        stats["won"] += event["p"]
+        player["last_played"] = event["ts"]
+        if event["r"] and net > 0:
+            stats["wins"] += 1
+            # A bulk round ("!fish x1000") pays out many rounds at once, so only single
+            # rounds count as single wins
+            if event["r"] > 1:
+                return
+            player["biggest_win"] = max(player["biggest_win"], net)
+            self._sequence += 1
+            entry = (net, self._sequence, event)
+            if len(self._wins) < self.wins_kept:
+                heapq.heappush(self._wins, entry)
+            elif net > self._wins[0][0]:
+                heapq.heapreplace(self._wins, entry)
+
+    def top_richest(self, count):
+        return [{"rank": rank, "user_id": user_id, "balance": balance}
+                for rank, (user_id, balance) in enumerate(self.richest.top(count), 1)]
+
+    def biggest_wins(self, count):
+        # At most wins_kept entries, so sorting them is cheap
+        wins = heapq.nlargest(count, self._wins)
+        return [{
+            "rank": rank,
+            "user_id": event["u"],
+            "game": event["g"],
+            "won": net,
+            "rounds": event["r"],
+            "ts": event["ts"],
+            **({"details": event["x"]} if "x" in event else {}),
+        } for rank, (net, _, event) in enumerate(wins, 1)]
+
+    def player_stats(self, user_id):
+        player = self.players.get(user_id)
+        if player is None:
+            return None
+        games = {game: {**stats, "net": stats["won"] - stats["spent"]} for game, stats in player["games"].items()}
+        return {
+            "user_id": user_id,
+            "balance": self.balances[user_id],
+            "rank": self.richest.rank(user_id),
+            "players": len(self.richest),
+            "rounds": sum(stats["rounds"] for stats in games.values()),
+            "net": sum(stats["net"] for stats in games.values()),
+            "biggest_win": player["biggest_win"],
+            "last_played": player["last_played"],
+            "games": games,
+        }
+
+
+class LogFollower:
+    # Tails the event log and applies new events to a GameAggregates in a background thread
+    def __init__(self, path, aggregates, interval=GAME_LOG_FOLLOW_INTERVAL, catch_up_wait=GAME_LOG_CATCH_UP_WAIT,
+                 block_size=GAME_LOG_READ_BLOCK):
+        self.path = path
+        self.aggregates = aggregates
+        self.interval = interval
+        self.catch_up_wait = catch_up_wait
+        self.block_size = block_size
+        self.offset = 0
+        self._partial = b""
+        self.bad_lines = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._caught_up = threading.Event()
+        self._pid = None
+
+    def ensure_running(self):
+        # Started by the first leaderboard request in each worker. The follower thread reads
+        # the existing log; the request waits for that at most catch_up_wait seconds, so a
+        # big log gives it partial leaderboards rather than a stalled request
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._caught_up = threading.Event()
+                    threading.Thread(target=self._run, name="game-log-follower", daemon=True).start()
+                    self._pid = os.getpid()
+        self._caught_up.wait(self.catch_up_wait)
+
+    def _run(self):
+        # Errors are logged and the thread carries on: a dead follower would freeze the
+        # leaderboards and make every first leaderboard request wait out catch_up_wait
+        while True:
+            try:
+                self.catch_up()
+            except Exception:
+                self.errors += 1
+                logger.exception("game log: following %s failed", self.path)
+            self._caught_up.set()
+            time.sleep(self.interval)
+
+    def catch_up(self):
+        # Apply whatever was appended since the last call, block_size bytes at a time. The lock
+        # is let go between blocks so leaderboard reads don't wait for the whole backlog, and a
+        # line still being written stays in _partial until its newline arrives.
+        applied = 0
+        try:
+            with open(self.path, "rb") as log:
+                while True:
+                    with self._lock:
+                        log.seek(self.offset)
+                        data = log.read(self.block_size)
+                        if not data:
+                            return applied
+                        self.offset += len(data)
+                        data = self._partial + data
+                        end = data.rfind(b"\n") + 1
+                        self._partial = data[end:]
+                        lines = data[:end]
+                        events = decode_lines(lines)
+                        bad = lines.count(b"\n") - len(events)
+                        for event in events:
+                            try:
+                                self.aggregates.apply(event)
+                            except (KeyError, TypeError, ValueError):
+                                # Valid JSON but not an event
+                                bad += 1
+                        if bad:
+                            self.bad_lines += bad
+                            logger.warning("game log: skipped %d unreadable lines in %s", bad, self.path)
+                        applied += len(events)
+        except FileNotFoundError:
+            return applied
+
+    def read(self, fn):
+        # Run fn(aggregates) without racing the follower thread
+        with self._lock:
+            return fn(self.aggregates)
+
+    def stats(self):
+        return {"offset": self.offset, "events_applied": self.aggregates.events, "players": len(self.aggregates.balances),
+                "caught_up": self._caught_up.is_set(), "bad_lines": self.bad_lines, "errors": self.errors}
+
+
+def decode_lines(data):
+    # One json.loads over a whole block of lines, as a JSON array, is much faster than
+    # one call per line. A block with a broken line (torn by a crash mid-append, edited by
+    # hand) is decoded line by line instead, leaving out the lines that aren't events.
+    data = data.rstrip(b"\n")
+    if not data:
+        return []
+    try:
+        return json.loads(b"[" + data.replace(b"\n", b",") + b"]")
+    except ValueError:
+        pass
+    events = []
+    for line in data.split(b"\n"):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict):
+            events.append(event)
+    return events
+
+
+def create_game_log(starting_coins, path=GAME_LOG_PATH):
+    # The writer the ledger feeds and the follower serving leaderboards, or (None, None)
+    # when MOODBOT_GAME_LOG is empty
+    if not path:
+        return None, None
+    return EventLog(path), LogFollower(path, GameAggregates(starting_coins))
+
+
+# ----------------- REPLAY -----------------
+
+def replay(path, starting_coins, block_size=GAME_LOG_READ_BLOCK):
+    # Rebuild every player's balance from the log. Returns ({user_id: balance}, events read).
+    # Deltas are summed per raw (still escaped) user id and decoded once per player at the end.
+    deltas = collections.defaultdict(int)
+    count = skipped = 0
+    partial = b""
+    with open(path, "rb") as log:
+        while True:
+            block = log.read(block_size)
+            if not block:
+                break
+            block = partial + block
+            end = block.rfind(b"\n") + 1
+            partial = block[end:]
+            lines = block[:end]
+            matches = _event_prefix.findall(lines)
+            if len(matches) == lines.count(b"\n"):
+                # Fast path: only the user and the coin columns are needed, so skip full JSON decoding
+                for user_id, cost, payout in matches:
+                    deltas[user_id] += int(payout) - int(cost)
+                count += len(matches)
+            else:
+                # Lines not written by EventLog (edited by hand, other key order): decode them fully
+                events = decode_lines(lines)
+                read = 0
+                for event in events:
+                    try:
+                        deltas[encode_user_id(event["u"])] += event["p"] - event["c"]
+                    except (KeyError, TypeError):
+                        # Valid JSON but not an event
+                        continue
+                    read += 1
+                count += read
+                skipped += lines.count(b"\n") - read
+    if skipped:
+        logger.warning("game log: replay skipped %d unreadable lines in %s", skipped, path)
+    return {decode_user_id(user_id): starting_coins + delta for user_id, delta in deltas.items()}, count
+
+
+def encode_user_id(user_id):
+    # The raw bytes a user id has inside an encoded event (the fast path's dict keys)
+    return _encoder.encode(user_id)[1:-1].encode("utf-8")
+
+
+def decode_user_id(raw):
+    return json.loads(b'"' + raw + b'"')
+
+
+def compare_with_ledger(balances, ledger_path, starting_coins):
+    # [(user_id, replayed, ledger)] for every player whose balances differ. Players with no
+    # events (or no ledger row) have their starting coins.
+    conn = sqlite3.connect(ledger_path)
+    try:
+        stored = dict(conn.execute("SELECT user_id, coins FROM users"))
+    finally:
+        conn.close()
+    mismatches = []
+    for user_id in sorted(set(balances) | set(stored)):
+        replayed = balances.get(user_id, starting_coins)
+        if replayed != stored.get(user_id, starting_coins):
+            mismatches.append((user_id, replayed, stored.get(user_id, starting_coins)))
+    return mismatches
+
+
+def write_balances(balances, ledger_path):
+    # Restore balances into a ledger (creating it if needed); other columns are left alone
+    from ledger import Ledger
+    ledger = Ledger(ledger_path)
+    with ledger.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, coins) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET coins = excluded.coins",
+            balances.items(),
+        )
+
+
+if __name__ == '__main__':
+    from ledger import LEDGER_PATH, STARTING_COINS
+
+    parser = argparse.ArgumentParser(description="Rebuild player balances from the MoodBot game event log")
+    parser.add_argument("command", choices=("replay",))
+    parser.add_argument("--log", default=GAME_LOG_PATH or "moodbot_events.ndjson")
+    parser.add_argument("--ledger", default=LEDGER_PATH)
+    parser.add_argument("--starting-coins", type=int, default=STARTING_COINS)
+    parser.add_argument("--check", action="store_true", help="compare the rebuilt balances with the ledger")
+    parser.add_argument("--write", action="store_true", help="write the rebuilt balances into the ledger")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    balances, events = replay(args.log, args.starting_coins)
+    seconds = time.perf_counter() - started
+    print(f"replayed {events} events for {len(balances)} players in {seconds:.2f}s ({events / max(seconds, 1e-9):,.0f} events/s)")
+    if args.check:
+        mismatches = compare_with_ledger(balances, args.ledger, args.starting_coins)
+        for user_id, replayed, stored in mismatches[:20]:
+            print(f"  {user_id}: log {replayed}, ledger {stored}")
+        print(f"{len(mismatches)} players differ from {args.ledger}")
+    if args.write:
+        write_balances(balances, args.ledger)
+        print(f"wrote {len(balances)} balances to {args.ledger}")
@@ -0,0 +1,195 @@
+import collections
+import os
+import threading
+
+import numpy as np
+
+# Random game outcomes, pre-generated in bulk and replayable from (seed, draw).
+#
+# Each kind of outcome (die rolls, hunting events, catches, cards...) has a stream: a NumPy
+# Generator on Philox, a counter-based bit generator, with a 63-bit seed of its own, and a
+# function that turns an array of uniform doubles into outcomes. Draw n of a stream is the
+# outcome of the n-th double its generator produced. Philox makes four 64-bit values per
+# counter step and a double takes one, so replay_draws(seed, n) jumps straight to draw n
+# instead of regenerating everything before it.
+#
+# Outcomes are made RNG_BUFFER at a time: one NumPy call for the doubles, one vectorized
+# mapping to outcomes. A round takes the next one with an enumerate() iterator over the
+# buffer, whose next() gives (draw number, outcome) in one step that runs entirely in C, so
+# two threads can never get the same draw, a draw takes no lock, and it costs less than one
+# call into the random module. A background thread keeps each stream's next buffer ready;
+# moving on to it is the only step that takes the stream's lock, and generates the buffer
+# inline only if the thread fell behind. Bulk rounds ("!fish x100") take their doubles
+# straight from a second generator with a seed of its own, under the same lock: sharing the
+# buffers' generator would make their draws depend on when the background thread ran.
+#
+# A round's game event records [seed, draw number] of its first draw (key "d", see
+# game_log.py). That pair is all it takes to replay the round.
+#
+# Stream seeds come from a seed generator: fresh OS entropy in every process by default,
+# or MOODBOT_RNG_SEED for reproducible runs (tests, benchmarks). Every worker started with
+# the same fixed seed draws the same outcomes, so leave it unset in production.
+
+# Seed of the stream seeds; unset means unpredictable seeds from the OS
+RNG_SEED = int(os.environ["MOODBOT_RNG_SEED"]) if os.environ.get("MOODBOT_RNG_SEED") else None
+# Outcomes generated per buffer
+RNG_BUFFER = int(os.environ.get("MOODBOT_RNG_BUFFER", "1024"))
+
+
+def philox_generator(seed, draw=0):
+    # A generator whose next double is draw number `draw` of the stream seeded with `seed`
+    bit_generator = np.random.Philox(seed)
+    bit_generator.advance(draw // 4)
+    generator = np.random.Generator(bit_generator)
+    generator.random(draw % 4)
+    return generator
+
+
+class DrawStream:
+    def __init__(self, rng, name, outcomes):
+        self.rng = rng
+        self.name = name
+        # values (NumPy array of floats in [0, 1)) -> list of outcomes
+        self.outcomes = outcomes
+        self.reset()
+
+    def reset(self):
+        # The stream is only seeded on first use in each process
+        self.seed = None
+        self._generator = None
+        # Number of the generator's next double
+        self._position = 0
+        self.bulk_seed = None
+        self._bulk = None
+        self._bulk_position = 0
+        self._draws = iter(())
+        self._spare = None
+        self._lock = threading.Lock()
+        self.buffers = 0
+        self.inline_refills = 0
+        self.bulk_draws = 0
+
+    def draw(self):
+        # (draw number, outcome); the round's origin is [stream.seed, draw number]
+        draws = self._draws
+        try:
+            return next(draws)
+        except StopIteration:
+            return self._next_buffer(draws)
+
+    def draw_many(self, count):
+        # `count` consecutive doubles as a NumPy array, and the origin of the first,
+        # [bulk seed, draw number]; the rest follow it
+        with self._lock:
+            self._start()
+            first = self._bulk_position
+            self._bulk_position += count
+            self.bulk_draws += 1
+            return self._bulk.random(count), [self.bulk_seed, first]
+
+    def _start(self):
+        # Called with the lock held
+        if self._generator is None:
+            self.seed = self.rng.stream_seed()
+            self.bulk_seed = self.rng.stream_seed()
+            self._generator = philox_generator(self.seed)
+            self._bulk = philox_generator(self.bulk_seed)
+
+    def _generate(self):
+        # The next buffer of draws; called with the lock held
+        draws = enumerate(self.outcomes(self._generator.random(self.rng.buffer_size)), self._position)
+        self._position += self.rng.buffer_size
+        self.buffers += 1
+        return draws
+
+    def _next_buffer(self, exhausted):
+        # Called by every thread that found `exhausted` empty; only the first one moves on
+        with self._lock:
+            if self._draws is exhausted:
+                self._start()
+                if self._spare is not None:
+                    self._draws, self._spare = self._spare, None
+                else:
+                    self._draws = self._generate()
+                    self.inline_refills += 1
+        self.rng.request_refill(self)
+        return self.draw()
+
+    def refill(self):
+        with self._lock:
+            if self._spare is None and self._generator is not None:
+                self._spare = self._generate()
+
+    def stats(self):
+        return {"generated": self._position + self._bulk_position, "buffers": self.buffers,
+                "inline_refills": self.inline_refills, "bulk_draws": self.bulk_draws}
+
+
+class GameRng:
+    def __init__(self, seed=RNG_SEED, buffer_size=RNG_BUFFER, background=True):
+        self.seed = seed
+        self.buffer_size = buffer_size
+        self.background = background
+        self.streams = {}
+        self.reset()
+        # Reset on fork rather than checking os.getpid() on every draw, which costs more
+        # than the draw itself
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        # Start every stream over with new seeds. A forked worker must not hand out the
+        # draws its parent (or siblings) use; tests reset after changing seed or buffer_size
+        self._lock = threading.Lock()
+        self._seeds = None
+        self._queue = collections.deque()
+        self._wake = threading.Event()
+        self._refiller = None
+        for stream in self.streams.values():
+            stream.reset()
+
+    def stream(self, name, outcomes):
+        # A new stream of outcomes(values) draws; one per kind of outcome, made at import
+        stream = self.streams[name] = DrawStream(self, name, outcomes)
+        return stream
+
+    def stream_seed(self):
+        with self._lock:
+            if self._seeds is None:
+                self._seeds = np.random.default_rng(self.seed)
+            return int(self._seeds.integers(1 << 63))
+
+    def request_refill(self, stream):
+        # Queue a stream that just moved on to its spare buffer for a new one
+        if not self.background:
+            return
+        if self._refiller is None:
+            with self._lock:
+                if self._refiller is None:
+                    self._refiller = threading.Thread(target=self._refill, args=(self._queue, self._wake),
+                                                      name="rng-refiller", daemon=True)
+                    self._refiller.start()
+        self._queue.append(stream)
+        self._wake.set()
+
+    def _refill(self, queue, wake):
+        while True:
+            wake.wait()
+            wake.clear()
+            while queue:
+                queue.popleft().refill()
+
+    def stats(self):
+        streams = {name: stream.stats() for name, stream in self.streams.items()}
+        return {
+            "seeded": self.seed is not None,
+            "buffer_size": self.buffer_size,
+            **{key: sum(stats[key] for stats in streams.values())
+               for key in ("generated", "buffers", "inline_refills", "bulk_draws")},
+            "streams": streams,
+        }
+
+
+def replay_draws(seed, draw, count=1):
+    # Doubles `draw` .. `draw + count - 1` of the stream seeded with `seed` as a NumPy array,
+    # e.g. stream.outcomes(replay_draws(*event["d"])) to redo a logged round
+    return philox_generator(seed, draw).random(count)
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from game_log import ADJUSTMENT
+
+# Persistent coin ledger for MoodBot players, stored in SQLite.
+# Balances, the last daily reward date and any in-progress blackjack game live in one row
+# per user. Every balance change is a single conditional UPDATE inside a write transaction,
+# so concurrent requests (threads or gunicorn workers sharing the file) can never
+# create or lose coins. WAL mode keeps readers from blocking behind writers.
+#
+# With an event log attached, every balance change also produces a game event (see
+# game_log.py). Events are collected per transaction and handed to the log after COMMIT,
+# so rolled-back changes are never logged.
+
+LEDGER_PATH = os.environ.get("MOODBOT_LEDGER_PATH", "moodbot_ledger.sqlite3")
+# Coins a brand-new player starts with
+STARTING_COINS = 100
+
+
+class Ledger:
+    def __init__(self, path=LEDGER_PATH, starting_coins=STARTING_COINS, event_log=None):
+        self.path = path
+        self.starting_coins = starting_coins
+        self.event_log = event_log
+        self._local = threading.local()
+        with self.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id TEXT PRIMARY KEY, "
+                "coins INTEGER NOT NULL CHECK (coins >= 0), "
+                "last_daily_reward TEXT, "
+                "blackjack TEXT)"
+            )
+
+    def _connect(self):
+        # One connection per thread (and per process, since connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: transactions are only the ones we open explicitly
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+            self._local.events = []
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write sequences
+        # inside the block are atomic. Nested blocks join the outer transaction.
+        conn = self._connect()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.depth = 0
+            events = self._local.events
+            self._local.events = []
+        if events:
+            self.event_log.extend(events)
+
+    def _record(self, user_id, cost, payout, balance, event):
+        # Queue the event for this balance change; transaction() passes it on after COMMIT
+        if self.event_log is not None:
+            self._local.events.append({"ts": time.time(), "u": user_id, "c": cost, "p": payout, "b": balance, **event})
+
+    def _ensure_user(self, conn, user_id):
+        conn.execute(
+            "INSERT OR IGNORE INTO users (user_id, coins) VALUES (?, ?)",
+            (user_id, self.starting_coins),
+        )
+
+    def _coins(self, conn, user_id):
+        return conn.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def balance(self, user_id):
+        conn = self._connect()
+        row = conn.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else self.starting_coins
+
+    def settle(self, user_id, cost, payout=0, event=ADJUSTMENT):
+        # Charge `cost` and pay out `payout` in one step. Returns the new balance,
+        # or None (and changes nothing) if the player can't afford the cost.
+        # `event` describes the change for the event log (game_log.game_event()).
+        with self.transaction() as conn:
+            self._ensure_user(conn, user_id)
+            try:
+                updated = conn.execute(
+                    "UPDATE users SET coins = coins - ? + ? WHERE user_id = ? AND coins >= ?",
+                    (cost, payout, user_id, cost),
+                ).rowcount
+            except OverflowError:
+                # Amounts past SQLite's 64-bit integers (e.g. "!coin heads 99999999999999999999")
+                # are more than anyone can afford
+                return None
+            if not updated:
+                return None
+            balance = self._coins(conn, user_id)
+            self._record(user_id, cost, payout, balance, event)
+            return balance
+
+    def debit(self, user_id, amount):
+        return self.settle(user_id, amount, 0)
+
+    def credit(self, user_id, amount):
+        return self.settle(user_id, 0, amount)
+
+    def claim_daily(self, user_id, date, amount, event=ADJUSTMENT):
+        # Pay the daily reward once per `date` (an ISO string). Returns the new balance,
+        # or None if it was already claimed.
+        with self.transaction() as conn:
+            self._ensure_user(conn, user_id)
+            updated = conn.execute(
+                "UPDATE users SET coins = coins + ?, last_daily_reward = ? "
+                "WHERE user_id = ? AND (last_daily_reward IS NULL OR last_daily_reward != ?)",
+                (amount, date, user_id, date),
+            ).rowcount
+            if not updated:
+                return None
+            balance = self._coins(conn, user_id)
+            self._record(user_id, 0, amount, balance, event)
+            return balance
+
+    def get_blackjack(self, user_id):
+        conn = self._connect()
+        row = conn.execute("SELECT blackjack FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def start_blackjack(self, user_id, wager, game, event=ADJUSTMENT):
+        # Take the wager and store the new game together. Returns the new balance or None.
+        with self.transaction() as conn:
+            self._ensure_user(conn, user_id)
+            updated = conn.execute(
+                "UPDATE users SET coins = coins - ?, blackjack = ? WHERE user_id = ? AND coins >= ?",
+                (wager, json.dumps(game), user_id, wager),
+            ).rowcount
+            if not updated:
+                return None
+            balance = self._coins(conn, user_id)
+            self._record(user_id, wager, 0, balance, event)
+            return balance
+
+    def save_blackjack(self, user_id, game):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE users SET blackjack = ? WHERE user_id = ?",
+                (json.dumps(game) if game else None, user_id),
+            )
+
+    def finish_blackjack(self, user_id, payout, event=ADJUSTMENT):
+        # Pay out and clear the game in one step. Returns the new balance, or None if
+        # there was no game to finish (e.g. a duplicate "stand" already settled it).
+        with self.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE users SET coins = coins + ?, blackjack = NULL WHERE user_id = ? AND blackjack IS NOT NULL",
+                (payout, user_id),
+            ).rowcount
+            if not updated:
+                return None
+            balance = self._coins(conn, user_id)
+            self._record(user_id, 0, payout, balance, event)
+            return balance
+
+    def total_coins(self):
+        conn = self._connect()
+        return conn.execute("SELECT COALESCE(SUM(coins), 0) FROM users").fetchone()[0]
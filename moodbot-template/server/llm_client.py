@@ -0,0 +1,210 @@
+import contextvars
+import os
+import threading
+import time
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+# Process-wide OpenAI/OpenRouter client with a pooled, keep-alive HTTP connection pool.
+# Every LLM call shares the same client, so connections (and their TLS sessions) are reused
+# instead of being set up again for each chat message.
+
+# Pool and retry settings, overridable from the environment
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "30"))
+LLM_POOL_TIMEOUT = float(os.environ.get("LLM_POOL_TIMEOUT", "5"))
+# Retries use the OpenAI client's exponential backoff with jitter
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+
+
+# perf_counter() time at which the upstream's response headers arrived for the current
+# request (thread or task). Reset it with start_upstream_timer() before each call.
+response_started_at = contextvars.ContextVar("response_started_at", default=None)
+
+
+def start_upstream_timer():
+    response_started_at.set(None)
+    return time.perf_counter()
+
+
+class PoolMetrics:
+    # Thread-safe counters describing how the connection pool is being used
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.connections_opened = 0
+            self.connections_reused = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+
+    def record(self, opened, wait_seconds):
+        with self._lock:
+            self.requests += 1
+            if opened:
+                self.connections_opened += 1
+            else:
+                self.connections_reused += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": self.connections_reused,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    # Uses httpcore's trace hook to tell whether a request opened a new connection,
+    # and how long it waited before the pool handed it one
+    def __init__(self, metrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    def handle_request(self, request):
+        start = time.perf_counter()
+        state = {"opened": False, "acquired_at": None}
+
+        def trace(event_name, info):
+            if state["acquired_at"] is None:
+                state["acquired_at"] = time.perf_counter()
+            if event_name.startswith("connection.connect_tcp"):
+                state["opened"] = True
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = super().handle_request(request)
+            response_started_at.set(time.perf_counter())
+            return response
+        finally:
+            acquired_at = state["acquired_at"] or time.perf_counter()
+            self.metrics.record(state["opened"], acquired_at - start)
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    # Async twin of InstrumentedTransport (httpcore awaits the trace hook in async mode)
+    def __init__(self, metrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def handle_async_request(self, request):
+        start = time.perf_counter()
+        state = {"opened": False, "acquired_at": None}
+
+        async def trace(event_name, info):
+            if state["acquired_at"] is None:
+                state["acquired_at"] = time.perf_counter()
+            if event_name.startswith("connection.connect_tcp"):
+                state["opened"] = True
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = await super().handle_async_request(request)
+            response_started_at.set(time.perf_counter())
+            return response
+        finally:
+            acquired_at = state["acquired_at"] or time.perf_counter()
+            self.metrics.record(state["opened"], acquired_at - start)
+
+
+metrics = PoolMetrics()
+
+_client = None
+_single_try_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+_async_client = None
+_async_single_try_client = None
+_async_client_pid = None
+
+
+def pool_limits():
+    return httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def pool_timeout():
+    return httpx.Timeout(
+        LLM_READ_TIMEOUT,
+        connect=LLM_CONNECT_TIMEOUT,
+        pool=LLM_POOL_TIMEOUT,
+    )
+
+
+def create_http_client():
+    return httpx.Client(
+        transport=InstrumentedTransport(metrics, limits=pool_limits()),
+        timeout=pool_timeout(),
+    )
+
+
+def create_async_http_client():
+    return httpx.AsyncClient(
+        transport=InstrumentedAsyncTransport(metrics, limits=pool_limits()),
+        timeout=pool_timeout(),
+    )
+
+
+def get_client(base_url, api_key, retry=True):
+    # Return the shared client, building it on first use in each process.
+    # Gunicorn forks workers after import, so a client inherited from the parent
+    # (with sockets the child must not share) is replaced the first time a worker uses it.
+    # retry=False gives a copy on the same connection pool that never retries, for callers
+    # that move on to another model instead of waiting out the backoff
+    global _client, _single_try_client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = OpenAI(
+                    base_url=base_url,
+                    api_key=api_key,
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=create_http_client(),
+                )
+                _single_try_client = _client.with_options(max_retries=0)
+                _client_pid = pid
+    return _client if retry else _single_try_client
+
+
+def get_async_client(base_url, api_key, retry=True):
+    # Shared AsyncOpenAI client for the ASGI serving mode. Only the event loop thread
+    # touches it, so no lock is needed; it is still rebuilt after a fork.
+    global _async_client, _async_single_try_client, _async_client_pid
+    pid = os.getpid()
+    if _async_client is None or _async_client_pid != pid:
+        _async_client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=create_async_http_client(),
+        )
+        _async_single_try_client = _async_client.with_options(max_retries=0)
+        _async_client_pid = pid
+    return _async_client if retry else _async_single_try_client
+
+
+def pool_stats():
+    return {
+        **metrics.snapshot(),
+        "pool_size": LLM_POOL_SIZE,
+        "keepalive_connections": LLM_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": LLM_KEEPALIVE_EXPIRY,
+        "max_retries": LLM_MAX_RETRIES,
+    }
@@ -0,0 +1,351 @@
+import asyncio
+import os
+import threading
+import time
+
+# Admission control for LLM calls. Every upstream call goes through one UpstreamGuard
+# per worker process, which applies, in order:
+#
+#   1. single-flight: identical prompts already in flight share that call's reply
+#      instead of starting their own (only the leader goes through the steps below)
+#   2. circuit breaker: after LLM_BREAKER_FAILURES failures in a row, calls are refused
+#      for LLM_BREAKER_COOLDOWN seconds, then a single trial call decides whether to close it
+#   3. token bucket: at most LLM_RATE_LIMIT calls per second (bursts of LLM_RATE_BURST)
+#   4. bounded queue: LLM_MAX_IN_FLIGHT calls run at once (LLM_MAX_CONCURRENCY on the
+#      ASGI event loop), up to LLM_QUEUE_SIZE more wait for at most LLM_QUEUE_TIMEOUT seconds
+#
+# A call refused by steps 2-4 raises Rejected straight away, so the user gets a quick
+# "bot is napping" reply instead of a worker stuck behind a slow upstream.
+
+# Calls per second per worker; 0 disables the rate limit
+LLM_RATE_LIMIT = float(os.environ.get("LLM_RATE_LIMIT", "0"))
+LLM_RATE_BURST = int(os.environ.get("LLM_RATE_BURST", "20"))
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", "16"))
+# In-flight cap for the async LLM path in asgi.py, where a waiting call costs no thread
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_QUEUE_SIZE = int(os.environ.get("LLM_QUEUE_SIZE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "2"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+# Set to 0 to give every request its own upstream call
+LLM_SINGLE_FLIGHT = os.environ.get("LLM_SINGLE_FLIGHT", "1") != "0"
+
+
+class Rejected(Exception):
+    # The call was refused without reaching the upstream. reason is one of
+    # "circuit_open", "rate_limited", "queue_full" or "queue_timeout".
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN, clock=time.monotonic):
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.clock() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            # Half-open: let exactly one trial call through
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def release_trial(self):
+        # The trial call never reached the upstream (refused further on, or cancelled)
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+
+class AdmissionQueue:
+    # Caps concurrent calls; callers beyond the cap wait in a bounded queue
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, queue_size=LLM_QUEUE_SIZE, timeout=LLM_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            if self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.queue_size:
+                    raise Rejected("queue_full")
+                self.waiting += 1
+                try:
+                    if not self._condition.wait_for(lambda: self.in_flight < self.max_in_flight, self.timeout):
+                        raise Rejected("queue_timeout")
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class AsyncAdmissionQueue:
+    # Event-loop twin of AdmissionQueue for the ASGI serving mode (one loop per worker)
+    def __init__(self, max_in_flight=LLM_MAX_CONCURRENCY, queue_size=LLM_QUEUE_SIZE, timeout=LLM_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            # Created lazily so it binds to the worker's running event loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                raise Rejected("queue_full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                raise Rejected("queue_timeout") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class UpstreamGuard:
+    def __init__(self, rate=LLM_RATE_LIMIT, burst=LLM_RATE_BURST, max_in_flight=LLM_MAX_IN_FLIGHT,
+                 queue_size=LLM_QUEUE_SIZE, queue_timeout=LLM_QUEUE_TIMEOUT, single_flight=LLM_SINGLE_FLIGHT,
+                 async_max_in_flight=LLM_MAX_CONCURRENCY):
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.breaker = CircuitBreaker()
+        self.queue = AdmissionQueue(max_in_flight, queue_size, queue_timeout)
+        self.async_queue = AsyncAdmissionQueue(async_max_in_flight, queue_size, queue_timeout)
+        self.single_flight = single_flight
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.rejections = {}
+
+    def _reject(self, reason):
+        with self._lock:
+            self.rejections[reason] = self.rejections.get(reason, 0) + 1
+        raise Rejected(reason)
+
+    def _check_limits(self):
+        if not self.breaker.allow():
+            self._reject("circuit_open")
+        if self.bucket is not None and not self.bucket.try_acquire():
+            # The breaker may have handed out its half-open trial; give it back unused
+            self.breaker.release_trial()
+            self._reject("rate_limited")
+
+    # ----------------- THREADED (FLASK) CALLS -----------------
+
+    def admit(self):
+        # Context manager for one upstream call (used directly by the streaming route)
+        return _Admission(self)
+
+    def call(self, key, fn):
+        # Run fn() under admission control, sharing the result with identical in-flight calls.
+        # key identifies the prompt; None opts out of single-flight.
+        if not self.single_flight or key is None:
+            with self.admit():
+                return fn()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            with self.admit():
+                flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    # ----------------- EVENT LOOP (ASGI) CALLS -----------------
+
+    async def call_async(self, key, coroutine_fn):
+        if not self.single_flight or key is None:
+            return await self._admitted_async(coroutine_fn)
+        # Only the event loop thread touches _async_flights, so no lock is needed
+        future = self._async_flights.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = future
+        try:
+            result = await self._admitted_async(coroutine_fn)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting for it
+            future.exception()
+            raise
+        finally:
+            del self._async_flights[key]
+
+    async def _admitted_async(self, coroutine_fn):
+        self._check_limits()
+        try:
+            await self.async_queue.acquire()
+        except Rejected as e:
+            self.breaker.release_trial()
+            self._reject(e.reason)
+        with self._lock:
+            self.calls += 1
+        try:
+            result = await coroutine_fn()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the upstream
+            self.breaker.release_trial()
+            raise
+        finally:
+            self.async_queue.release()
+        self.breaker.record_success()
+        return result
+
+    def retry_after(self):
+        # Seconds a refused client should wait: the rest of the breaker cooldown, or a short pause
+        breaker = self.breaker
+        if breaker.state == "open":
+            remaining = breaker.cooldown - (breaker.clock() - breaker.opened_at)
+            return int(min(max(remaining, 0), breaker.cooldown)) + 1
+        return 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "rejected": sum(self.rejections.values()),
+                **{f"rejected_{reason}": count for reason, count in sorted(self.rejections.items())},
+                "in_flight": self.queue.in_flight + self.async_queue.in_flight,
+                "waiting": self.queue.waiting + self.async_queue.waiting,
+                "breaker_open": int(self.breaker.state != "closed"),
+                "breaker_trips": self.breaker.trips,
+            }
+
+
+class _Admission:
+    __slots__ = ("guard",)
+
+    def __init__(self, guard):
+        self.guard = guard
+
+    def __enter__(self):
+        guard = self.guard
+        guard._check_limits()
+        try:
+            guard.queue.acquire()
+        except Rejected as e:
+            guard.breaker.release_trial()
+            guard._reject(e.reason)
+        with guard._lock:
+            guard.calls += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.guard.queue.release()
+        if exc_type is None:
+            self.guard.breaker.record_success()
+        elif issubclass(exc_type, Exception):
+            self.guard.breaker.record_failure()
+        else:
+            # The client went away mid-stream: no verdict on the upstream
+            self.guard.breaker.release_trial()
+        return False
+
+
+def prompt_key(messages):
+    # Two requests coalesce only if they would send exactly the same prompt. The model
+    # isn't part of the key: the router picks it per call, and the mode (which sets the
+    # reply length) is already in the system message.
+    return tuple((message["role"], message["content"]) for message in messages)
@@ -0,0 +1,243 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+
+# Request metrics for MoodBot, exposed in the Prometheus text format on GET /metrics.
+# Counters and histograms live in this process, like the LLM pool stats; with several
+# gunicorn workers each worker keeps (and serves) its own numbers.
+#
+# Everything on the request path is a lock, a bisect and a couple of additions, so the
+# instrumentation costs a few microseconds per request.
+
+# Sampling profiler: when enabled, a request carrying "X-Profile: 1" is sampled every
+# MOODBOT_PROFILE_INTERVAL seconds and its folded stacks (flamegraph.pl / speedscope
+# input) are written to MOODBOT_PROFILE_DIR. Off by default so clients can't turn it on.
+PROFILING_ENABLED = os.environ.get("MOODBOT_PROFILING", "") == "1"
+PROFILE_INTERVAL = float(os.environ.get("MOODBOT_PROFILE_INTERVAL", "0.001"))
+PROFILE_DIR = os.environ.get("MOODBOT_PROFILE_DIR", "profiles")
+
+# Histogram buckets in seconds, from sub-millisecond game commands to slow completions
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = collections.defaultdict(float)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in series_items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = format_labels(self.labels, label_values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total:.6f}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "moodbot_request_seconds", "Time spent handling a request, by route, game command and chat mode",
+    ("route", "command", "mode"),
+)
+STAGE_SECONDS = Histogram(
+    "moodbot_stage_seconds", "Time spent in each stage of a request (parse, command, cache, prompt, queue, first_token, upstream, serialize)",
+    ("route", "stage"),
+)
+UPSTREAM_TTFB_SECONDS = Histogram(
+    "moodbot_upstream_ttfb_seconds", "Time until the LLM upstream started answering (response headers, or the first streamed token)",
+    ("route", "mode"),
+)
+UPSTREAM_SECONDS = Histogram(
+    "moodbot_upstream_seconds", "Total time of an LLM upstream call",
+    ("route", "mode"),
+)
+REQUESTS = Counter("moodbot_requests_total", "Requests handled, by route and HTTP status", ("route", "status"))
+LLM_TOKENS = Counter("moodbot_llm_tokens_total", "Tokens reported by the LLM upstream", ("mode", "kind"))
+ERRORS = Counter("moodbot_errors_total", "Failed LLM calls, by route and exception type", ("route", "error"))
+REJECTIONS = Counter("moodbot_llm_rejections_total", "LLM calls refused by admission control, by route and reason", ("route", "reason"))
+MODEL_SECONDS = Histogram(
+    "moodbot_llm_model_seconds", "Time of each upstream call made by the model router, by model and outcome (ok, error, cancelled)",
+    ("model", "outcome"),
+)
+
+REGISTRY = (REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_TTFB_SECONDS, UPSTREAM_SECONDS, REQUESTS, LLM_TOKENS, ERRORS, REJECTIONS,
+            MODEL_SECONDS)
+
+
+class StageTimer:
+    # Splits one request into consecutive stages: mark("parse") records the time since
+    # the previous mark (or the start) under "parse"
+    __slots__ = ("started", "last", "stages")
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.stages = []
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+        return now
+
+    def finish(self, route):
+        for stage, seconds in self.stages:
+            STAGE_SECONDS.observe(seconds, route, stage)
+        return time.perf_counter() - self.started
+
+
+def record_request(route, status, seconds, command="", mode=""):
+    REQUEST_SECONDS.observe(seconds, route, command, mode)
+    REQUESTS.inc(route, str(status))
+
+
+def record_upstream(route, mode, started, ttfb_at, usage=None):
+    # `started` and `ttfb_at` are perf_counter() times; usage is the completion's usage object
+    now = time.perf_counter()
+    UPSTREAM_SECONDS.observe(now - started, route, mode)
+    if ttfb_at is not None:
+        UPSTREAM_TTFB_SECONDS.observe(ttfb_at - started, route, mode)
+    if usage is not None:
+        LLM_TOKENS.inc(mode, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+        LLM_TOKENS.inc(mode, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
+
+
+def record_error(route, error):
+    ERRORS.inc(route, type(error).__name__)
+
+
+def record_rejection(route, reason):
+    REJECTIONS.inc(route, reason)
+
+
+def record_model_call(model, outcome, seconds):
+    MODEL_SECONDS.observe(seconds, model, outcome)
+
+
+def render_gauges(prefix, stats):
+    # Expose a stats dict (like pool_stats()) as gauges; non-numeric entries are skipped
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {prefix}_{key} gauge")
+        lines.append(f"{prefix}_{key} {value:g}")
+    return lines
+
+
+def render(*extra_lines):
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for block in extra_lines:
+        lines.extend(block)
+    return "\n".join(lines) + "\n"
+
+
+# ----------------- SAMPLING PROFILER -----------------
+
+class SamplingProfiler:
+    # Samples one thread's Python stack from a background thread and counts folded
+    # stacks ("outer;inner;leaf"). Only the profiled request pays for it.
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+def profile_path(route):
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}{route.replace('/', '_')}.folded"
+    return os.path.join(PROFILE_DIR, name)
+
+
+def write_profile(path, samples):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
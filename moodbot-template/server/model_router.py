@@ -0,0 +1,374 @@
+import asyncio
+import collections
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+# Picks which LLM answers each chat message. Every mode has a pool of models (all of
+# LLM_MODELS unless LLM_MODE_MODELS narrows it) and a max_tokens limit. For each model
+# the router keeps an exponentially weighted moving average (EWMA) of its call latency
+# and error rate, and sends a chat to the model with the lowest expected latency. A model
+# whose error rate goes above LLM_ROUTER_MAX_ERROR_RATE moves to the back of the line.
+# A model that was passed over gets no new samples, so any model not called for
+# LLM_ROUTER_PROBE_INTERVAL seconds gets one probe call; that way a model that was slow or
+# failing for a while can win its traffic back.
+#
+# When a call fails, the next model is tried (up to LLM_ROUTER_ATTEMPTS models per chat).
+# Those calls go out without the client's retries (LLM_MAX_RETRIES), so falling back
+# doesn't wait for a failing model's backoff; a single-model pool keeps the retries.
+# With LLM_HEDGE=1, a call still running after its model's recent p95 latency gets a second
+# call on the next model, and whichever answers first wins. Hedges only fire on the slowest
+# ~5% of calls, so they cost about 5% more upstream calls and cut the tail.
+
+DEFAULT_MODEL = "mistralai/mistral-7b-instruct:free"
+DEFAULT_MAX_TOKENS = 100
+
+# Comma-separated model pool, best guess first (used until there are latency samples)
+LLM_MODELS = [model.strip() for model in os.environ.get("LLM_MODELS", DEFAULT_MODEL).split(",") if model.strip()]
+# Per-mode model pools, e.g. "sarcastic=model-a|model-b,existential=model-c"
+LLM_MODE_MODELS = os.environ.get("LLM_MODE_MODELS", "")
+# Reply length limit for every mode, and per-mode overrides, e.g. "existential=160,normal=80"
+LLM_MAX_TOKENS = int(os.environ.get("LLM_MAX_TOKENS", str(DEFAULT_MAX_TOKENS)))
+LLM_MODE_MAX_TOKENS = os.environ.get("LLM_MODE_MAX_TOKENS", "")
+# Models tried for one chat, counting the first
+LLM_ROUTER_ATTEMPTS = int(os.environ.get("LLM_ROUTER_ATTEMPTS", "2"))
+# Weight of the newest sample in the latency and error rate averages
+LLM_ROUTER_ALPHA = float(os.environ.get("LLM_ROUTER_ALPHA", "0.2"))
+LLM_ROUTER_MAX_ERROR_RATE = float(os.environ.get("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+LLM_ROUTER_PROBE_INTERVAL = float(os.environ.get("LLM_ROUTER_PROBE_INTERVAL", "10"))
+# Hedging: off by default since it spends extra upstream calls
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+# Never hedge sooner than this, however fast the model has been
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "0.25"))
+# Threads running hedged calls in the Flask mode (each hedged chat takes up to two)
+LLM_HEDGE_THREADS = int(os.environ.get("LLM_HEDGE_THREADS", "32"))
+
+# Latency samples kept per model for the p95, and how many are needed before hedging
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+
+
+def parse_mode_settings(text, convert):
+    # "mode=value,mode=value" -> {mode: convert(value)}
+    settings = {}
+    for item in text.split(","):
+        if "=" in item:
+            mode, value = item.split("=", 1)
+            settings[mode.strip()] = convert(value.strip())
+    return settings
+
+
+def parse_model_list(text):
+    return [model.strip() for model in text.split("|") if model.strip()]
+
+
+class ModelStats:
+    # Latency and error averages of one model. Updated under the router's lock.
+    __slots__ = ("model", "latency", "error_rate", "calls", "failures", "in_flight", "last_attempt",
+                 "samples", "_p95", "_p95_stale")
+
+    def __init__(self, model):
+        self.model = model
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.last_attempt = 0.0
+        self.samples = collections.deque(maxlen=LATENCY_WINDOW)
+        self._p95 = None
+        self._p95_stale = 0
+
+    def record(self, seconds, failed, alpha):
+        # failed=None: the call was cancelled after `seconds`, so only the latency is known (a lower bound)
+        if failed is not None:
+            self.calls += 1
+            self.failures += failed
+            self.error_rate += alpha * (failed - self.error_rate)
+        if not failed:
+            self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+            self.samples.append(seconds)
+            self._p95_stale += 1
+
+    def p95(self):
+        # Re-sorting the window on every call would be wasted work; refresh it every 10 samples
+        if len(self.samples) < MIN_HEDGE_SAMPLES:
+            return None
+        if self._p95 is None or self._p95_stale >= 10:
+            ordered = sorted(self.samples)
+            self._p95 = ordered[int(len(ordered) * 0.95) - 1]
+            self._p95_stale = 0
+        return self._p95
+
+    def score(self):
+        # Expected seconds until a good reply; untried models score 0 so each gets a first call
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(1.0 - self.error_rate, 0.05)
+
+    def snapshot(self):
+        p95 = self.p95()
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+        }
+
+
+class ModelRouter:
+    def __init__(self, models=None, mode_models=None, max_tokens=LLM_MAX_TOKENS, mode_max_tokens=None,
+                 attempts=LLM_ROUTER_ATTEMPTS, hedge=LLM_HEDGE, hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+                 alpha=LLM_ROUTER_ALPHA, max_error_rate=LLM_ROUTER_MAX_ERROR_RATE,
+                 probe_interval=LLM_ROUTER_PROBE_INTERVAL, clock=time.monotonic):
+        self.models = list(models or LLM_MODELS or [DEFAULT_MODEL])
+        self.mode_models = mode_models if mode_models is not None else parse_mode_settings(LLM_MODE_MODELS, parse_model_list)
+        self.max_tokens_default = max_tokens
+        self.mode_max_tokens = mode_max_tokens if mode_max_tokens is not None else parse_mode_settings(LLM_MODE_MAX_TOKENS, int)
+        self.attempts = max(1, attempts)
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.probe_interval = probe_interval
+        self.clock = clock
+        self._stats = {}
+        for model in self.models + [model for pool in self.mode_models.values() for model in pool]:
+            self._stats.setdefault(model, ModelStats(model))
+        self._lock = threading.Lock()
+        self._executor = None
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def max_tokens(self, mode):
+        return self.mode_max_tokens.get(mode, self.max_tokens_default)
+
+    def falls_back(self, mode):
+        # Whether a failed call in this mode moves on to another model. If it does, the calls
+        # should skip the client's own retries: they back off on the same model before the
+        # router ever gets to fall back
+        return self.attempts > 1 and len(self.mode_models.get(mode) or self.models) > 1
+
+    def candidates(self, mode):
+        # The mode's models, best first: models due a probe, healthy ones by score, then the rest
+        now = self.clock()
+        with self._lock:
+            ranked = []
+            for position, model in enumerate(self.mode_models.get(mode) or self.models):
+                stats = self._stats[model]
+                if now - stats.last_attempt >= self.probe_interval:
+                    ranked.append((False, 0.0, position, model))
+                else:
+                    ranked.append((stats.error_rate > self.max_error_rate, stats.score(), position, model))
+            ranked.sort()
+        return [model for _, _, _, model in ranked[:self.attempts]]
+
+    def hedge_delay(self, model):
+        # Seconds to wait for `model` before hedging, or None while it has too few samples
+        with self._lock:
+            p95 = self._stats[model].p95()
+        return None if p95 is None else max(p95, self.hedge_min_delay)
+
+    def _started(self, model):
+        with self._lock:
+            stats = self._stats[model]
+            stats.in_flight += 1
+            stats.last_attempt = self.clock()
+
+    def _finished(self, model, seconds, failed):
+        with self._lock:
+            stats = self._stats[model]
+            stats.in_flight -= 1
+            stats.record(seconds, failed, self.alpha)
+        outcome = "cancelled" if failed is None else ("error" if failed else "ok")
+        metrics.record_model_call(model, outcome, seconds)
+
+    # ----------------- THREADED (FLASK) CALLS -----------------
+
+    def complete(self, mode, call):
+        # call(model, max_tokens) makes one upstream call and returns the reply
+        candidates = self.candidates(mode)
+        max_tokens = self.max_tokens(mode)
+        # No hedging until the first model has enough samples for a p95
+        deadline = self.hedge_delay(candidates[0]) if self.hedge and len(candidates) > 1 else None
+        if deadline is not None:
+            return self._complete_hedged(candidates, max_tokens, call, deadline)
+        error = None
+        for index, model in enumerate(candidates):
+            if index:
+                with self._lock:
+                    self.fallbacks += 1
+            try:
+                return self._attempt(model, max_tokens, call)
+            except Exception as e:
+                error = e
+        raise error
+
+    def _attempt(self, model, max_tokens, call):
+        self._started(model)
+        started = time.perf_counter()
+        try:
+            reply = call(model, max_tokens)
+        except Exception:
+            self._finished(model, time.perf_counter() - started, True)
+            raise
+        self._finished(model, time.perf_counter() - started, False)
+        return reply
+
+    def _executor_for_calls(self):
+        # Created on first use so gunicorn workers start their threads after the fork
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(LLM_HEDGE_THREADS, thread_name_prefix="llm-hedge")
+        return self._executor
+
+    def _complete_hedged(self, candidates, max_tokens, call, deadline):
+        # Blocking calls can't be cancelled: a losing call runs to the end in its thread,
+        # and its latency still feeds that model's averages
+        executor = self._executor_for_calls()
+        pending = {executor.submit(self._attempt, candidates[0], max_tokens, call): candidates[0]}
+        remaining = candidates[1:]
+        error = None
+        while pending:
+            done, _ = wait(pending, timeout=deadline if remaining else None, return_when=FIRST_COMPLETED)
+            deadline = None
+            if not done:
+                # Slower than its p95: ask the next model too
+                with self._lock:
+                    self.hedges += 1
+                model = remaining.pop(0)
+                pending[executor.submit(self._attempt, model, max_tokens, call)] = model
+                continue
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    reply = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if model != candidates[0]:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return reply
+            if remaining and not pending:
+                with self._lock:
+                    self.fallbacks += 1
+                model = remaining.pop(0)
+                pending[executor.submit(self._attempt, model, max_tokens, call)] = model
+        raise error
+
+    # ----------------- EVENT LOOP (ASGI) CALLS -----------------
+
+    async def complete_async(self, mode, call):
+        # call(model, max_tokens) is a coroutine function making one upstream call
+        candidates = self.candidates(mode)
+        max_tokens = self.max_tokens(mode)
+        # No hedging until the first model has enough samples for a p95
+        deadline = self.hedge_delay(candidates[0]) if self.hedge and len(candidates) > 1 else None
+        if deadline is not None:
+            return await self._complete_hedged_async(candidates, max_tokens, call, deadline)
+        error = None
+        for index, model in enumerate(candidates):
+            if index:
+                with self._lock:
+                    self.fallbacks += 1
+            try:
+                return await self._attempt_async(model, max_tokens, call)
+            except Exception as e:
+                error = e
+        raise error
+
+    async def _attempt_async(self, model, max_tokens, call):
+        self._started(model)
+        started = time.perf_counter()
+        try:
+            reply = await call(model, max_tokens)
+        except Exception:
+            self._finished(model, time.perf_counter() - started, True)
+            raise
+        except BaseException:
+            self._finished(model, time.perf_counter() - started, None)
+            raise
+        self._finished(model, time.perf_counter() - started, False)
+        return reply
+
+    async def _complete_hedged_async(self, candidates, max_tokens, call, deadline):
+        # Unlike the threaded path, the losing call is cancelled as soon as there is a winner
+        def start(model):
+            task = asyncio.ensure_future(self._attempt_async(model, max_tokens, call))
+            pending[task] = model
+
+        pending = {}
+        start(candidates[0])
+        remaining = candidates[1:]
+        error = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=deadline if remaining else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                deadline = None
+                if not done:
+                    with self._lock:
+                        self.hedges += 1
+                    start(remaining.pop(0))
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    try:
+                        reply = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if model != candidates[0]:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return reply
+                if remaining and not pending:
+                    with self._lock:
+                        self.fallbacks += 1
+                    start(remaining.pop(0))
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ----------------- STREAMS -----------------
+
+    def stream_model(self, mode):
+        # Streams can't switch models once tokens have gone out, so they just take the best one.
+        # Report how it went with finish_stream().
+        model = self.candidates(mode)[0]
+        self._started(model)
+        return model
+
+    def finish_stream(self, model, seconds, failed):
+        # A stream lasts as long as its reply, so only the outcome feeds the averages
+        # (failed=None: the client went away)
+        with self._lock:
+            stats = self._stats[model]
+            stats.in_flight -= 1
+            if failed is not None:
+                stats.calls += 1
+                stats.failures += failed
+                stats.error_rate += self.alpha * (failed - stats.error_rate)
+        outcome = "cancelled" if failed is None else ("error" if failed else "ok")
+        metrics.record_model_call(model, outcome, seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hedging": self.hedge,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "fallbacks": self.fallbacks,
+                "models": {model: stats.snapshot() for model, stats in self._stats.items()},
+                "mode_models": {mode: list(models) for mode, models in self.mode_models.items()},
+                "max_tokens": {"default": self.max_tokens_default, **self.mode_max_tokens},
+            }
@@ -0,0 +1,95 @@
+import json
+
+# Reply text and serialization for game commands.
+#
+# Text that only depends on the outcome (which hunt event, which catch) is rendered once
+# at import and kept next to the loot tables in commands.py, so a round is a lookup.
+# Outcomes that echo what the player did (dice and coin bets, blackjack hands) are
+# rendered per round.
+#
+# Clients that render the text themselves can ask for compact replies: every reply with a
+# structured outcome ("result" or "game_state") is sent without its "response" text.
+# Usage help and refusals have nothing to render from, so they keep theirs.
+
+# Game replies skip jsonify: no key sorting, UTF-8 instead of a \u escape per emoji,
+# no whitespace and no circular-reference check (payloads are flat dicts and lists)
+REPLY_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+encode_reply = REPLY_ENCODER.encode
+
+# ----------------- TEMPLATES -----------------
+
+HUNT_REPLY = "🏹 You went on an epic hunt! {description} You gained {reward} coins! 💰 (Cost: {cost} coins)".format
+FISH_REPLY = "🎣 You cast your line with expert precision and caught a **{name}**! {description} You gained {reward} coins! 💰 (Cost: {cost} coins)".format
+
+# Replies that fill in per-round values are plain functions around an f-string: str.format
+# parses its template on every call and measured about 2.5x slower
+
+
+def dice_win_reply(roll, bet, reward):
+    return f"🎲✨ AMAZING! You rolled a {roll}! Your bet '{bet}' was correct. You won {reward} coins! Lady Luck smiles upon you! 🍀"
+
+
+def dice_lose_reply(roll, bet, wager):
+    return f"🎲 You rolled a {roll}. Your bet '{bet}' was incorrect. You lost {wager} coins. The dice gods are fickle today! 😔"
+
+
+def coin_reply(prediction, landed, amount):
+    # Coin calls are only ever heads or tails, so the text around the amount is rendered
+    # once per (call, landing) pair
+    head, tail = COIN_REPLY_PARTS[prediction, landed]
+    return f"{head}{amount}{tail}"
+
+
+COIN_REPLY_PARTS = {
+    (prediction, landed): (
+        (f"🎉 The coin landed on **{landed.capitalize()}**! You predicted **{prediction.capitalize()}** and WON ",
+         " coins! Fortune favors you today! 🍀")
+        if prediction == landed else
+        (f"😔 The coin landed on **{landed.capitalize()}**. You predicted **{prediction.capitalize()}** and lost ",
+         " coins. Better luck next time! 🪙")
+    )
+    for prediction in ("heads", "tails")
+    for landed in ("heads", "tails")
+}
+
+
+def blackjack_start_reply(wager, player_cards, player_total, dealer_card):
+    return (f"🃏 Blackjack game started! You confidently wagered {wager} coins. 💰\n"
+            f"Your cards: {player_cards} (Total: {player_total}) 🎴\n"
+            f"Dealer's card: {dealer_card} 🎭\n"
+            "Type `!blackjack hit` to draw another card or `!blackjack stand` to end your turn. Good luck! 🍀")
+
+
+def blackjack_hit_reply(card, player_cards, player_total, dealer_card):
+    return (f"🎴 You drew a card ({card}). Your total: {player_total} 🔢\n"
+            f"Your cards: {player_cards} 🎴\n"
+            f"Dealer's card: {dealer_card} 🎭\n"
+            "What's your next move? Type `!blackjack hit` or `!blackjack stand` 🤔")
+
+
+def blackjack_bust_reply(balance, player_cards, player_total, dealer_cards, dealer_total):
+    return (f"💥 BUST! You went over with {player_total}! Dealer wins this round. 😔\n"
+            f"Your cards: {player_cards} 🎴\n"
+            f"Dealer's cards: {dealer_cards} (Total: {dealer_total}) 🎭\n"
+            f"Final balance: {balance} coins 💰")
+
+
+def blackjack_stand_reply(result, balance, player_cards, player_total, dealer_cards, dealer_total):
+    if result == "win":
+        headline = f"🎉 VICTORY! You win with {player_total} vs dealer's {dealer_total}! 🏆"
+    elif result == "tie":
+        headline = f"🤝 It's a tie! {player_total} vs {dealer_total} - Your wager has been returned."
+    else:
+        headline = f"😔 Dealer wins with {dealer_total} vs your {player_total}. Better luck next time!"
+    return (f"{headline}\nYour cards: {player_cards} (Total: {player_total}) 🎴"
+            f"\nDealer's cards: {dealer_cards} (Total: {dealer_total}) 🎭"
+            f"\nYou {result}! Final balance: {balance} coins 💰")
+
+
+def compact(payload):
+    # The reply without its text, when the client can render it from the structured fields
+    if "result" not in payload and "game_state" not in payload:
+        return payload
+    payload = dict(payload)
+    payload.pop("response", None)
+    return payload
@@ -0,0 +1,191 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Opt-in cache for chatbot replies, keyed by (mode, normalized input).
+# Repeated messages like "hi" or "roast me" are answered from the cache instead of
+# paying for another slow upstream round-trip. Each key can hold several reply
+# variants; once it has `variants` of them, a random one is returned so cached
+# answers don't feel canned. Identical replies are kept as separate samples, so a
+# model that always says the same thing still fills its slots and starts hitting.
+
+# Cache settings, overridable from the environment. MOODBOT_REPLY_CACHE picks the backend:
+# unset/empty disables the cache, "memory" keeps it per process, "sqlite" shares it across workers.
+REPLY_CACHE_BACKEND = os.environ.get("MOODBOT_REPLY_CACHE", "")
+REPLY_CACHE_PATH = os.environ.get("MOODBOT_REPLY_CACHE_PATH", "reply_cache.sqlite3")
+REPLY_CACHE_SIZE = int(os.environ.get("MOODBOT_REPLY_CACHE_SIZE", "1000"))
+REPLY_CACHE_TTL = float(os.environ.get("MOODBOT_REPLY_CACHE_TTL", "3600"))
+REPLY_CACHE_VARIANTS = int(os.environ.get("MOODBOT_REPLY_CACHE_VARIANTS", "3"))
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_input(text):
+    # "Roast me!!", " roast   me " and "roast me" all share one cache entry
+    return _whitespace.sub(" ", text.lower()).strip(" .,!?~")
+
+
+class MemoryBackend:
+    # In-process LRU with per-entry TTL; each worker process has its own copy
+    def __init__(self, max_entries=REPLY_CACHE_SIZE, ttl=REPLY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, variants = entry
+            if now - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return list(variants)
+
+    def add_variant(self, key, reply, max_variants):
+        # Returns the number of entries evicted to stay within max_entries
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl:
+                entry = (now, [])
+            created, variants = entry
+            if len(variants) < max_variants:
+                variants = variants + [reply]
+            self._entries[key] = (created, variants)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+
+class SQLiteBackend:
+    # File-backed cache shared by every worker that points at the same path.
+    # WAL mode lets readers proceed while another worker writes.
+    def __init__(self, path=REPLY_CACHE_PATH, max_entries=REPLY_CACHE_SIZE, ttl=REPLY_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reply_cache ("
+                "key TEXT PRIMARY KEY, variants TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS reply_cache_last_used ON reply_cache (last_used)")
+
+    def _connect(self):
+        # One connection per thread (and per process, since connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT variants, created FROM reply_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM reply_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE reply_cache SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def add_variant(self, key, reply, max_variants):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock up front so concurrent workers don't lose variants
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT variants, created FROM reply_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                variants, created = [], now
+            else:
+                variants, created = json.loads(row[0]), row[1]
+            if len(variants) < max_variants:
+                variants.append(reply)
+            conn.execute(
+                "INSERT OR REPLACE INTO reply_cache (key, variants, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(variants), created, now),
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM reply_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM reply_cache WHERE key IN "
+                    "(SELECT key FROM reply_cache ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+            return max(excess, 0)
+
+
+class ReplyCache:
+    def __init__(self, backend, variants=REPLY_CACHE_VARIANTS):
+        self.backend = backend
+        self.variants = max(1, variants)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(mode_name, input_text):
+        return f"{mode_name}\x1f{normalize_input(input_text)}"
+
+    def get(self, mode_name, input_text):
+        # A key only counts as a hit once it has collected all its variants;
+        # until then the caller goes upstream and adds a fresh variant.
+        variants = self.backend.get(self.make_key(mode_name, input_text))
+        hit = variants is not None and len(variants) >= self.variants
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return random.choice(variants) if hit else None
+
+    def put(self, mode_name, input_text, reply):
+        evicted = self.backend.add_variant(self.make_key(mode_name, input_text), reply, self.variants)
+        with self._lock:
+            self.stores += 1
+            self.evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "variants": self.variants,
+            }
+
+
+def create_reply_cache(backend=REPLY_CACHE_BACKEND):
+    # Build the cache configured through the environment, or None when caching is off
+    if backend == "memory":
+        return ReplyCache(MemoryBackend())
+    if backend == "sqlite":
+        return ReplyCache(SQLiteBackend())
+    return None
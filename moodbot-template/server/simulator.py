@@ -0,0 +1,227 @@
+import argparse
+import time
+
+import numpy as np
+
+from commands import (
+    HUNT_COST,
+    FISHING_COST,
+    DAILY_REWARD,
+    BLACKJACK_WAGER,
+    HUNT_REWARDS,
+    FISHING_REWARDS,
+    FISHING_SAMPLER,
+    DICE_PREDICTION,
+    blackjack_result,
+    cards_from,
+    dice_reward,
+    die_rolls_from,
+)
+from blackjack import (
+    DEALER_STANDS_ON,
+    BlackjackHand,
+    add_cards,
+    score_hands,
+    calculate_blackjack_value,
+    dealer_outcome_table,
+    stand_ev_table,
+)
+from ledger import STARTING_COINS
+
+# Monte Carlo simulator for the MemeQuest economy. It reuses the live loot tables,
+# costs and payout rules from commands.py and draws whole batches of rounds with NumPy,
+# so millions of rounds per game take seconds. It reports the expected value, variance
+# and house edge of every game, and how the total coin supply of a simulated player
+# population moves over time.
+#
+#   python simulator.py --rounds 2000000 --players 10000 --days 30
+
+
+# ----------------- PER-GAME SAMPLERS -----------------
+# Each sampler returns the player's net coin change for `n` independent rounds,
+# together with the amount staked per round (used for the house edge).
+
+def simulate_hunt(rng, n):
+    rewards = HUNT_REWARDS[rng.integers(0, len(HUNT_REWARDS), n)]
+    return rewards - HUNT_COST, HUNT_COST
+
+
+def simulate_fish(rng, n):
+    rewards = FISHING_REWARDS[FISHING_SAMPLER.sample_indices(n, rng)]
+    return rewards - FISHING_COST, FISHING_COST
+
+
+def simulate_coin(rng, n, wager=10):
+    # The prediction doesn't matter for a fair coin; a win pays back twice the wager
+    wins = rng.integers(0, 2, n) == 1
+    return np.where(wins, wager * 2, 0) - wager, wager
+
+
+def simulate_dice(rng, n, bet="3>", wager=10):
+    # Same parsing as the !dice command; the payout of every possible roll comes from
+    # dice_reward, so the simulated odds follow DICE_OPERATORS and the live payouts
+    match = DICE_PREDICTION.match(bet)
+    target = int(match.group(1))
+    bet_operator = match.group(2) or "="
+    payouts = np.array([0] + [dice_reward(bet_operator, target, roll, wager) for roll in range(1, 7)])
+    rolls = np.asarray(die_rolls_from(rng.random(n)))
+    return payouts[rolls] - wager, wager
+
+
+def draw_cards(rng, n):
+    # One card for each of `n` hands, mapped from uniform doubles like the game's card stream
+    return np.asarray(cards_from(rng.random(n)))
+
+
+# Payout of a standing hand for every (player total, dealer total) pair, from the game's
+# blackjack_result. Standing totals are at most 21 and a dealer that draws below
+# DEALER_STANDS_ON ends on at most 16 + 11.
+BLACKJACK_PAYOUTS = np.array([[blackjack_result(player, dealer, BLACKJACK_WAGER)[1]
+                               for dealer in range(DEALER_STANDS_ON + 11)] for player in range(22)])
+
+
+def simulate_blackjack(rng, n, stand_on=17):
+    # The player hits until reaching `stand_on`, like the dealer does at DEALER_STANDS_ON
+    zeros = np.zeros(n, dtype=np.int64)
+    player, player_aces = add_cards(zeros, zeros, draw_cards(rng, n))
+    player, player_aces = add_cards(player, player_aces, draw_cards(rng, n))
+    dealer, dealer_aces = add_cards(zeros, zeros, draw_cards(rng, n))
+
+    hitting = player < stand_on
+    while hitting.any():
+        player, player_aces = add_cards(player, player_aces, np.where(hitting, draw_cards(rng, n), 0))
+        hitting &= player < stand_on
+
+    # A bust ends the game before the dealer plays
+    busted = player > 21
+    drawing = ~busted & (dealer < DEALER_STANDS_ON)
+    while drawing.any():
+        dealer, dealer_aces = add_cards(dealer, dealer_aces, np.where(drawing, draw_cards(rng, n), 0))
+        drawing &= dealer < DEALER_STANDS_ON
+
+    payout = np.where(busted, 0, BLACKJACK_PAYOUTS[np.minimum(player, 21), dealer])
+    return payout - BLACKJACK_WAGER, BLACKJACK_WAGER
+
+
+GAMES = {
+    "hunt": simulate_hunt,
+    "fish": simulate_fish,
+    "coin": simulate_coin,
+    "dice": simulate_dice,
+    "blackjack": simulate_blackjack,
+}
+
+
+def check_blackjack_scoring(rng, hands=2000):
+    # The vectorized totals, the batch scorer and the incremental hands used by the
+    # live game must all agree with the reference scoring function
+    cards = rng.integers(1, 12, (hands, 6))
+    zeros = np.zeros(hands, dtype=np.int64)
+    totals, aces = zeros, zeros
+    live_hands = [BlackjackHand() for _ in range(hands)]
+    for column in range(cards.shape[1]):
+        totals, aces = add_cards(totals, aces, cards[:, column])
+        batch = score_hands(cards[:, :column + 1])
+        for row in range(hands):
+            live_hands[row].add(int(cards[row, column]))
+            expected = calculate_blackjack_value(cards[row, :column + 1].tolist())
+            if not totals[row] == batch[row] == live_hands[row].total == expected:
+                raise AssertionError(
+                    f"scoring mismatch for {cards[row, :column + 1].tolist()}: "
+                    f"{totals[row]}/{batch[row]}/{live_hands[row].total} != {expected}"
+                )
+
+
+# ----------------- REPORTS -----------------
+
+def game_stats(net, stake):
+    ev = float(net.mean())
+    return {
+        "ev": ev,
+        "variance": float(net.var()),
+        "house_edge": -ev / stake,
+    }
+
+
+def run_game_report(rng, rounds, dice_bets):
+    rows = []
+    for name, simulate in GAMES.items():
+        if name == "dice":
+            for bet in dice_bets:
+                net, stake = simulate(rng, rounds, bet=bet)
+                rows.append((f"dice {bet}", game_stats(net, stake)))
+        else:
+            net, stake = simulate(rng, rounds)
+            rows.append((name, game_stats(net, stake)))
+    return rows
+
+
+def run_economy(rng, players, days, rounds_per_day, game_mix):
+    # Every player collects the daily reward, then plays `rounds_per_day` rounds of
+    # games picked from `game_mix`, skipping a round they can't afford.
+    # Returns the total coin supply at the end of each day.
+    names = list(game_mix)
+    weights = np.array([game_mix[name] for name in names], dtype=float)
+    weights /= weights.sum()
+    balances = np.full(players, STARTING_COINS, dtype=np.int64)
+    supply = [int(balances.sum())]
+    for _ in range(days):
+        balances += DAILY_REWARD
+        for _ in range(rounds_per_day):
+            picks = rng.choice(len(names), players, p=weights)
+            delta = np.zeros(players, dtype=np.int64)
+            for index, name in enumerate(names):
+                chosen = picks == index
+                count = int(chosen.sum())
+                if not count:
+                    continue
+                net, stake = GAMES[name](rng, count)
+                affordable = balances[chosen] >= stake
+                delta[chosen] = np.where(affordable, net, 0)
+            balances += delta
+        supply.append(int(balances.sum()))
+    return supply
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the MemeQuest game economy")
+    parser.add_argument("--rounds", type=int, default=2_000_000, help="rounds simulated per game")
+    parser.add_argument("--players", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rounds-per-day", type=int, default=20)
+    parser.add_argument("--dice-bets", default="3,1>,3>,5>,2<,4<,6<")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    check_blackjack_scoring(rng)
+
+    start = time.perf_counter()
+    rows = run_game_report(rng, args.rounds, args.dice_bets.split(","))
+    elapsed = time.perf_counter() - start
+    print(f"Per-game results over {args.rounds:,} rounds each ({elapsed:.1f}s)")
+    print(f"{'game':<14}{'EV/round':>12}{'variance':>14}{'house edge':>12}")
+    for name, stats in rows:
+        print(f"{name:<14}{stats['ev']:>12.3f}{stats['variance']:>14.1f}{stats['house_edge']:>11.2%}")
+
+    start = time.perf_counter()
+    dealer_table = dealer_outcome_table(rng, hands_per_upcard=max(args.rounds // 11, 1))
+    ev_table = stand_ev_table(dealer_table)
+    elapsed = time.perf_counter() - start
+    print(f"\nDealer results by upcard ({elapsed:.1f}s)")
+    print(f"{'upcard':<8}" + "".join(f"{total:>8}" for total in range(DEALER_STANDS_ON, 22)) + f"{'bust':>8}{'stand 17':>10}")
+    for upcard, outcomes in dealer_table.items():
+        cells = "".join(f"{outcomes[total]:>8.1%}" for total in range(DEALER_STANDS_ON, 22))
+        print(f"{upcard:<8}{cells}{outcomes['bust']:>8.1%}{ev_table[upcard][17]:>+10.3f}")
+
+    start = time.perf_counter()
+    mix = {"hunt": 1, "fish": 1, "coin": 1, "dice": 1, "blackjack": 1}
+    supply = run_economy(rng, args.players, args.days, args.rounds_per_day, mix)
+    elapsed = time.perf_counter() - start
+    print(f"\nCoin supply for {args.players:,} players over {args.days} days, "
+          f"{args.rounds_per_day} rounds/day ({elapsed:.1f}s)")
+    step = max(1, args.days // 10)
+    for day in range(0, args.days + 1, step):
+        print(f"day {day:>4}: {supply[day]:>16,} coins ({supply[day] / args.players:,.0f} per player)")
+    minted = (supply[-1] - supply[0]) / args.players / max(args.days, 1)
+    print(f"net coins created per player per day: {minted:,.1f} (daily reward alone: {DAILY_REWARD})")
@@ -12,12 +12,16 @@ const DynamicBackground = () => (
 );
 
 // Enhanced ChatBubble with typing animation
-const ChatBubble = ({ message, isUser }) => {
+// Streamed messages already arrive token by token, so they skip the fake typewriter
+const ChatBubble = ({ message, isUser, streamed = false, streaming = false }) => {
   const [typedText, setTypedText] = useState("");
   const [isDone, setIsDone] = useState(false);
 
   useEffect(() => {
-    if (!isUser) {
+    if (streamed) {
+      setTypedText(message);
+      setIsDone(!streaming);
+    } else if (!isUser) {
       let i = 0;
       const typing = setInterval(() => {
         if (i < message.length) {
@@ -33,7 +37,7 @@ const ChatBubble = ({ message, isUser }) => {
       setTypedText(message);
       setIsDone(true);
     }
-  }, [message, isUser]);
+  }, [message, isUser, streamed, streaming]);
 
   return (
     <motion.div
@@ -187,6 +191,16 @@ const Confetti = ({ visible }) => {
   );
 };
 
+// Stable per-browser player ID so the server can keep each player's balance
+const getUserId = () => {
+  let id = localStorage.getItem("moodbotUserId");
+  if (!id) {
+    id = `player-${Math.random().toString(36).slice(2, 10)}`;
+    localStorage.setItem("moodbotUserId", id);
+  }
+  return id;
+};
+
 const App = () => {
   const [selectedActivity, setSelectedActivity] = useState(
     "Welcome to MemeQuest!"
@@ -210,6 +224,7 @@ const App = () => {
     y: 0,
   });
 
+  const userId = useRef(getUserId()).current;
   const endOfMessagesRef = useRef(null);
   const inputRef = useRef(null);
 
@@ -268,17 +283,100 @@ const App = () => {
     }
   };
 
+  // Stream a chatbot reply from /chat/stream, appending tokens to the last bot bubble as they arrive
+  const streamReply = async () => {
+    const res = await fetch("http://localhost:5000/chat/stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ input, mode, user_id: userId }),
+    });
+    if (!res.ok || !res.body) throw new Error("Streaming failed");
+
+    const updateBotMessage = (update) =>
+      setChatLog((prev) => {
+        const last = prev[prev.length - 1];
+        return [...prev.slice(0, -1), { ...last, ...update(last) }];
+      });
+
+    setChatLog((prev) => [
+      ...prev,
+      { sender: "bot", text: "", streamed: true, streaming: true },
+    ]);
+    setIsLoading(false);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    try {
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const event of events) {
+          if (!event.startsWith("data: ")) continue;
+          const payload = JSON.parse(event.slice(6));
+          if (payload.delta) {
+            updateBotMessage((last) => ({ text: last.text + payload.delta }));
+          } else if (payload.error) {
+            updateBotMessage((last) => ({ text: last.text + payload.error }));
+          } else if (payload.done) {
+            if (payload.new_balance !== undefined) setMemeCash(payload.new_balance);
+          }
+        }
+      }
+    } catch (err) {
+      // The bubble is already on screen: end it with the error instead of adding a second one
+      updateBotMessage((last) => ({
+        text: last.text.trim() ? `${last.text.trim()}\n\nError connecting to server.` : "Error connecting to server.",
+        streaming: false,
+      }));
+      return;
+    }
+    updateBotMessage((last) => ({
+      text: last.text.trim() || "No response",
+      streaming: false,
+    }));
+  };
+
   const sendMessage = async () => {
     if (!input.trim()) return;
     const userMessage = { sender: "user", text: input };
     setChatLog((prev) => [...prev, userMessage]);
     setIsLoading(true);
 
+    // Plain chat goes through the streaming endpoint; game commands stay on /chat
+    if (!input.startsWith("!")) {
+      try {
+        await streamReply();
+      } catch (err) {
+        // The request failed before a reply bubble was added
+        setChatLog((prev) => [
+          ...prev,
+          { sender: "bot", text: "Error connecting to server." },
+        ]);
+      } finally {
+        setIsLoading(false);
+      }
+      setInput("");
+      setTimeout(() => {
+        inputRef.current?.focus();
+      }, 100);
+      return;
+    }
+
     try {
       const res = await fetch("http://localhost:5000/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ input, mode, coins: memeCash, wager }),
+        body: JSON.stringify({
+          input,
+          mode,
+          coins: memeCash,
+          wager,
+          user_id: userId,
+        }),
       });
 
       const data = await res.json();
@@ -795,6 +893,8 @@ const App = () => {
                     <ChatBubble
                       message={msg.text}
                       isUser={msg.sender === "user"}
+                      streamed={msg.streamed}
+                      streaming={msg.streaming}
                     />
                   </motion.div>
                 ))}